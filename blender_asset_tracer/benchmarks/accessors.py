@@ -0,0 +1,65 @@
+# ***** BEGIN GPL LICENSE BLOCK *****
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+# ***** END GPL LICENCE BLOCK *****
+"""Time of a single field read, the way expanders read datablocks.
+
+Run from the repository root::
+
+    python -m blender_asset_tracer.benchmarks.accessors
+"""
+
+import argparse
+import pathlib
+import tempfile
+import timeit
+
+from .. import blendfile
+from . import synthetic
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = pathlib.Path(tmpdir) / "accessors.blend"
+        synthetic.build(path, n_images=100, n_objects=100, libraries=["//lib.blend"])
+
+        for use_mmap in (True, False):
+            blendfile.BlendFile.use_mmap = use_mmap
+            with blendfile.BlendFile(path) as bfile:
+                image = bfile.find_blocks_from_code(b"IM")[6]
+                ob = bfile.find_blocks_from_code(b"OB")[6]
+                reads = [
+                    ("id.name", lambda: image[b"id", b"name"]),
+                    ("filepath", lambda: image[b"filepath"]),
+                    ("id.lib", lambda: image[b"id", b"lib"]),
+                    ("get_pointer", lambda: image.get_pointer((b"id", b"lib"))),
+                    ("loc", lambda: ob[b"loc"]),
+                ]
+                timings = [
+                    "%s %.2f µs"
+                    % (label, timeit.timeit(read, number=args.number) / args.number * 1e6)
+                    for label, read in reads
+                ]
+            print("%-4s: %s" % ("mmap" if use_mmap else "file", ", ".join(timings)))
+        blendfile.BlendFile.use_mmap = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# ***** BEGIN GPL LICENSE BLOCK *****
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+# ***** END GPL LICENCE BLOCK *****
+"""Disk writes and time of opening a big compressed blend file.
+
+Builds a synthetic scene of about ``--size-mb`` uncompressed megabytes, stores
+it with every compression, and opens each of them in a fresh process. Reports
+the time to open the file and read its images and objects, the bytes the
+process wrote to disk, and its peak RSS. Disk writes are only measured on
+Linux.
+
+Run from the repository root::
+
+    python -m blender_asset_tracer.benchmarks.decompression --size-mb 1024
+"""
+
+import argparse
+import pathlib
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+from .. import blendfile
+from . import synthetic
+
+COMPRESSIONS = ["gzip", "zstd", "zstd-seekable"]
+
+# Bytes of an image block and of an object block with its material array.
+IMAGE_BYTES = 24 + 1122
+OBJECT_BYTES = 24 + 98 + 24 + 24
+
+
+def _written_bytes() -> typing.Optional[int]:
+    try:
+        with open("/proc/self/io") as io_stats:
+            for line in io_stats:
+                if line.startswith("write_bytes:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def open_and_read(path: pathlib.Path) -> None:
+    """Open the file, read what tracing reads, and print the measurements."""
+    written_before = _written_bytes()
+    start = time.perf_counter()
+    with blendfile.BlendFile(path) as bfile:
+        open_duration = time.perf_counter() - start
+        for image in bfile.find_blocks_from_code(b"IM"):
+            image[b"filepath"]
+            image.get_pointer((b"id", b"lib"))
+        for ob in bfile.find_blocks_from_code(b"OB"):
+            list(ob.iter_array_of_pointers(b"mat", 3))
+        duration = time.perf_counter() - start
+    written_after = _written_bytes()
+
+    if written_before is None or written_after is None:
+        written = "n/a"
+    else:
+        written = "%.1f MB" % ((written_after - written_before) / 2**20)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        max_rss *= 1024
+    print(
+        "open %.2f s, open and read %.2f s, written to disk %s, peak RSS %.0f MB"
+        % (open_duration, duration, written, max_rss / 2**20)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--open", type=pathlib.Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.open is not None:
+        open_and_read(args.open)
+        return
+
+    # Mostly images, they are the big blocks in the synthetic files.
+    n_objects = args.size_mb * 100
+    n_images = (args.size_mb * 2**20 - n_objects * OBJECT_BYTES) // IMAGE_BYTES
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for compress in COMPRESSIONS:
+            path = pathlib.Path(tmpdir) / ("scene-%s.blend" % compress)
+            synthetic.build(path, n_images, n_objects, compress=compress)
+            print(
+                "%-13s (%.0f MB on disk): " % (compress, path.stat().st_size / 2**20),
+                end="",
+                flush=True,
+            )
+            subprocess.run(
+                [sys.executable, "-m", __spec__.name, "--open", str(path)],
+                check=True,
+            )
+            path.unlink()
+
+
+if __name__ == "__main__":
+    main()
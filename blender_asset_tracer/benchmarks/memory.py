@@ -0,0 +1,115 @@
+# ***** BEGIN GPL LICENSE BLOCK *****
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+# ***** END GPL LICENCE BLOCK *****
+"""Memory used by a trace that opens a shot and its libraries.
+
+Creates a synthetic shot that links many libraries, opens all of them through
+the blend file cache the way tracing dependencies does, reads the datablocks,
+and reports the peak RSS of the process. With ``--tracemalloc`` it also
+reports what Python allocated, which is slower but does not depend on the
+allocator.
+
+Run from the repository root::
+
+    python -m blender_asset_tracer.benchmarks.memory --libraries 30
+"""
+
+import argparse
+import pathlib
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .. import blendfile
+from . import synthetic
+
+
+def _max_rss_mb() -> float:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # macOS reports bytes, Linux kilobytes.
+        return max_rss / 2**20
+    return max_rss / 2**10
+
+
+def open_library_set(shot_path: pathlib.Path) -> int:
+    """Open the shot and its libraries, and read every datablock.
+
+    :returns: the number of blocks that were read.
+    """
+    shot = blendfile.open_cached(shot_path)
+    bfiles = [shot]
+    for lib in shot.find_blocks_from_code(b"LI"):
+        lib_path = shot_path.parent / lib[b"filepath"].decode().lstrip("/")
+        bfiles.append(blendfile.open_cached(lib_path))
+
+    num_blocks = 0
+    for bfile in bfiles:
+        for block in bfile.blocks:
+            block.dna_type
+            num_blocks += 1
+        for image in bfile.find_blocks_from_code(b"IM"):
+            image[b"filepath"]
+            image.get_pointer((b"id", b"lib"))
+    return num_blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--libraries", type=int, default=30)
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--objects", type=int, default=2000)
+    parser.add_argument("--compress", choices=["gzip", "zstd"], default=None)
+    parser.add_argument("--tracemalloc", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        shot_path = synthetic.build_library_set(
+            pathlib.Path(tmpdir),
+            args.libraries,
+            args.images,
+            args.objects,
+            compress=args.compress,
+        )
+        rss_before = _max_rss_mb()
+        if args.tracemalloc:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        num_blocks = open_library_set(shot_path)
+        duration = time.perf_counter() - start
+
+        print(
+            "%d files, %d blocks in %.2f s" % (args.libraries + 1, num_blocks, duration)
+        )
+        print(
+            "peak RSS %.1f MB, %.1f MB more than before opening"
+            % (_max_rss_mb(), _max_rss_mb() - rss_before)
+        )
+        if args.tracemalloc:
+            current, peak = tracemalloc.get_traced_memory()
+            print(
+                "Python allocations: %.1f MB retained, %.1f MB peak"
+                % (current / 2**20, peak / 2**20)
+            )
+        blendfile.close_all_cached()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# ***** BEGIN GPL LICENSE BLOCK *****
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+# ***** END GPL LICENCE BLOCK *****
+"""Synthetic blend files for the benchmarks.
+
+The files have a minimal DNA with ``ID``, ``Image``, ``Object`` and
+``Library`` structs, and are made of image and object datablocks the way a
+library with many textures looks. Blender is not needed to create them.
+"""
+
+import gzip
+import pathlib
+import random
+import re
+import struct
+import typing
+
+from ..blendfile import magic_compression
+
+ENDIAN = "<"
+POINTER_SIZE = 8
+
+# Uncompressed bytes per frame of seekable ZStandard files.
+ZSTD_FRAME_SIZE = 1024 * 1024
+
+TYPES = [
+    (b"char", 1),
+    (b"uchar", 1),
+    (b"short", 2),
+    (b"int", 4),
+    (b"float", 4),
+    (b"void", 0),
+    (b"ID", 0),
+    (b"Image", 0),
+    (b"Object", 0),
+    (b"Library", 0),
+]
+
+STRUCTS = [
+    (b"ID", [(b"void", b"*next"), (b"char", b"name[66]"), (b"Library", b"*lib")]),
+    (
+        b"Image",
+        [
+            (b"ID", b"id"),
+            (b"char", b"filepath[1024]"),
+            (b"void", b"*packedfile"),
+            (b"int", b"flag"),
+            (b"uchar", b"colors[4]"),
+        ],
+    ),
+    (
+        b"Object",
+        [(b"ID", b"id"), (b"float", b"loc[3]"), (b"void", b"**mat"), (b"short", b"totcol")],
+    ),
+    (b"Library", [(b"ID", b"id"), (b"char", b"filepath[1024]")]),
+]
+
+STRUCT_INDEX = {name: index for index, (name, _) in enumerate(STRUCTS)}
+
+
+def _pad4(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % 4)
+
+
+def _field_size(sizes: typing.Dict[bytes, int], dna_type: bytes, name: bytes) -> int:
+    count = 1
+    for dim in re.findall(rb"\[(\d+)\]", name):
+        count *= int(dim)
+    if b"*" in name:
+        return POINTER_SIZE * count
+    return sizes[dna_type] * count
+
+
+def _sdna() -> bytes:
+    names = []
+    for _, fields in STRUCTS:
+        names.extend(name for _, name in fields if name not in names)
+    name_index = {name: index for index, name in enumerate(names)}
+    type_index = {name: index for index, (name, _) in enumerate(TYPES)}
+
+    sizes = dict(TYPES)
+    for struct_name, fields in STRUCTS:
+        sizes[struct_name] = sum(_field_size(sizes, t, n) for t, n in fields)
+
+    sdna = b"SDNANAME" + struct.pack(ENDIAN + "i", len(names))
+    sdna += b"".join(name + b"\0" for name in names)
+    sdna = _pad4(sdna) + b"TYPE" + struct.pack(ENDIAN + "i", len(TYPES))
+    sdna += b"".join(name + b"\0" for name, _ in TYPES)
+    sdna = _pad4(sdna) + b"TLEN"
+    sdna += b"".join(struct.pack(ENDIAN + "H", sizes[name]) for name, _ in TYPES)
+    sdna = _pad4(sdna) + b"STRC" + struct.pack(ENDIAN + "i", len(STRUCTS))
+    for struct_name, fields in STRUCTS:
+        sdna += struct.pack(ENDIAN + "HH", type_index[struct_name], len(fields))
+        for dna_type, name in fields:
+            sdna += struct.pack(ENDIAN + "HH", type_index[dna_type], name_index[name])
+    return sdna
+
+
+def _id(name: bytes, lib_addr: int = 0) -> bytes:
+    return (
+        struct.pack(ENDIAN + "Q", 0)
+        + name.ljust(66, b"\0")
+        + struct.pack(ENDIAN + "Q", lib_addr)
+    )
+
+
+def _path(path: str) -> bytes:
+    return path.encode().ljust(1024, b"\0")
+
+
+def build(
+    path: pathlib.Path,
+    n_images: int = 2000,
+    n_objects: int = 2000,
+    libraries: typing.Sequence[str] = (),
+    compress: typing.Optional[str] = None,
+    seed: int = 1,
+) -> None:
+    """Write a synthetic blend file.
+
+    :param path: where the file is written.
+    :param n_images: number of image datablocks, each with its own texture path.
+    :param n_objects: number of objects, each with a material array of three
+        pointers, two of them to random images.
+    :param libraries: blendfile-relative paths of linked libraries. Every
+        third image is linked from the first of them.
+    :param compress: None, ``"gzip"``, ``"zstd"`` for a single ZStandard
+        frame, or ``"zstd-seekable"`` for independent frames with a seek
+        table, the way Blender writes them. ZStandard needs the optional
+        ``zstandard`` module.
+    :param seed: seed of the random material assignments.
+    """
+    out = bytearray(b"BLENDER-v300")
+
+    def block(code: bytes, sdna_index: int, addr: int, data: bytes, count: int = 1):
+        out.extend(struct.pack(ENDIAN + "4siQii", code, len(data), addr, sdna_index, count))
+        out.extend(data)
+
+    rng = random.Random(seed)
+    block(b"GLOB", 0, 0x10, b"\0" * 4 + struct.pack(ENDIAN + "h", 7) + b"\0" * 10)
+
+    addr = 0x100
+    lib_addrs = []
+    for index, lib_path in enumerate(libraries):
+        block(b"LI\0\0", STRUCT_INDEX[b"Library"], addr, _id(b"LIlib%d" % index) + _path(lib_path))
+        lib_addrs.append(addr)
+        addr += 16
+
+    addr = max(addr, 0x1000)
+    image_addrs = []
+    for index in range(n_images):
+        lib_addr = lib_addrs[0] if lib_addrs and index % 3 == 0 else 0
+        data = (
+            _id(b"IMimg%d" % index, lib_addr)
+            + _path("//textures/img%d.png" % index)
+            + struct.pack(ENDIAN + "Qi4B", 0, index, 1, 2, 3, 4)
+        )
+        block(b"IM\0\0", STRUCT_INDEX[b"Image"], addr, data)
+        image_addrs.append(addr)
+        addr += 16
+
+    for index in range(n_objects):
+        array_addr = addr + 8
+        data = _id(b"OBob%d" % index) + struct.pack(ENDIAN + "3fQh", index, 2.5, -1, array_addr, 3)
+        block(b"OB\0\0", STRUCT_INDEX[b"Object"], addr, data)
+        materials = [0, 0, 0]
+        if image_addrs:
+            materials = [rng.choice(image_addrs), 0, rng.choice(image_addrs)]
+        block(b"DATA", 0, array_addr, struct.pack(ENDIAN + "3Q", *materials), count=3)
+        addr += 16
+
+    block(b"DNA1", 0, 0, _sdna())
+    block(b"ENDB", 0, 0, b"")
+
+    path.write_bytes(compress_data(bytes(out), compress))
+
+
+def compress_data(data: bytes, compress: typing.Optional[str]) -> bytes:
+    """Compress blend file contents, see :func:`build` for the compressions."""
+    if compress is None:
+        return data
+    if compress == "gzip":
+        return gzip.compress(data)
+    if compress not in ("zstd", "zstd-seekable"):
+        raise ValueError("unknown compression %r" % compress)
+
+    import zstandard
+
+    compressor = zstandard.ZstdCompressor(level=3)
+    if compress == "zstd":
+        return compressor.compress(data)
+
+    frames = []
+    seek_table = bytearray()
+    for offset in range(0, len(data), ZSTD_FRAME_SIZE):
+        frame = compressor.compress(data[offset : offset + ZSTD_FRAME_SIZE])
+        frames.append(frame)
+        seek_table += struct.pack("<II", len(frame), min(ZSTD_FRAME_SIZE, len(data) - offset))
+    seek_table += struct.pack("<IBI", len(frames), 0, magic_compression.ZSTD_SEEKABLE_MAGIC)
+    skippable_header = struct.pack(
+        "<II", magic_compression.ZSTD_SEEK_TABLE_FRAME_MAGIC, len(seek_table)
+    )
+    return b"".join(frames) + skippable_header + bytes(seek_table)
+
+
+def build_library_set(
+    directory: pathlib.Path,
+    n_libraries: int,
+    n_images: int = 2000,
+    n_objects: int = 2000,
+    compress: typing.Optional[str] = None,
+) -> pathlib.Path:
+    """Write a shot file that links ``n_libraries`` library files.
+
+    :returns: the path of the shot file, the libraries are next to it.
+    """
+    lib_paths = []
+    for index in range(n_libraries):
+        lib_path = directory / ("lib%d.blend" % index)
+        build(lib_path, n_images, n_objects, compress=compress, seed=index)
+        lib_paths.append("//" + lib_path.name)
+    shot_path = directory / "shot.blend"
+    build(shot_path, n_images, n_objects, libraries=lib_paths, compress=compress)
+    return shot_path
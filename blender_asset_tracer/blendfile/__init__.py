@@ -21,10 +21,13 @@
 # (c) 2018, Blender Foundation - Sybren A. Stüvel
 
 import atexit
-import collections
+import dataclasses
 import functools
 import gzip
+import hashlib
+import io
 import logging
+import mmap
 import os
 import struct
 import pathlib
@@ -32,7 +35,8 @@ import shutil
 import tempfile
 import typing
 
-from . import exceptions, dna, header, magic_compression
+from . import exceptions, dna, dna_io, header, magic_compression
+from .block_index import AddrIndex, BlockIndex, BlockList, CodeIndex
 from .. import bpathlib
 
 log = logging.getLogger(__name__)
@@ -42,6 +46,13 @@ BFBList = typing.List["BlendFileBlock"]
 
 _cached_bfiles = {}  # type: typing.Dict[pathlib.Path, BlendFile]
 
+# Decoded DNA, shared between files that have the exact same DNA1 block. All
+# libraries saved by the same Blender version have the same DNA, so these are
+# decoded and kept in memory only once.
+_cached_dna = (
+    {}
+)  # type: typing.Dict[typing.Tuple[bytes, int, bytes], typing.Tuple[typing.List[dna.Struct], typing.Dict[bytes, int]]]
+
 
 def open_cached(
     path: pathlib.Path, mode="rb", assert_cached: typing.Optional[bool] = None
@@ -79,6 +90,7 @@ def close_all_cached() -> None:
     for bfile in list(_cached_bfiles.values()):
         bfile.close()
     _cached_bfiles.clear()
+    _cached_dna.clear()
 
 
 def _cache(path: pathlib.Path, bfile: "BlendFile"):
@@ -98,8 +110,10 @@ class BlendFile:
 
     :ivar filepath: which file this object represents.
     :ivar raw_filepath: which file is accessed; same as filepath for
-        uncompressed files, but a temporary file for compressed files.
+        uncompressed files and for compressed files that are decompressed in
+        memory, but a temporary file for other compressed files.
     :ivar fileobj: the file object that's being accessed.
+    :ivar data: the memory-mapped file when reading with use_mmap, or None.
     """
 
     log = log.getChild("BlendFile")
@@ -110,11 +124,19 @@ class BlendFile:
     Set to False to disable this exception, and to return None instead.
     """
 
+    use_mmap = True
+    """Memory-map files opened read-only, and decode blocks straight from memory.
+
+    This avoids a seek() and one or more read() calls for every field that is
+    read. Files opened for writing always go through the file object.
+    """
+
     def __init__(self, path: pathlib.Path, mode="rb") -> None:
         """Create a BlendFile instance for the blend file at the path.
 
         Opens the file for reading or writing pending on the access. Compressed
-        blend files are uncompressed to a temporary location before opening.
+        blend files are decompressed in memory when only reading, and to a
+        temporary location otherwise; see magic_compression.open().
 
         :param path: the file to open
         :param mode: see mode description of pathlib.Path.open()
@@ -123,17 +145,21 @@ class BlendFile:
         self.raw_filepath = path
         self._is_modified = False
         self.file_subversion = 0
+        self.data = None  # type: typing.Optional[mmap.mmap]
         self.fileobj = self._open_file(path, mode)
+        self._map_file(mode)
 
-        self.blocks = []  # type: BFBList
+        self.block_index = BlockIndex()
+        """Headers of the blocks of this file; see block_index.py."""
+        self._block_objects = []  # type: typing.List[typing.Optional[BlendFileBlock]]
+
+        self.blocks = BlockList(self.block_index, self.block_at)
         """BlendFileBlocks of this file, in disk order."""
 
-        self.code_index = collections.defaultdict(
-            list
-        )  # type: typing.Dict[bytes, BFBList]
+        self.code_index = CodeIndex(self.block_index, self.block_at)
         self.structs = []  # type: typing.List[dna.Struct]
         self.sdna_index_from_id = {}  # type: typing.Dict[bytes, int]
-        self.block_from_addr = {}  # type: typing.Dict[int, BlendFileBlock]
+        self.block_from_addr = AddrIndex(self.block_index, self.block_at)
 
         self.header = header.BlendFileHeader(self.fileobj, self.raw_filepath)
         self.block_header_struct, self.block_header_fields = self.header.create_block_header_struct()
@@ -150,34 +176,105 @@ class BlendFile:
             correct magic bytes.
         """
 
-        decompressed = magic_compression.open(path, mode, FILE_BUFFER_SIZE)
+        # Memory-mapped files are hardly read through the file object, so do
+        # not keep a big buffer around for every cached file.
+        if self.use_mmap and mode == "rb":
+            buffer_size = io.DEFAULT_BUFFER_SIZE
+        else:
+            buffer_size = FILE_BUFFER_SIZE
+        decompressed = magic_compression.open(path, mode, buffer_size)
 
         self.filepath = path
         self.is_compressed = decompressed.is_compressed
         self.raw_filepath = decompressed.path
+        self._decompressed_data = decompressed.data
+        self._closed = False
 
         return decompressed.fileobj
 
+    def _map_file(self, mode: str) -> None:
+        """Memory-map self.fileobj if possible, see BlendFile.use_mmap."""
+        self.data = None
+        if not self.use_mmap or mode != "rb":
+            return
+        if self._decompressed_data is not None:
+            # Decompressed into memory already.
+            self.data = self._decompressed_data
+            return
+        try:
+            fileno = self.fileobj.fileno()
+            self.data = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        except (io.UnsupportedOperation, OSError, ValueError) as ex:
+            # Not a real file, or an empty one; just read through the file object.
+            self.log.debug("Not memory-mapping %s: %s", self.raw_filepath, ex)
+
+    def read_at(self, offset: int, size: int) -> bytes:
+        """Read size bytes at the given offset from the start of the file."""
+        if self.data is not None:
+            return self.data[offset : offset + size]
+        self.fileobj.seek(offset, os.SEEK_SET)
+        return self.fileobj.read(size)
+
     def _load_blocks(self) -> None:
-        """Read the blend file to load its DNA structure to memory."""
+        """Read the blend file to load its DNA structure to memory.
+
+        Only the block headers are read, into self.block_index. The
+        BlendFileBlock objects are created by block_at() when needed.
+        """
+
+        self.structs = []
+        self.sdna_index_from_id = {}
 
-        self.structs.clear()
-        self.sdna_index_from_id.clear()
+        # Get some names in the local scope for faster access.
+        header_struct = self.block_header_struct
+        header_size = header_struct.size
+        field_names = [f.name for f in dataclasses.fields(self.block_header_fields)]
+        i_code = field_names.index("code")
+        i_len = field_names.index("len")
+        i_old = field_names.index("old")
+        i_sdna = field_names.index("SDNAnr")
+        i_nr = field_names.index("nr")
+        read_data0 = self.header.endian.read_data0
+        append = self.block_index.append
+        block_objects = self._block_objects
+        data = self.data
+
+        header_offset = self.fileobj.tell()
         while True:
-            block = BlendFileBlock(self)
-            if block.code == b"ENDB":
+            if data is not None:
+                # Decode straight from the memory-mapped file.
+                available = max(0, min(len(data) - header_offset, header_size))
+                if available == header_size:
+                    values = header_struct.unpack_from(data, header_offset)
+            else:
+                raw = self.read_at(header_offset, header_size)
+                available = len(raw)
+                if available == header_size:
+                    values = header_struct.unpack(raw)
+            if available != header_size:
+                self.log.warning(
+                    "Blend file %s seems to be truncated, "
+                    "expected %d bytes but could read only %d",
+                    self.filepath,
+                    header_size,
+                    available,
+                )
                 break
 
-            if block.code == b"DNA1":
-                self.decode_structs(block)
-            elif block.code == b"GLOB":
-                self.decode_glob(block)
-            else:
-                self.fileobj.seek(block.size, os.SEEK_CUR)
+            code = read_data0(values[i_code])
+            if code == b"ENDB":
+                break
+
+            file_offset = header_offset + header_size
+            size = values[i_len]
+            index = append(code, size, values[i_old], values[i_sdna], values[i_nr], file_offset)
+            block_objects.append(None)
 
-            self.blocks.append(block)
-            self.code_index[block.code].append(block)
-            self.block_from_addr[block.addr_old] = block
+            if code == b"DNA1":
+                self.decode_structs(self.block_at(index))
+            elif code == b"GLOB":
+                self.decode_glob(self.block_at(index))
+            header_offset = file_offset + size
 
         if not self.structs:
             raise exceptions.NoDNA1Block(
@@ -213,6 +310,7 @@ class BlendFile:
         shutil.copyfile(str(self.filepath), str(path))
 
         self.fileobj = self._open_file(path, mode=mode)
+        self._map_file(mode)
         _cache(path, self)
 
     @property
@@ -224,6 +322,27 @@ class BlendFile:
         self.log.debug("Marking %s as modified", self.raw_filepath)
         self._is_modified = True
 
+    def block_at(self, index: int) -> "BlendFileBlock":
+        """Return the block at this position in the file.
+
+        Blocks are created on first access, and the same object is returned
+        from then on, so changes like refine_type() stick.
+        """
+        block = self._block_objects[index]
+        if block is None:
+            block_index = self.block_index
+            block = BlendFileBlock(
+                self,
+                block_index.code(index),
+                block_index.sizes[index],
+                block_index.addrs[index],
+                block_index.sdna_indices[index],
+                block_index.counts[index],
+                block_index.file_offsets[index],
+            )
+            self._block_objects[index] = block
+        return block
+
     def find_blocks_from_code(self, code: bytes) -> typing.List["BlendFileBlock"]:
         assert isinstance(code, bytes)
         return self.code_index[code]
@@ -233,7 +352,7 @@ class BlendFile:
 
         Recompresses the blend file if it was compressed and changed.
         """
-        if not self.fileobj:
+        if self._closed:
             return
 
         if self._is_modified:
@@ -251,10 +370,15 @@ class BlendFile:
                     gzfile.write(data)
             log.debug("GZip-compression to %s finished", self.filepath)
 
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
         # Close the file object after recompressing, as it may be a temporary
         # file that'll disappear as soon as we close it.
         self.fileobj.close()
         self._is_modified = False
+        self._closed = True
 
         try:
             del _cached_bfiles[self.filepath]
@@ -278,11 +402,25 @@ class BlendFile:
         """
         DNACatalog is a catalog of all information in the DNA1 file-block
         """
+        data = self.read_at(block.file_offset, block.size)
+        cache_key = (
+            hashlib.sha1(data).digest(),
+            self.header.pointer_size,
+            self.header.endian_str,
+        )
+        try:
+            self.structs, self.sdna_index_from_id = _cached_dna[cache_key]
+        except KeyError:
+            pass
+        else:
+            self.log.debug("reusing DNA catalog")
+            return
+
         self.log.debug("building DNA catalog")
 
         # Get some names in the local scope for faster access.
-        structs = self.structs
-        sdna_index_from_id = self.sdna_index_from_id
+        structs = self.structs = []  # type: typing.List[dna.Struct]
+        sdna_index_from_id = self.sdna_index_from_id = {}  # type: typing.Dict[bytes, int]
         endian = self.header.endian
         shortstruct = endian.USHORT
         shortstruct2 = endian.USHORT2
@@ -292,7 +430,6 @@ class BlendFile:
         def pad_up_4(off: int) -> int:
             return (off + 3) & ~3
 
-        data = self.fileobj.read(block.size)
         types = []
         typenames = []
 
@@ -359,6 +496,8 @@ class BlendFile:
                 dna_struct.append_field(field)
                 dna_offset += dna_size
 
+        _cached_dna[cache_key] = structs, sdna_index_from_id
+
     def decode_glob(self, block: "BlendFileBlock") -> None:
         """Partially decode the GLOB block to get the file sub-version."""
         # Before this, the subversion didn't exist in 'FileGlobal'.
@@ -370,13 +509,9 @@ class BlendFile:
         # parse the fields.
 
         # The subversion is always the `short` at offset 4.
-        # block_data = io.BytesIO(block.raw_data())
         endian = self.header.endian
-        self.fileobj.seek(4, os.SEEK_CUR)  # Skip the next 4 bytes.
-        self.file_subversion = endian.read_short(self.fileobj)
-
-        # Skip to the next block.
-        self.fileobj.seek(block.file_offset + block.size, os.SEEK_SET)
+        data = self.read_at(block.file_offset + 4, endian.SSHORT.size)
+        self.file_subversion = endian.SSHORT.unpack(data)[0]
 
     def abspath(self, relpath: bpathlib.BlendPath) -> bpathlib.BlendPath:
         """Construct an absolute path from a blendfile-relative path."""
@@ -439,7 +574,6 @@ class BlendFileBlock:
         "sdna_index",
         "count",
         "file_offset",
-        "endian",
         "_id_name",
     )
 
@@ -453,45 +587,29 @@ class BlendFileBlock:
     sdna_index: int
     count: int
 
-    def __init__(self, bfile: BlendFile) -> None:
+    def __init__(
+        self,
+        bfile: BlendFile,
+        code: bytes,
+        size: int,
+        addr_old: int,
+        sdna_index: int,
+        count: int,
+        file_offset: int,
+    ) -> None:
         self.bfile = bfile
-
-        # Defaults; actual values are set by interpreting the block header.
-        self.code = b""
-        self.size = 0
-        self.addr_old = 0
-        self.sdna_index = 0
-        self.count = 0
-        self.file_offset = 0
+        self.code = code
+        self.size = size
+        self.addr_old = addr_old
+        self.sdna_index = sdna_index
+        self.count = count
+        self.file_offset = file_offset
         """Offset in bytes from start of file to beginning of the data block.
 
         Points to the data after the block header.
         """
-        self.endian = bfile.header.endian
         self._id_name = ...  # type: typing.Union[None, ellipsis, bytes]
 
-        header_struct = bfile.block_header_struct
-        data = bfile.fileobj.read(header_struct.size)
-        if len(data) != header_struct.size:
-            self.log.warning(
-                "Blend file %s seems to be truncated, "
-                "expected %d bytes but could read only %d",
-                bfile.filepath,
-                header_struct.size,
-                len(data),
-            )
-            self.code = b"ENDB"
-            return
-
-        blockheader = bfile.block_header_fields(*header_struct.unpack(data))
-        self.code = self.endian.read_data0(blockheader.code)
-        if self.code != b"ENDB":
-            self.size = blockheader.len
-            self.addr_old = blockheader.old
-            self.sdna_index = blockheader.SDNAnr
-            self.count = blockheader.nr
-            self.file_offset = bfile.fileobj.tell()
-
     def __repr__(self) -> str:
         return "<%s.%s (%s), size=%d at %s>" % (
             self.__class__.__name__,
@@ -525,6 +643,10 @@ class BlendFileBlock:
         """Data blocks are always True."""
         return True
 
+    @property
+    def endian(self) -> typing.Type[dna_io.EndianIO]:
+        return self.bfile.header.endian
+
     @property
     def dna_type(self) -> dna.Struct:
         return self.bfile.structs[self.sdna_index]
@@ -613,25 +735,35 @@ class BlendFileBlock:
         :param return_field: When True, returns tuple (dna.Field, value).
             Otherwise just returns the value.
         """
-        self.bfile.fileobj.seek(self.file_offset, os.SEEK_SET)
-
-        dna_struct = self.bfile.structs[self.sdna_index]
-        field, value = dna_struct.field_get(
-            self.bfile.header,
-            self.bfile.fileobj,
-            path,
-            default=default,
-            null_terminated=null_terminated,
-            as_str=as_str,
-        )
+        bfile = self.bfile
+        dna_struct = bfile.structs[self.sdna_index]
+        if bfile.data is not None:
+            field, value = dna_struct.field_get_from(
+                bfile.header,
+                bfile.data,
+                self.file_offset,
+                path,
+                default=default,
+                null_terminated=null_terminated,
+                as_str=as_str,
+            )
+        else:
+            bfile.fileobj.seek(self.file_offset, os.SEEK_SET)
+            field, value = dna_struct.field_get(
+                bfile.header,
+                bfile.fileobj,
+                path,
+                default=default,
+                null_terminated=null_terminated,
+                as_str=as_str,
+            )
         if return_field:
             return value, field
         return value
 
     def raw_data(self) -> bytes:
         """Read low-level raw data of this datablock."""
-        self.bfile.fileobj.seek(self.file_offset, os.SEEK_SET)
-        return self.bfile.fileobj.read(self.size)
+        return self.bfile.read_at(self.file_offset, self.size)
 
     def as_string(self) -> str:
         """Interpret the bytes of this datablock as null-terminated utf8 string."""
@@ -765,11 +897,11 @@ class BlendFileBlock:
 
         endian = self.bfile.header.endian
         ps = self.bfile.header.pointer_size
+        # One read for the whole array, instead of one per pointer.
+        data = self.bfile.read_at(file_offset, ps * array_size)
 
         for i in range(array_size):
-            fileobj = self.bfile.fileobj
-            fileobj.seek(file_offset + ps * i, os.SEEK_SET)
-            address = endian.read_pointer(fileobj, ps)
+            address = endian.unpack_pointer(data, ps * i, ps)
             if address == 0:
                 continue
             dereferenced = self.bfile.dereference_pointer(address)
@@ -796,14 +928,13 @@ class BlendFileBlock:
         dna_struct = self.dna_type
         ps = self.bfile.header.pointer_size
         endian = self.bfile.header.endian
-        fileobj = self.bfile.fileobj
 
         field, offset_in_struct = dna_struct.field_from_path(ps, path)
         array_size = field.size // ps
+        data = self.bfile.read_at(self.file_offset + offset_in_struct, ps * array_size)
 
         for i in range(array_size):
-            fileobj.seek(self.file_offset + offset_in_struct + ps * i, os.SEEK_SET)
-            address = endian.read_pointer(fileobj, ps)
+            address = endian.unpack_pointer(data, ps * i, ps)
             if not address:
                 # Fixed-size arrays contain 0-pointers.
                 continue
@@ -0,0 +1,185 @@
+# ***** BEGIN GPL LICENSE BLOCK *****
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+# ***** END GPL LICENCE BLOCK *****
+"""Compact index of the block headers of a blend file.
+
+Production files contain hundreds of thousands of blocks, most of them DATA
+blocks that are never looked at. Instead of one BlendFileBlock per block, the
+headers are stored column-wise in arrays, and the blocks are only created when
+they are asked for.
+"""
+
+import array
+import bisect
+import collections.abc
+import typing
+
+if typing.TYPE_CHECKING:
+    from . import BlendFileBlock  # noqa: F401
+
+BlockFactory = typing.Callable[[int], "BlendFileBlock"]
+
+
+class BlockIndex:
+    """Block headers in disk order, one array per header field.
+
+    A block is identified by its position in the file, which is also its
+    position in each of the arrays.
+    """
+
+    def __init__(self) -> None:
+        self.codes = array.array("H")  # index into self.code_values
+        self.code_values = []  # type: typing.List[bytes]
+        self._code_numbers = {}  # type: typing.Dict[bytes, int]
+        self.sizes = array.array("q")
+        self.addrs = array.array("Q")
+        self.sdna_indices = array.array("i")
+        self.counts = array.array("q")
+        self.file_offsets = array.array("q")
+
+        self.by_code = {}  # type: typing.Dict[bytes, array.array]
+
+        # Addresses in sorted order, and the block index of each. Built on the
+        # first lookup by address.
+        self._sorted_addrs = None  # type: typing.Optional[array.array]
+        self._sorted_addr_indices = None  # type: typing.Optional[array.array]
+
+    def __len__(self) -> int:
+        return len(self.file_offsets)
+
+    def append(
+        self,
+        code: bytes,
+        size: int,
+        addr_old: int,
+        sdna_index: int,
+        count: int,
+        file_offset: int,
+    ) -> int:
+        """Add a block header, and return the index of the block."""
+        try:
+            code_number = self._code_numbers[code]
+        except KeyError:
+            code_number = len(self.code_values)
+            self._code_numbers[code] = code_number
+            self.code_values.append(code)
+            self.by_code[code] = array.array("I")
+
+        index = len(self.file_offsets)
+        self.codes.append(code_number)
+        self.sizes.append(size)
+        self.addrs.append(addr_old)
+        self.sdna_indices.append(sdna_index)
+        self.counts.append(count)
+        self.file_offsets.append(file_offset)
+        self.by_code[code].append(index)
+        self._sorted_addrs = None
+        return index
+
+    def code(self, index: int) -> bytes:
+        return self.code_values[self.codes[index]]
+
+    def index_from_addr(self, addr: int) -> typing.Optional[int]:
+        """Return the index of the block with this address, or None.
+
+        When several blocks share an address, the last one in the file wins.
+        """
+        if self._sorted_addrs is None:
+            self._sort_addrs()
+        sorted_addrs = self._sorted_addrs
+        pos = bisect.bisect_right(sorted_addrs, addr) - 1
+        if pos < 0 or sorted_addrs[pos] != addr:
+            return None
+        return self._sorted_addr_indices[pos]
+
+    def _sort_addrs(self) -> None:
+        # sorted() is stable, so of equal addresses the last block ends up last.
+        order = sorted(range(len(self.addrs)), key=self.addrs.__getitem__)
+        self._sorted_addr_indices = array.array("I", order)
+        self._sorted_addrs = array.array("Q", (self.addrs[i] for i in order))
+
+
+class BlockList(collections.abc.Sequence):
+    """Read-only list of the blocks of a file, in disk order."""
+
+    def __init__(self, index: BlockIndex, block_at: BlockFactory) -> None:
+        self._index = index
+        self._block_at = block_at
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._block_at(i) for i in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("block index out of range")
+        return self._block_at(item)
+
+    def __iter__(self) -> typing.Iterator["BlendFileBlock"]:
+        block_at = self._block_at
+        for i in range(len(self)):
+            yield block_at(i)
+
+
+class CodeIndex(collections.abc.Mapping):
+    """Mapping from block code to the list of blocks with that code.
+
+    Like the defaultdict it replaces, unknown codes map to an empty list.
+    """
+
+    def __init__(self, index: BlockIndex, block_at: BlockFactory) -> None:
+        self._index = index
+        self._block_at = block_at
+
+    def __getitem__(self, code: bytes) -> typing.List["BlendFileBlock"]:
+        block_at = self._block_at
+        return [block_at(i) for i in self._index.by_code.get(code, ())]
+
+    def __contains__(self, code: object) -> bool:
+        return code in self._index.by_code
+
+    def __iter__(self) -> typing.Iterator[bytes]:
+        return iter(self._index.by_code)
+
+    def __len__(self) -> int:
+        return len(self._index.by_code)
+
+
+class AddrIndex(collections.abc.Mapping):
+    """Mapping from old memory address to the block at that address."""
+
+    def __init__(self, index: BlockIndex, block_at: BlockFactory) -> None:
+        self._index = index
+        self._block_at = block_at
+
+    def __getitem__(self, addr: int) -> "BlendFileBlock":
+        index = self._index.index_from_addr(addr)
+        if index is None:
+            raise KeyError(addr)
+        return self._block_at(index)
+
+    def __contains__(self, addr: object) -> bool:
+        return self._index.index_from_addr(addr) is not None  # type: ignore
+
+    def __iter__(self) -> typing.Iterator[int]:
+        return iter(dict.fromkeys(self._index.addrs))
+
+    def __len__(self) -> int:
+        return len(set(self._index.addrs))
@@ -21,6 +21,7 @@
 # (c) 2018, Blender Foundation - Sybren A. Stüvel
 import logging
 import os
+import struct
 import typing
 from typing import Optional
 
@@ -35,6 +36,14 @@ log = logging.getLogger(__name__)
 class Name:
     """dna.Name is a C-type name stored in the DNA as bytes."""
 
+    __slots__ = (
+        "name_full",
+        "name_only",
+        "is_pointer",
+        "is_method_pointer",
+        "array_size",
+    )
+
     def __init__(self, name_full: bytes) -> None:
         self.name_full = name_full
         self.name_only = self.calc_name_only()
@@ -90,6 +99,8 @@ class Field:
     :ivar offset: cached offset of the field, in bytes.
     """
 
+    __slots__ = ("dna_type", "name", "size", "offset")
+
     def __init__(self, dna_type: "Struct", name: Name, size: int, offset: int) -> None:
         self.dna_type = dna_type
         self.name = name
@@ -100,9 +111,62 @@ class Field:
         return "<%r %r (%s)>" % (type(self).__qualname__, self.name, self.dna_type)
 
 
+class FieldAccessor(typing.NamedTuple):
+    """Compiled reader for one field of a dna.Struct, see Struct.accessor().
+
+    :ivar field: the field that is read.
+    :ivar offset: offset of the value relative to the start of the struct.
+    :ivar size: number of bytes to read for the value.
+    :ivar unpack: function (data, position) -> value that decodes the value.
+    """
+
+    field: Field
+    offset: int
+    size: int
+    unpack: typing.Callable[[typing.Any, int], typing.Any]
+
+
+def _unpack_one(typestruct: struct.Struct) -> typing.Callable[[typing.Any, int], typing.Any]:
+    unpack_from = typestruct.unpack_from
+
+    def unpack(data, position: int):
+        return unpack_from(data, position)[0]
+
+    return unpack
+
+
+def _unpack_list(typestruct: struct.Struct) -> typing.Callable[[typing.Any, int], typing.Any]:
+    unpack_from = typestruct.unpack_from
+
+    def unpack(data, position: int):
+        return list(unpack_from(data, position))
+
+    return unpack
+
+
+def _unpack_chars(
+    length: int, null_terminated: bool, as_str: bool
+) -> typing.Callable[[typing.Any, int], typing.Any]:
+    def unpack(data, position: int):
+        value = bytes(data[position : position + length])
+        if null_terminated:
+            end = value.find(b"\0")
+            if end >= 0:
+                value = value[:end]
+        if as_str:
+            return value.decode("utf8")
+        return value
+
+    return unpack
+
+
 class Struct:
     """dna.Struct is a C-type structure stored in the DNA."""
 
+    # Structs are shared by all blend files with the same DNA, but every file
+    # still has hundreds of them, each with a Field and Name per member.
+    __slots__ = ("dna_type_id", "_size", "_fields", "_fields_by_name", "_accessors")
+
     log = log.getChild("Struct")
 
     def __init__(self, dna_type_id: bytes, size: Optional[int] = None) -> None:
@@ -116,6 +180,7 @@ class Struct:
         self._size = size
         self._fields = []  # type: typing.List[Field]
         self._fields_by_name = {}  # type: typing.Dict[bytes, Field]
+        self._accessors = {}  # type: typing.Dict[tuple, typing.Optional[FieldAccessor]]
 
     def __repr__(self):
         return "%s(%r)" % (type(self).__qualname__, self.dna_type_id)
@@ -233,14 +298,82 @@ class Struct:
         :returns: The field instance and the value. If a default value was passed
             and the field was not found, (None, default) is returned.
         """
+        accessor = self.accessor(file_header, path, null_terminated, as_str)
+        if accessor is None:
+            return self._field_missing(file_header, path, default)
+
+        fileobj.seek(accessor.offset, os.SEEK_CUR)
+        data = fileobj.read(accessor.size)
+        return accessor.field, accessor.unpack(data, 0)
+
+    def field_get_from(
+        self,
+        file_header: header.BlendFileHeader,
+        data: typing.Any,
+        struct_offset: int,
+        path: FieldPath,
+        default=...,
+        null_terminated=True,
+        as_str=True,
+    ) -> typing.Tuple[typing.Optional[Field], typing.Any]:
+        """Read the value of the field from an in-memory buffer.
+
+        Same as field_get(), but reads from `data` (bytes or a memory-mapped
+        file) at `struct_offset` instead of from a file object, so no seeks
+        or reads are needed.
+        """
+        accessor = self.accessor(file_header, path, null_terminated, as_str)
+        if accessor is None:
+            return self._field_missing(file_header, path, default)
+        return accessor.field, accessor.unpack(data, struct_offset + accessor.offset)
+
+    def _field_missing(
+        self, file_header: header.BlendFileHeader, path: FieldPath, default
+    ) -> typing.Tuple[None, typing.Any]:
+        if default is ...:
+            # Let field_from_path() raise the KeyError with a helpful message.
+            self.field_from_path(file_header.pointer_size, path)
+        return None, default
+
+    def accessor(
+        self,
+        file_header: header.BlendFileHeader,
+        path: FieldPath,
+        null_terminated=True,
+        as_str=True,
+    ) -> typing.Optional["FieldAccessor"]:
+        """Return the compiled accessor for the field, or None if it does not exist.
+
+        Accessors are compiled once per path and file layout, and cached on
+        the struct, so repeated reads of the same field only unpack the value.
+
+        :raises exceptions.NoReaderImplemented: when the field is not of a
+            simple type.
+        """
+        key = (path, file_header.pointer_size, file_header.endian, null_terminated, as_str)
         try:
-            field, offset = self.field_from_path(file_header.pointer_size, path)
+            return self._accessors[key]
         except KeyError:
-            if default is ...:
-                raise
-            return None, default
+            pass
+        except TypeError:
+            # Unhashable path, like a list; compile it every time.
+            return self._compile_accessor(file_header, path, null_terminated, as_str)
 
-        fileobj.seek(offset, os.SEEK_CUR)
+        accessor = self._compile_accessor(file_header, path, null_terminated, as_str)
+        self._accessors[key] = accessor
+        return accessor
+
+    def _compile_accessor(
+        self,
+        file_header: header.BlendFileHeader,
+        path: FieldPath,
+        null_terminated: typing.Optional[bool],
+        as_str: bool,
+    ) -> typing.Optional["FieldAccessor"]:
+        try:
+            field, offset = self.field_from_path(file_header.pointer_size, path)
+        except KeyError:
+            return None
 
         dna_type = field.dna_type
         dna_name = field.name
@@ -248,22 +381,32 @@ class Struct:
 
         # Some special cases (pointers, strings/bytes)
         if dna_name.is_pointer:
-            return field, endian.read_pointer(fileobj, file_header.pointer_size)
+            if file_header.pointer_size == 4:
+                typestruct = endian.UINT
+            elif file_header.pointer_size == 8:
+                typestruct = endian.ULONG
+            else:
+                raise ValueError("unsupported pointer size %d" % file_header.pointer_size)
+            return FieldAccessor(field, offset, typestruct.size, _unpack_one(typestruct))
+
         if dna_type.dna_type_id == b"char":
-            return field, self._field_get_char(
-                file_header, fileobj, field, null_terminated, as_str
+            if field.size == 1:
+                # Single char, assume it's bitflag or int value, and not a string/bytes data...
+                return FieldAccessor(field, offset, 1, _unpack_one(endian.UCHAR))
+            length = dna_name.array_size
+            return FieldAccessor(
+                field,
+                offset,
+                length,
+                _unpack_chars(
+                    length,
+                    bool(null_terminated or (null_terminated is None and as_str)),
+                    as_str,
+                ),
             )
 
-        simple_readers = {
-            b"uchar": endian.read_char,
-            b"int": endian.read_int,
-            b"short": endian.read_short,
-            b"uint64_t": endian.read_ulong,
-            b"float": endian.read_float,
-            b"int8_t": endian.read_int8,
-        }
         try:
-            simple_reader = simple_readers[dna_type.dna_type_id]
+            typestruct = endian.simple_types()[dna_type.dna_type_id]
         except KeyError:
             raise exceptions.NoReaderImplemented(
                 "%r exists but not simple type (%r), can't resolve field %r"
@@ -273,38 +416,20 @@ class Struct:
             ) from None
 
         if isinstance(path, tuple) and len(path) > 1 and isinstance(path[-1], int):
-            # The caller wants to get a single item from an array. The offset we seeked to already
-            # points to this item. In this case we do not want to look at dna_name.array_size,
-            # because we want a single item from that array.
-            return field, simple_reader(fileobj)
+            # The caller wants to get a single item from an array. The offset
+            # already points to this item. In this case we do not want to look
+            # at dna_name.array_size, because we want a single item from that
+            # array.
+            return FieldAccessor(field, offset, typestruct.size, _unpack_one(typestruct))
 
         if dna_name.array_size > 1:
-            return field, [simple_reader(fileobj) for _ in range(dna_name.array_size)]
-        return field, simple_reader(fileobj)
-
-    def _field_get_char(
-        self,
-        file_header: header.BlendFileHeader,
-        fileobj: typing.IO[bytes],
-        field: "Field",
-        null_terminated: typing.Optional[bool],
-        as_str: bool,
-    ) -> typing.Any:
-        dna_name = field.name
-        endian = file_header.endian
-
-        if field.size == 1:
-            # Single char, assume it's bitflag or int value, and not a string/bytes data...
-            return endian.read_char(fileobj)
-
-        if null_terminated or (null_terminated is None and as_str):
-            data = endian.read_bytes0(fileobj, dna_name.array_size)
-        else:
-            data = fileobj.read(dna_name.array_size)
-
-        if as_str:
-            return data.decode("utf8")
-        return data
+            # One unpack for the whole array.
+            array_struct = struct.Struct(
+                "%s%d%s"
+                % (typestruct.format[0], dna_name.array_size, typestruct.format[1:])
+            )
+            return FieldAccessor(field, offset, array_struct.size, _unpack_list(array_struct))
+        return FieldAccessor(field, offset, typestruct.size, _unpack_one(typestruct))
 
     def field_set(
         self,
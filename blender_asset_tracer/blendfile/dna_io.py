@@ -129,6 +129,16 @@ class EndianIO:
             return cls.read_ulong(fileobj)
         raise ValueError("unsupported pointer size %d" % pointer_size)
 
+    @classmethod
+    def unpack_pointer(cls, data: typing.Any, offset: int, pointer_size: int):
+        """Read a pointer from a buffer, without copying it first."""
+
+        if pointer_size == 4:
+            return cls.UINT.unpack_from(data, offset)[0]
+        if pointer_size == 8:
+            return cls.ULONG.unpack_from(data, offset)[0]
+        raise ValueError("unsupported pointer size %d" % pointer_size)
+
     @classmethod
     def parse_pointer(cls, pointer_data: bytes):
         """Parse bytes as a pointer value."""
@@ -220,6 +230,21 @@ class EndianIO:
             return data
         return data[:add]
 
+    @classmethod
+    def simple_types(cls):
+        """Return a mapping from type name to the struct.Struct to read it with.
+
+        These are the types that can be read without knowing their DNA struct.
+        """
+        return {
+            b"uchar": cls.UCHAR,
+            b"int": cls.SINT,
+            b"short": cls.SSHORT,
+            b"uint64_t": cls.ULONG,
+            b"float": cls.FLOAT,
+            b"int8_t": cls.SINT8,
+        }
+
     @classmethod
     def accepted_types(cls):
         """Return a mapping from type name to writer function.
@@ -18,14 +18,19 @@
 #
 # (c) 2021, Blender Foundation
 
+import bisect
 import collections
 import enum
 import gzip
+import io
 import logging
+import mmap
 import os
 import pathlib
+import struct
 import tempfile
 import typing
+import weakref
 
 # Blender 3.0 replaces GZip with ZStandard compression.
 # Since this is not a standard library package, be careful importing it and
@@ -50,17 +55,48 @@ ZSTD_MAGIC = b"\x28\xB5\x2F\xFD"
 ZSTD_MAGIC_SKIPPABLE = b"\x50\x2A\x4D\x18"
 ZSTD_MAGIC_SKIPPABLE_MASK = b"\xF0\xFF\xFF\xFF"
 
+# Seek table at the end of seekable ZStandard files, as written by Blender. See
+# https://github.com/facebook/zstd/blob/dev/contrib/seekable_format/zstd_seekable_compression_format.md
+ZSTD_SEEKABLE_MAGIC = 0x8F92EAB1
+ZSTD_SEEK_TABLE_FRAME_MAGIC = 0x184D2A5E
+ZSTD_SEEK_TABLE_FOOTER = struct.Struct("<IBI")
+ZSTD_SEEK_TABLE_CHECKSUM_FLAG = 0x80
+
+# Read at least this much at a time when decompressing, also when the caller
+# asks for a small file buffer.
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+# Read-only files up to this size are decompressed into memory. Bigger seekable
+# ZStandard files are decompressed frame by frame when read, other big files
+# are decompressed into a temporary file.
+MAX_IN_MEMORY_SIZE = 512 * 1024 * 1024
+
+# Cached files stay open for the whole trace, so all files decompressed into
+# memory together are limited as well. Files that do not fit anymore are read
+# like files bigger than MAX_IN_MEMORY_SIZE.
+MAX_IN_MEMORY_TOTAL_SIZE = 1024 * 1024 * 1024
+
+# Bytes of decompressed frames kept around when reading seekable ZStandard files.
+FRAME_CACHE_SIZE = 64 * 1024 * 1024
+
 log = logging.getLogger(__name__)
 
+# Memory maps of the files that were decompressed into memory; closed maps do
+# not count, and maps that are garbage collected drop out by themselves.
+_in_memory_maps = weakref.WeakSet()  # type: weakref.WeakSet[mmap.mmap]
+
 
 # @dataclasses.dataclass
 DecompressedFileInfo = collections.namedtuple(
-    "DecompressedFileInfo", "is_compressed path fileobj"
+    "DecompressedFileInfo", "is_compressed path fileobj data", defaults=(None,)
 )
 # is_compressed: bool
 # path: pathlib.Path
-# """The path of the decompressed file, or the input path if the file is not compressed."""
+# """The path of the decompressed file, or the input path if the file is not
+# compressed or decompressed in memory."""
 # fileobj: BinaryIO
+# data: typing.Optional[mmap.mmap]
+# """The decompressed file, when it was decompressed into memory."""
 
 
 class Compression(enum.Enum):
@@ -71,7 +107,11 @@ class Compression(enum.Enum):
 
 
 def open(path: pathlib.Path, mode: str, buffer_size: int) -> DecompressedFileInfo:
-    """Open the file, decompressing it into a temporary file if necesssary."""
+    """Open the file, decompressing it if necesssary.
+
+    Files opened for reading only are decompressed into memory when possible,
+    see _open_in_memory(). Other files are decompressed into a temporary file.
+    """
     fileobj = path.open(mode, buffering=buffer_size)  # typing.IO[bytes]
     compression = find_compression_type(fileobj)
 
@@ -88,6 +128,11 @@ def open(path: pathlib.Path, mode: str, buffer_size: int) -> DecompressedFileInf
 
     log.debug("%s-compressed blendfile detected: %s", compression.name, path)
 
+    if mode == "rb":
+        decompressed = _open_in_memory(path, fileobj, compression, buffer_size)
+        if decompressed is not None:
+            return decompressed
+
     # Decompress to a temporary file.
     tmpfile = tempfile.NamedTemporaryFile()
     fileobj.seek(0, os.SEEK_SET)
@@ -102,7 +147,7 @@ def open(path: pathlib.Path, mode: str, buffer_size: int) -> DecompressedFileInf
         data = magic
         while data:
             tmpfile.write(data)
-            data = compressed_file.read(buffer_size)
+            data = compressed_file.read(max(buffer_size, DECOMPRESS_CHUNK_SIZE))
 
     # Further interaction should be done with the uncompressed file.
     fileobj.close()
@@ -113,6 +158,245 @@ def open(path: pathlib.Path, mode: str, buffer_size: int) -> DecompressedFileInf
     )
 
 
+def _open_in_memory(
+    path: pathlib.Path,
+    fileobj: typing.IO[bytes],
+    compression: Compression,
+    buffer_size: int,
+) -> typing.Optional[DecompressedFileInfo]:
+    """Decompress without writing to disk, or return None if that's not possible.
+
+    Seekable ZStandard files bigger than MAX_IN_MEMORY_SIZE, or than what is
+    left of MAX_IN_MEMORY_TOTAL_SIZE, are read through a ZstdSeekableReader,
+    which only decompresses the frames that are read. Other files are
+    decompressed into an anonymous memory map when their decompressed size is
+    known and fits in both limits.
+    """
+    max_size = min(MAX_IN_MEMORY_SIZE, _in_memory_size_left())
+
+    if compression == Compression.ZSTD and has_zstandard:
+        frames = _read_zstd_seek_table(fileobj)
+        if frames is not None:
+            reader = ZstdSeekableReader(fileobj, frames)
+            if reader.size > max_size:
+                if reader.read(len(BLENDFILE_MAGIC)) != BLENDFILE_MAGIC:
+                    reader.close()
+                    raise exceptions.BlendFileError("Compressed file is not a blend file", path)
+                log.debug("reading %s frame by frame", path)
+                return DecompressedFileInfo(
+                    is_compressed=True,
+                    path=path,
+                    fileobj=io.BufferedReader(reader, buffer_size),
+                )
+            data = reader.decompress_all()
+            return _in_memory_file_info(path, data)
+
+    size = _decompressed_size(fileobj, compression)
+    if size is None or size > max_size:
+        return None
+
+    data = mmap.mmap(-1, size)
+    fileobj.seek(0, os.SEEK_SET)
+    with _decompressor(fileobj, "rb", compression) as compressed_file:
+        position = 0
+        while position < size:
+            with memoryview(data)[position : position + DECOMPRESS_CHUNK_SIZE] as chunk:
+                read = compressed_file.readinto(chunk)
+            if not read:
+                break
+            position += read
+        is_complete = position == size and not compressed_file.read(1)
+
+    if not is_complete:
+        # The size in the file was not the real size, for example because the
+        # file is bigger than 4 GB or consists of several gzip members.
+        log.debug("decompressed size of %s is not %d, using a temporary file", path, size)
+        data.close()
+        fileobj.seek(0, os.SEEK_SET)
+        return None
+    fileobj.close()
+    return _in_memory_file_info(path, data)
+
+
+def _in_memory_file_info(path: pathlib.Path, data: mmap.mmap) -> DecompressedFileInfo:
+    if data[: len(BLENDFILE_MAGIC)] != BLENDFILE_MAGIC:
+        data.close()
+        raise exceptions.BlendFileError("Compressed file is not a blend file", path)
+    log.debug("decompressed %s into memory", path)
+    _in_memory_maps.add(data)
+    # The memory map is a file object as well, for code that reads the file
+    # object directly.
+    return DecompressedFileInfo(is_compressed=True, path=path, fileobj=data, data=data)
+
+
+def _in_memory_size_left() -> int:
+    """Return how many bytes can still be decompressed into memory."""
+    in_use = sum(len(data) for data in _in_memory_maps if not data.closed)
+    return MAX_IN_MEMORY_TOTAL_SIZE - in_use
+
+
+def _decompressed_size(fileobj: typing.IO[bytes], compression: Compression) -> typing.Optional[int]:
+    """Return the decompressed size as stored in the file, or None if unknown."""
+    if compression == Compression.GZIP:
+        # The last 4 bytes are the size modulo 4 GB.
+        fileobj.seek(-4, os.SEEK_END)
+        return struct.unpack("<I", fileobj.read(4))[0] or None
+
+    if compression == Compression.ZSTD and has_zstandard:
+        # Only the size of the first frame; a file with more frames is bigger,
+        # which is detected while decompressing.
+        fileobj.seek(0, os.SEEK_SET)
+        try:
+            size = zstandard.frame_content_size(fileobj.read(18))
+        except zstandard.ZstdError:
+            return None
+        return size if size > 0 else None
+
+    return None
+
+
+def _read_zstd_seek_table(
+    fileobj: typing.IO[bytes],
+) -> typing.Optional[typing.List[typing.Tuple[int, int]]]:
+    """Return (compressed size, decompressed size) of each frame, or None.
+
+    None is returned when the file has no seek table.
+    """
+    file_size = fileobj.seek(0, os.SEEK_END)
+    if file_size < ZSTD_SEEK_TABLE_FOOTER.size + 8:
+        return None
+    fileobj.seek(-ZSTD_SEEK_TABLE_FOOTER.size, os.SEEK_END)
+    frame_count, descriptor, magic = ZSTD_SEEK_TABLE_FOOTER.unpack(fileobj.read(ZSTD_SEEK_TABLE_FOOTER.size))
+    if magic != ZSTD_SEEKABLE_MAGIC:
+        return None
+
+    entry_size = 12 if descriptor & ZSTD_SEEK_TABLE_CHECKSUM_FLAG else 8
+    table_size = frame_count * entry_size + ZSTD_SEEK_TABLE_FOOTER.size
+    if table_size + 8 > file_size:
+        return None
+    fileobj.seek(-table_size - 8, os.SEEK_END)
+    frame_magic, frame_size = struct.unpack("<II", fileobj.read(8))
+    if frame_magic != ZSTD_SEEK_TABLE_FRAME_MAGIC or frame_size != table_size:
+        return None
+
+    table = fileobj.read(frame_count * entry_size)
+    return [
+        struct.unpack_from("<II", table, i * entry_size) for i in range(frame_count)
+    ]
+
+
+class ZstdSeekableReader(io.RawIOBase):
+    """Read-only file object for a seekable ZStandard file.
+
+    Blender writes ZStandard files as independent frames with a seek table at
+    the end, so any part of the file can be read by decompressing only the
+    frames it is in. The most recently used decompressed frames are kept in
+    memory, up to FRAME_CACHE_SIZE bytes.
+    """
+
+    def __init__(
+        self,
+        fileobj: typing.IO[bytes],
+        frames: typing.List[typing.Tuple[int, int]],
+        cache_size: int = FRAME_CACHE_SIZE,
+    ) -> None:
+        super().__init__()
+        self._fileobj = fileobj
+        self._dctx = zstandard.ZstdDecompressor()
+
+        # Offsets of each frame in the compressed and decompressed file.
+        self._compressed_offsets = []  # type: typing.List[int]
+        self._decompressed_offsets = []  # type: typing.List[int]
+        self._compressed_sizes = []  # type: typing.List[int]
+        compressed_offset = decompressed_offset = 0
+        for compressed_size, decompressed_size in frames:
+            self._compressed_offsets.append(compressed_offset)
+            self._decompressed_offsets.append(decompressed_offset)
+            self._compressed_sizes.append(compressed_size)
+            compressed_offset += compressed_size
+            decompressed_offset += decompressed_size
+        self.size = decompressed_offset
+
+        self._position = 0
+        self._cache = collections.OrderedDict()  # type: typing.OrderedDict[int, bytes]
+        self._cache_size = cache_size
+        self._cached_bytes = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            position = offset
+        elif whence == os.SEEK_CUR:
+            position = self._position + offset
+        elif whence == os.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError("invalid whence (%r)" % whence)
+        if position < 0:
+            raise ValueError("negative seek position %d" % position)
+        self._position = position
+        return position
+
+    def readinto(self, buffer) -> int:
+        if self._position >= self.size:
+            return 0
+        index = bisect.bisect_right(self._decompressed_offsets, self._position) - 1
+        frame = self._frame(index)
+        start = self._position - self._decompressed_offsets[index]
+        length = min(len(buffer), len(frame) - start)
+        with memoryview(buffer) as view:
+            view[:length] = frame[start : start + length]
+        self._position += length
+        return length
+
+    def _frame(self, index: int) -> bytes:
+        try:
+            self._cache.move_to_end(index)
+            return self._cache[index]
+        except KeyError:
+            pass
+
+        frame = self._decompress_frame(index)
+        self._cache[index] = frame
+        self._cached_bytes += len(frame)
+        while self._cached_bytes > self._cache_size and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted)
+        return frame
+
+    def _decompress_frame(self, index: int) -> bytes:
+        self._fileobj.seek(self._compressed_offsets[index], os.SEEK_SET)
+        compressed = self._fileobj.read(self._compressed_sizes[index])
+        if index + 1 < len(self._decompressed_offsets):
+            size = self._decompressed_offsets[index + 1] - self._decompressed_offsets[index]
+        else:
+            size = self.size - self._decompressed_offsets[index]
+        return self._dctx.decompress(compressed, max_output_size=size)
+
+    def decompress_all(self) -> mmap.mmap:
+        """Decompress the whole file into an anonymous memory map, and close this reader."""
+        data = mmap.mmap(-1, self.size)
+        for index, offset in enumerate(self._decompressed_offsets):
+            frame = self._decompress_frame(index)
+            data[offset : offset + len(frame)] = frame
+        self.close()
+        return data
+
+    def close(self) -> None:
+        if not self.closed:
+            self._fileobj.close()
+            self._cache.clear()
+        super().close()
+
+
 def find_compression_type(fileobj: typing.IO[bytes]) -> Compression:
     fileobj.seek(0, os.SEEK_SET)
 
@@ -164,6 +448,7 @@ def _decompressor(
                 "File is compressed with ZStandard, install the `zstandard` module to support this."
             )
         dctx = zstandard.ZstdDecompressor()
-        return dctx.stream_reader(fileobj)
+        # Blender writes many frames, not just one.
+        return dctx.stream_reader(fileobj, read_across_frames=True, closefd=False)
 
     raise ValueError("Unsupported compression type: %s" % compression)
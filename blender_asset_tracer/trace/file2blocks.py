@@ -138,12 +138,14 @@ class BlockIterator:
 
     def _queue_all_blocks(self, bfile: blendfile.BlendFile):
         log.debug("Queueing all blocks from file %s", bfile.filepath)
-        for block in bfile.blocks:
+        for code in bfile.code_index:
             # Don't bother visiting DATA blocks, as we won't know what
-            # to do with them anyway.
-            if block.code == b"DATA":
+            # to do with them anyway. Skipping them by code also means
+            # they are never loaded.
+            if code == b"DATA":
                 continue
-            self.to_visit.put(block)
+            for block in bfile.find_blocks_from_code(code):
+                self.to_visit.put(block)
 
     def _queue_named_blocks(
         self, bfile: blendfile.BlendFile, limit_to: typing.Set[blendfile.BlendFileBlock]
@@ -20,6 +20,9 @@ exclude_files_addon = ["__pycache__",
                  "extensions_index.json",
                  "manifest.py",                 
                  "update_manifest.py",
+                 "/tests/",
+                 "/benchmarks/",
+                 "requirements-dev.txt",
                  "blender_manifest.toml"]
 
 exclude_files_extension = ["__pycache__",
@@ -31,7 +34,10 @@ exclude_files_extension = ["__pycache__",
                  "README.md",
                  "extensions_index.json",
                  "manifest.py",                 
-                 "update_manifest.py"]
+                 "update_manifest.py",
+                 "/tests/",
+                 "/benchmarks/",
+                 "requirements-dev.txt"]
 
 
 with open(blender_manifest, "r") as f:
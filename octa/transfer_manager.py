@@ -92,6 +92,7 @@ def create_upload(
     job_information: JobInformation,
     user_data: UserData,
     metadata: dict,
+    dedup: bool = False,
 ) -> str:
     response = request(
         "POST",
@@ -101,6 +102,7 @@ def create_upload(
             "local_file_path": local_file_path,
             "job_information": job_information,
             "metadata": metadata,
+            "dedup": dedup,
         },
     )
     return response.json()
@@ -0,0 +1,68 @@
+import asyncio
+import contextlib
+import pytest
+
+from transfer_manager.apis import r2_worker_shared
+from transfer_manager.lib import journal, retry_policy, transfer_manager as transfer_manager_module
+from transfer_manager.lib.concurrency_controller import ConcurrencyController
+from transfer_manager.lib.download import download as download_module
+from transfer_manager.lib.transfer_manager import TransferManager
+from transfer_manager.lib.upload import upload as upload_module
+from transfer_manager.lib.user_data import UserData
+
+from r2_stand_in import R2StandIn
+
+
+@pytest.fixture
+def r2(monkeypatch):
+    server = R2StandIn()
+    server.start()
+    # modules that took the endpoint by value
+    for module in (r2_worker_shared, download_module, upload_module):
+        monkeypatch.setattr(module, "R2_WORKER_ENDPOINT", server.url)
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def user_data(r2) -> UserData:
+    return UserData(r2.url, "test-api-token", "test-qm-token")
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    # failed work orders are retried right away
+    monkeypatch.setattr(retry_policy, "get_backoff_delay", lambda attempt, base_delay, max_delay: 0)
+
+
+@pytest.fixture
+def running_transfer_manager(monkeypatch, tmp_path):
+    """
+    async context manager that runs a transfer manager with a fixed number of workers per queue,
+    it keeps its journal in the temp dir of the test and does not open a browser when a job is created
+    """
+    monkeypatch.setattr(journal, "get_data_dir", lambda: str(tmp_path / "data"))
+    monkeypatch.setattr(journal, "LEGACY_JOURNAL_FILE_PATH", str(tmp_path / "legacy_journal.sqlite"))
+    monkeypatch.setattr(upload_module.webbrowser, "open", lambda *args, **kwargs: True)
+
+    @contextlib.asynccontextmanager
+    async def run(upload_workers: int = 1, download_workers: int = 1):
+        tm = TransferManager()
+        monkeypatch.setattr(transfer_manager_module, "_transfer_manager", tm)
+        for queue, workers in ((tm.upload_queue, upload_workers), (tm.download_queue, download_workers)):
+            queue.controller = ConcurrencyController(min_workers=workers, max_workers=workers)
+            queue._scale()
+        try:
+            yield tm
+        finally:
+            tasks = []
+            for queue in (tm.upload_queue, tm.download_queue):
+                for worker in queue.workers:
+                    worker.stop()
+                    worker.task.cancel()
+                    tasks.append(worker.task)
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await tm.close()
+
+    return run
+
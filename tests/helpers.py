@@ -0,0 +1,23 @@
+import asyncio
+
+from transfer_manager.lib.download.download import Download, DownloadOutput
+
+
+async def wait_for(condition, timeout: float = 30, interval: float = 0.01):
+    # polls condition until it is true, fails the test after timeout seconds
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise TimeoutError("condition was not met in time")
+        await asyncio.sleep(interval)
+
+
+def make_download(user_data, local_dir_path: str, frame_count: int) -> Download:
+    # what initialize would get from the job details, without asking sarfis
+    download = Download(user_data, local_dir_path, "job", {})
+    download.outputs = [DownloadOutput("", "png")]
+    download.frame_start = 1
+    download.frame_count = frame_count
+    download.file_count = frame_count
+    download.progress.set_total(frame_count)
+    return download
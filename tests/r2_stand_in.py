@@ -0,0 +1,254 @@
+"""
+local stand-in for the r2 storage worker and the sarfis queue manager, speaking just enough of both for the transfer
+manager to upload packages and download job outputs against it
+"""
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit, unquote
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+
+def md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+class StoredObject:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.etag = f'"{md5(data)}"'
+        self.last_modified = formatdate(time.time(), usegmt=True)
+
+
+class R2StandIn:
+    def __init__(self):
+        self.objects: Dict[str, StoredObject] = {}
+        self.multipart_uploads: Dict[str, Dict[int, bytes]] = {}  # upload id -> part number -> data
+        self.part_etags: Dict[Tuple[str, int], str] = {}
+        self.jobs: List[dict] = []
+        self.job_details: Dict[str, dict] = {}
+        self.requests: List[Tuple[str, str, dict]] = []  # method, path and lower case headers of every request
+
+        # knobs for the tests
+        self.part_delay = 0.0  # seconds a part upload is held before its body is read
+        self.drop_after: Dict[str, List[int]] = {}  # path -> bytes to send before dropping the connection, one per get
+        # (path, range start) -> bytes to send before waiting for the event, once
+        self.stall: Dict[Tuple[str, int], Tuple[int, threading.Event]] = {}
+        self.fail_ranges: Dict[Tuple[str, int], int] = {}  # (path, range start) -> status code to answer with
+        self.blobs_supported = True
+
+        self.uploads_in_flight = 0
+        self.max_uploads_in_flight = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.stand_in = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        for _, event in self.stall.values():
+            event.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def put_object(self, path: str, data: bytes) -> StoredObject:
+        self.objects[path.lstrip("/")] = StoredObject(data)
+        return self.objects[path.lstrip("/")]
+
+    def get_requests(self, path: str) -> List[dict]:
+        return [headers for _, p, headers in self.requests if p == path.lstrip("/")]
+
+    def _upload_started(self):
+        with self._lock:
+            self.uploads_in_flight += 1
+            self.max_uploads_in_flight = max(self.max_uploads_in_flight, self.uploads_in_flight)
+
+    def _upload_ended(self):
+        with self._lock:
+            self.uploads_in_flight -= 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def stand_in(self) -> R2StandIn:
+        return self.server.stand_in
+
+    def _parse(self):
+        url = urlsplit(self.path)
+        path = unquote(url.path).lstrip("/")
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.stand_in.requests.append((self.command, path, {k.lower(): v for k, v in self.headers.items()}))
+        return path, params
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    return bytes(body)
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _send(self, status: int, body: bytes = b"", headers: Optional[dict] = None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, data, status: int = 200):
+        self._send(status, json.dumps(data).encode(), {"Content-Type": "application/json"})
+
+    def do_HEAD(self):
+        self._parse()
+        self._send(200)
+
+    def do_POST(self):
+        path, params = self._parse()
+        body = self._read_body()
+        action = params.get("action")
+        if path == "qm/uber_api":
+            return self._sarfis(json.loads(body))
+        if action == "mpu-create":
+            upload_id = uuid.uuid4().hex
+            self.stand_in.multipart_uploads[upload_id] = {}
+            return self._send_json({"uploadId": upload_id})
+        if action == "mpu-complete":
+            parts = self.stand_in.multipart_uploads.pop(params["uploadId"])
+            listed = json.loads(body)["parts"]
+            for part in listed:
+                if self.stand_in.part_etags.get((params["uploadId"], part["partNumber"])) != part["etag"]:
+                    return self._send(400, f"etag of part {part['partNumber']} does not match".encode())
+            data = b"".join(parts[part["partNumber"]] for part in listed)
+            self.stand_in.put_object(path, data)
+            return self._send(200)
+        if action == "blobs-missing":
+            if not self.stand_in.blobs_supported:
+                return self._send(400, b"unknown action")
+            hashes = json.loads(body)["hashes"]
+            missing = [h for h in hashes if f"{path}/{h}" not in self.stand_in.objects]
+            return self._send_json({"missing": missing})
+        self._send(400, b"unknown action")
+
+    def do_PUT(self):
+        path, params = self._parse()
+        action = params.get("action")
+        self.stand_in._upload_started()
+        try:
+            if self.stand_in.part_delay > 0:
+                time.sleep(self.stand_in.part_delay)
+            body = self._read_body()
+        finally:
+            self.stand_in._upload_ended()
+        if action == "single-upload":
+            self.stand_in.put_object(path, body)
+            return self._send(200)
+        if action == "mpu-uploadpart":
+            upload_id = params["uploadId"]
+            part_number = int(params["partNumber"])
+            self.stand_in.multipart_uploads[upload_id][part_number] = body
+            etag = md5(body)
+            self.stand_in.part_etags[(upload_id, part_number)] = etag
+            return self._send_json({"partNumber": part_number, "etag": etag})
+        self._send(400, b"unknown action")
+
+    def do_DELETE(self):
+        path, params = self._parse()
+        action = params.get("action")
+        if action == "mpu-abort":
+            self.stand_in.multipart_uploads.pop(params["uploadId"], None)
+        elif action == "delete":
+            self.stand_in.objects.pop(path, None)
+        self._send(200)
+
+    def do_GET(self):
+        path, params = self._parse()
+        stored = self.stand_in.objects.get(path)
+        if stored is None:
+            return self._send(404)
+        if params.get("action") == "get":
+            return self._send(200, stored.data)
+
+        data = stored.data
+        headers = {"ETag": stored.etag, "Last-Modified": stored.last_modified, "Accept-Ranges": "bytes"}
+        if_match = self.headers.get("If-Match")
+        if if_match is not None and if_match != stored.etag:
+            return self._send(412)
+
+        start, end = 0, len(data)
+        status = 200
+        requested = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if requested is not None and (if_range is None or if_range in (stored.etag, stored.last_modified)):
+            first, last = requested.split("=", 1)[1].split("-")
+            start = int(first)
+            if start >= len(data):
+                return self._send(416, headers={"Content-Range": f"bytes */{len(data)}"})
+            end = min(int(last) + 1, len(data)) if last else len(data)
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{len(data)}"
+        if (path, start) in self.stand_in.fail_ranges:
+            return self._send(self.stand_in.fail_ranges[(path, start)])
+        body = data[start:end]
+
+        limit = len(body)
+        drops = self.stand_in.drop_after.get(path)
+        if drops:
+            limit = min(limit, drops.pop(0))
+        stall = self.stand_in.stall.pop((path, start), None)
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if stall is not None:
+            stall_at, event = stall
+            self.wfile.write(body[:stall_at])
+            self.wfile.flush()
+            event.wait(30)
+            body = body[stall_at:]
+            limit -= stall_at
+        self.wfile.write(body[:limit])
+        self.wfile.flush()
+        if limit < len(body):
+            # the client sees the connection close before the announced length
+            self.close_connection = True
+
+    def _sarfis(self, endpoints: dict):
+        result = {}
+        if "node_job" in endpoints:
+            self.stand_in.jobs.append(endpoints["node_job"])
+            result["node_job"] = {"status": "success", "body": {}}
+        if "job_details" in endpoints:
+            details = self.stand_in.job_details.get(endpoints["job_details"]["job_id"])
+            if details is None:
+                result["job_details"] = {"status": "error", "body": "unknown job"}
+            else:
+                result["job_details"] = {"status": "success", "body": details}
+        self._send_json(result)
@@ -0,0 +1,61 @@
+import pytest
+
+from blender_asset_tracer import blendfile
+from blender_asset_tracer.benchmarks import synthetic
+from blender_asset_tracer.blendfile import magic_compression
+
+COMPRESSIONS = ["gzip", "zstd", "zstd-seekable"]
+
+
+@pytest.fixture(autouse=True)
+def close_cached_files():
+    yield
+    blendfile.close_all_cached()
+
+
+def image_paths(bfile: blendfile.BlendFile) -> list:
+    return [image[b"filepath"] for image in bfile.find_blocks_from_code(b"IM")]
+
+
+@pytest.mark.parametrize("compress", COMPRESSIONS)
+def test_compressed_file_is_read_in_memory(tmp_path, compress):
+    if compress.startswith("zstd"):
+        pytest.importorskip("zstandard")
+    path = tmp_path / "scene.blend"
+    synthetic.build(path, n_images=50, n_objects=50, compress=compress)
+
+    bfile = blendfile.BlendFile(path)
+    assert bfile.is_compressed
+    assert bfile.raw_filepath == path  # no temporary file
+    assert image_paths(bfile)[7] == b"//textures/img7.png"
+    bfile.close()
+    bfile.close()
+
+
+def test_in_memory_files_are_limited_in_total(tmp_path, monkeypatch):
+    pytest.importorskip("zstandard")
+    paths = []
+    for index, compress in enumerate(["gzip", "zstd-seekable", "gzip", "zstd-seekable"]):
+        paths.append(tmp_path / ("lib%d.blend" % index))
+        synthetic.build(paths[-1], n_images=1000, n_objects=100, compress=compress)
+    uncompressed = tmp_path / "uncompressed.blend"
+    synthetic.build(uncompressed, n_images=1000, n_objects=100)
+    # room for two of the files
+    monkeypatch.setattr(
+        magic_compression, "MAX_IN_MEMORY_TOTAL_SIZE", 2 * uncompressed.stat().st_size + 1000
+    )
+
+    bfiles = [blendfile.open_cached(path) for path in paths]
+    in_memory = [bfile._decompressed_data is not None for bfile in bfiles]
+    assert in_memory == [True, True, False, False]
+    # the files that did not fit are read frame by frame, or through a temporary file
+    assert bfiles[2].raw_filepath != paths[2]
+    assert bfiles[3].raw_filepath == paths[3]
+    with blendfile.BlendFile(uncompressed) as bfile:
+        expected = image_paths(bfile)
+    for bfile in bfiles:
+        assert image_paths(bfile) == expected
+
+    bfiles[0].close()
+    with blendfile.BlendFile(paths[0]) as bfile:
+        assert bfile._decompressed_data is not None
@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import json
+import random
+import zipfile
+
+import pytest
+
+from transfer_manager.lib.transfer import TRANSFER_STATUS_SUCCESS
+from transfer_manager.lib.upload import dedup
+from transfer_manager.lib.upload.dedup import get_zip_ranges, hash_chunks
+from transfer_manager.lib.upload.upload import Upload, UPLOAD_PHASE_DONE, UPLOAD_PHASE_PREPARING
+
+from helpers import wait_for
+from test_upload_stress import JOB_INFO
+
+SMALL_CHUNK_SIZE = 256 * 1024
+ENTRY_COUNT = 500
+ENTRY_SIZE = 16 * 1024  # 8 MB of entries, enough for the upload not to be a single upload
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # groups of about 16 entries, so a package of a few mb has enough chunks to tell them apart
+    monkeypatch.setattr(dedup, "DEDUP_SMALL_CHUNK_SIZE", SMALL_CHUNK_SIZE)
+    monkeypatch.setattr(dedup, "DEDUP_MAX_GROUP_SIZE", 4 * SMALL_CHUNK_SIZE)
+
+
+def entries(count: int = ENTRY_COUNT) -> list:
+    return [(f"textures/{i:04d}.png", random.Random(i).randbytes(ENTRY_SIZE)) for i in range(count)]
+
+
+def write_zip(path: str, files: list) -> bytes:
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as z:
+        for name, data in files:
+            # same timestamp in every package, so an unchanged entry is the same bytes
+            z.writestr(zipfile.ZipInfo(name, date_time=(2024, 1, 1, 0, 0, 0)), data)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def chunk_hashes(path: str) -> list:
+    return [c.hash for c in hash_chunks(path, get_zip_ranges(path))]
+
+
+def test_ranges_cover_the_zip(tmp_path):
+    path = str(tmp_path / "package.zip")
+    data = write_zip(path, entries())
+    ranges = get_zip_ranges(path)
+    assert ranges[0][0] == 0
+    for (offset, size), (next_offset, _) in zip(ranges, ranges[1:]):
+        assert offset + size == next_offset
+    assert sum(size for _, size in ranges) == len(data)
+    assert 10 < len(ranges) < 100
+
+
+def test_ranges_keep_data_in_front_of_the_first_entry(tmp_path):
+    path = str(tmp_path / "package.zip")
+    data = write_zip(path, entries(20))
+    with open(path, "wb") as f:
+        f.write(b"stub" * 1000 + data)
+    ranges = get_zip_ranges(path)
+    assert ranges[0][0] == 0
+    assert sum(size for _, size in ranges) == len(data) + 4000
+
+
+@pytest.mark.parametrize("change", ["insert", "remove"])
+def test_changed_entry_only_changes_its_own_chunks(tmp_path, change):
+    files = entries()
+    changed = list(files)
+    if change == "insert":
+        changed.insert(ENTRY_COUNT // 2, ("textures/new.png", random.Random(-1).randbytes(ENTRY_SIZE)))
+    else:
+        del changed[ENTRY_COUNT // 2]
+    write_zip(str(tmp_path / "a.zip"), files)
+    write_zip(str(tmp_path / "b.zip"), changed)
+
+    before = set(chunk_hashes(str(tmp_path / "a.zip")))
+    after = chunk_hashes(str(tmp_path / "b.zip"))
+    # the group with the change, at most one more if the change moved a boundary, and the zip directory
+    assert len([h for h in after if h not in before]) <= 3
+
+
+def test_deduplicated_upload(tmp_path, r2, user_data, running_transfer_manager):
+    first_path = str(tmp_path / "first" / "package.zip")
+    second_path = str(tmp_path / "second" / "package.zip")
+    (tmp_path / "first").mkdir()
+    (tmp_path / "second").mkdir()
+    files = entries()
+    first = write_zip(first_path, files)
+    second = write_zip(second_path, files[:100] + [("scene.blend", b"changed" * 1000)] + files[100:])
+
+    async def upload(tm, path: str) -> Upload:
+        upload = Upload(user_data, path, JOB_INFO, {}, dedup=True)
+        await upload.initialize()
+        # the chunks are hashed after the upload was created
+        assert upload.phase == UPLOAD_PHASE_PREPARING
+        assert upload.work_orders == []
+        tm.add(upload)
+        upload.start()
+        await wait_for(lambda: upload.phase == UPLOAD_PHASE_DONE, timeout=60)
+        return upload
+
+    async def scenario():
+        async with running_transfer_manager(upload_workers=4) as tm:
+            return await upload(tm, first_path), await upload(tm, second_path)
+
+    first_upload, second_upload = asyncio.run(scenario())
+
+    for finished, data in [(first_upload, first), (second_upload, second)]:
+        assert finished.status == TRANSFER_STATUS_SUCCESS
+        manifest = json.loads(r2.objects[f"{finished.job_id}/input/package.manifest.json"].data)
+        assert manifest["md5"] == hashlib.md5(data).hexdigest()
+        rebuilt = b"".join(r2.objects[f"blobs/{chunk['hash']}"].data for chunk in manifest["chunks"])
+        assert rebuilt == data
+
+    # the second package only uploaded the chunks around the new entry and the zip directory
+    blob_puts = [p for m, p, _ in r2.requests if m == "PUT" and p.startswith("blobs/")]
+    assert len(blob_puts) == len(first_upload.work_orders) + len(second_upload.work_orders)
+    assert len(second_upload.work_orders) <= 3
+    assert len(r2.jobs) == 2
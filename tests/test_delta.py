@@ -0,0 +1,40 @@
+import asyncio
+import random
+
+from transfer_manager.lib.transfer import TRANSFER_STATUS_RUNNING
+
+from helpers import make_download, wait_for
+
+REMOTE_PATH = "job/output/0001.png"
+FILE_SIZE = 3 * 1024 * 1024
+
+
+def test_delta_has_the_progress_of_files_in_flight(tmp_path, r2, user_data, running_transfer_manager):
+    r2.put_object(REMOTE_PATH, random.Random(0).randbytes(FILE_SIZE))
+
+    async def scenario():
+        async with running_transfer_manager(download_workers=1) as tm:
+            download = make_download(user_data, str(tmp_path), 1)
+            # slow enough that the file is still running a while after its first bytes
+            tm.bandwidth_limiter.set_transfer_limit(download.id, 512 * 1024)
+            tm.add(download)
+            download.start()
+            await wait_for(lambda: len(download.work_orders) > 0)
+            work_order = next(iter(download.work_orders.values()))
+            await wait_for(lambda: work_order.progress.done > 0)
+
+            since = tm.get_delta(0)["version"]
+            done_before = work_order.progress.done
+            await wait_for(lambda: work_order.progress.done > done_before)
+            delta = tm.get_delta(since)
+            assert work_order.status == TRANSFER_STATUS_RUNNING
+            assert download.progress.done == 0  # no file finished, the download itself did not change
+            return download, delta
+
+    download, delta = asyncio.run(scenario())
+
+    assert not delta["full"]
+    assert [t["id"] for t in delta["transfers"]] == [download.id]
+    changed = delta["transfers"][0]["changed_work_orders"]
+    assert len(changed) == 1
+    assert 0 < changed[0]["done"] < FILE_SIZE
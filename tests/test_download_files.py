@@ -0,0 +1,32 @@
+from transfer_manager.lib.transfer import (
+    TRANSFER_STATUS_CREATED,
+    TRANSFER_STATUS_FAILURE,
+    TRANSFER_STATUS_RUNNING,
+    TRANSFER_STATUS_SUCCESS,
+)
+
+from helpers import make_download
+
+
+def test_files_are_paged_with_the_status_of_files_without_work_orders(tmp_path, user_data):
+    download = make_download(user_data, str(tmp_path), 6)
+    download.skip_numbers.add(4)  # finished before a restart
+    work_orders = [download.pop_pending_work_order() for _ in range(3)]
+    statuses = [TRANSFER_STATUS_SUCCESS, TRANSFER_STATUS_FAILURE, TRANSFER_STATUS_RUNNING]
+    for work_order, status in zip(work_orders, statuses):
+        work_order.status = status
+    # more finished files than the download keeps work orders for
+    download.finished_work_orders.clear()
+
+    assert [f["number"] for f in download.to_dict()["files"]] == [1, 2]
+    page = download.get_files(0, 10)
+    assert page["total"] == 6
+    assert [f["status"] for f in page["files"]] == [
+        TRANSFER_STATUS_SUCCESS,
+        TRANSFER_STATUS_FAILURE,
+        TRANSFER_STATUS_RUNNING,
+        TRANSFER_STATUS_CREATED,
+        TRANSFER_STATUS_SUCCESS,
+        TRANSFER_STATUS_CREATED,
+    ]
+    assert [f["rel_path"] for f in download.get_files(4, 10)["files"]] == ["0005.png", "0006.png"]
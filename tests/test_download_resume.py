@@ -0,0 +1,235 @@
+import asyncio
+import os
+import random
+
+import httpx
+import pytest
+
+from transfer_manager.apis.http_pool import HttpPool
+from transfer_manager.lib.download.download import Download
+from transfer_manager.lib.download.download_queue_worker import DownloadQueueWorker, PART_FILE_SUFFIX
+from transfer_manager.lib.transfer import TRANSFER_STATUS_RUNNING, TRANSFER_STATUS_SUCCESS
+
+from helpers import make_download, wait_for
+
+REMOTE_PATH = "job/output/0001.png"
+FILE_SIZE = 3 * 1024 * 1024
+
+
+def random_bytes(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+class FileDownload:
+    """
+    runs single attempts of the worker on the first file of a download, so a test can change things in between
+    """
+
+    def __init__(self, tm, download: Download):
+        self.download = download
+        self.worker = DownloadQueueWorker(tm.download_queue)
+        tm.add(download)
+        download.status = TRANSFER_STATUS_RUNNING
+        self.work_order = download.pop_pending_work_order()
+        self.work_order.status = TRANSFER_STATUS_RUNNING
+
+    @property
+    def local_path(self) -> str:
+        return self.work_order.local_path
+
+    @property
+    def part_path(self) -> str:
+        return self.work_order.local_path + PART_FILE_SUFFIX
+
+    async def attempt(self):
+        await self.worker._download(HttpPool.get_client(), self.work_order, "test file")
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_resumes_after_a_dropped_connection(tmp_path, r2, user_data, running_transfer_manager, no_backoff):
+    data = random_bytes(FILE_SIZE)
+    stored = r2.put_object(REMOTE_PATH, data)
+    r2.drop_after[REMOTE_PATH] = [1000000, 2000000]
+
+    async def scenario():
+        async with running_transfer_manager(download_workers=1) as tm:
+            download = make_download(user_data, str(tmp_path), 1)
+            tm.add(download)
+            download.start()
+            await wait_for(lambda: download.status == TRANSFER_STATUS_SUCCESS)
+
+    asyncio.run(scenario())
+
+    assert read(str(tmp_path / "job" / "0001.png")) == data
+    assert not os.path.exists(str(tmp_path / "job" / ("0001.png" + PART_FILE_SUFFIX)))
+    requests = r2.get_requests(REMOTE_PATH)
+    assert [r["range"] for r in requests] == [f"bytes=0-{32 * 1024 * 1024 - 1}", "bytes=1000000-", "bytes=3000000-"]
+    assert "if-range" not in requests[0]
+    assert requests[1]["if-range"] == stored.etag
+    assert requests[2]["if-range"] == stored.etag
+
+
+def test_starts_over_when_the_remote_file_changed(tmp_path, r2, user_data, running_transfer_manager):
+    r2.put_object(REMOTE_PATH, random_bytes(FILE_SIZE, seed=1))
+    r2.drop_after[REMOTE_PATH] = [1000000]
+    changed = random_bytes(FILE_SIZE - 100, seed=2)
+
+    async def scenario():
+        async with running_transfer_manager(download_workers=0) as tm:
+            file = FileDownload(tm, make_download(user_data, str(tmp_path), 1))
+            with pytest.raises(httpx.RemoteProtocolError):
+                await file.attempt()
+            assert os.path.getsize(file.part_path) == 1000000
+
+            r2.put_object(REMOTE_PATH, changed)
+            await file.attempt()
+            return file
+
+    file = asyncio.run(scenario())
+    # the server ignored the range because of If-Range, the part file was written again from the start
+    assert read(file.local_path) == changed
+    assert file.work_order.status == TRANSFER_STATUS_SUCCESS
+    assert r2.get_requests(REMOTE_PATH)[1]["range"] == "bytes=1000000-"
+
+
+def test_part_file_without_validator_is_not_resumed(tmp_path, r2, user_data, running_transfer_manager):
+    data = random_bytes(FILE_SIZE)
+    r2.put_object(REMOTE_PATH, data)
+
+    async def scenario():
+        async with running_transfer_manager(download_workers=0) as tm:
+            file = FileDownload(tm, make_download(user_data, str(tmp_path), 1))
+            # a part file we know nothing about, it could be of any version of the file
+            write(file.part_path, random_bytes(1000, seed=5))
+            await file.attempt()
+            return file
+
+    file = asyncio.run(scenario())
+    assert read(file.local_path) == data
+    assert r2.get_requests(REMOTE_PATH)[0]["range"].startswith("bytes=0-")
+
+
+def test_complete_part_file_is_renamed_on_416(tmp_path, r2, user_data, running_transfer_manager):
+    data = random_bytes(FILE_SIZE)
+    stored = r2.put_object(REMOTE_PATH, data)
+
+    async def scenario():
+        async with running_transfer_manager(download_workers=0) as tm:
+            file = FileDownload(tm, make_download(user_data, str(tmp_path), 1))
+            write(file.part_path, data)
+            file.work_order.etag = stored.etag
+            await file.attempt()
+            return file
+
+    file = asyncio.run(scenario())
+    assert read(file.local_path) == data
+    assert file.work_order.status == TRANSFER_STATUS_SUCCESS
+    assert file.work_order.status_text == "Already Downloaded"
+    assert r2.get_requests(REMOTE_PATH)[0]["range"] == f"bytes={FILE_SIZE}-"
+
+
+def test_part_file_longer_than_remote_starts_over(tmp_path, r2, user_data, running_transfer_manager):
+    data = random_bytes(FILE_SIZE)
+    stored = r2.put_object(REMOTE_PATH, data)
+
+    async def scenario():
+        async with running_transfer_manager(download_workers=0) as tm:
+            file = FileDownload(tm, make_download(user_data, str(tmp_path), 1))
+            write(file.part_path, data + b"garbage")
+            file.work_order.etag = stored.etag
+            with pytest.raises(Exception, match="starting over"):
+                await file.attempt()
+            assert not os.path.exists(file.part_path)
+            await file.attempt()
+            return file
+
+    file = asyncio.run(scenario())
+    assert read(file.local_path) == data
+
+
+def test_existing_file_with_the_same_size_is_skipped(tmp_path, r2, user_data, running_transfer_manager):
+    r2.put_object(REMOTE_PATH, random_bytes(FILE_SIZE))
+    existing = random_bytes(FILE_SIZE, seed=3)
+
+    async def scenario():
+        async with running_transfer_manager(download_workers=0) as tm:
+            file = FileDownload(tm, make_download(user_data, str(tmp_path), 1))
+            write(file.local_path, existing)
+            await file.attempt()
+            return file
+
+    file = asyncio.run(scenario())
+    assert read(file.local_path) == existing
+    assert file.work_order.status == TRANSFER_STATUS_SUCCESS
+    assert file.work_order.status_text == "Already Downloaded"
+    assert not os.path.exists(file.part_path)
+
+
+def test_existing_file_with_another_size_is_replaced_not_appended(tmp_path, r2, user_data, running_transfer_manager):
+    data = random_bytes(FILE_SIZE)
+    r2.put_object(REMOTE_PATH, data)
+    r2.drop_after[REMOTE_PATH] = [1000000]
+    existing = random_bytes(1000, seed=4)
+
+    async def scenario():
+        async with running_transfer_manager(download_workers=0) as tm:
+            file = FileDownload(tm, make_download(user_data, str(tmp_path), 1))
+            write(file.local_path, existing)
+            with pytest.raises(httpx.RemoteProtocolError):
+                await file.attempt()
+            # the old file stays as it is until the new one is complete
+            assert read(file.local_path) == existing
+            await file.attempt()
+            return file
+
+    file = asyncio.run(scenario())
+    assert read(file.local_path) == data
+    requests = r2.get_requests(REMOTE_PATH)
+    assert requests[0]["range"].startswith("bytes=0-")
+    assert requests[1]["range"] == "bytes=1000000-"
+
+
+def test_part_file_is_resumed_after_a_restart(tmp_path, r2, user_data, running_transfer_manager):
+    data = random_bytes(FILE_SIZE)
+    stored = r2.put_object(REMOTE_PATH, data)
+    r2.job_details["job"] = {"render_passes": {}, "start": 1, "end": 1, "render_format": "PNG"}
+
+    async def scenario():
+        async with running_transfer_manager(download_workers=0) as tm:
+            state = make_download(user_data, str(tmp_path), 1).to_journal()
+            # the journal of the earlier run has the validators the part file was started with
+            work_order_states = {0: {"status": TRANSFER_STATUS_RUNNING, "etag": stored.etag, "last_modified": None}}
+            download = await Download.from_journal(state, work_order_states)
+            file = FileDownload(tm, download)
+            assert file.work_order.etag == stored.etag
+            write(file.part_path, data[:1234567])
+            await file.attempt()
+            return file
+
+    file = asyncio.run(scenario())
+    assert read(file.local_path) == data
+    requests = r2.get_requests(REMOTE_PATH)
+    assert requests[0]["range"] == "bytes=1234567-"
+    assert requests[0]["if-range"] == stored.etag
+
+
+def test_missing_file_is_skipped(tmp_path, r2, user_data, running_transfer_manager):
+    async def scenario():
+        async with running_transfer_manager(download_workers=0) as tm:
+            file = FileDownload(tm, make_download(user_data, str(tmp_path), 1))
+            await file.attempt()
+            return file
+
+    file = asyncio.run(scenario())
+    assert file.work_order.status == TRANSFER_STATUS_SUCCESS
+    assert not os.path.exists(file.local_path)
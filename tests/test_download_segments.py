@@ -0,0 +1,129 @@
+import asyncio
+import os
+import random
+import threading
+
+import pytest
+
+from transfer_manager.lib.download import download_queue_worker
+from transfer_manager.lib.download.download_queue_worker import DownloadQueueWorker, SEGMENTED_PART_FILE_SUFFIX
+from transfer_manager.lib.transfer import TRANSFER_STATUS_FAILURE, TRANSFER_STATUS_SUCCESS
+
+from helpers import make_download, wait_for
+
+REMOTE_PATH = "job/output/0001.png"
+SEGMENT_SIZE = 1024 * 1024
+FILE_SIZE = 3 * SEGMENT_SIZE + 12345  # four segments, the last one short
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    monkeypatch.setattr(download_queue_worker, "DOWNLOAD_SEGMENT_SIZE", SEGMENT_SIZE)
+
+
+def random_bytes(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def range_starts(r2) -> list:
+    return [int(r["range"].split("=")[1].split("-")[0]) for r in r2.get_requests(REMOTE_PATH)]
+
+
+def run_download(tmp_path, user_data, running_transfer_manager, download_workers: int):
+    async def scenario():
+        async with running_transfer_manager(download_workers=download_workers) as tm:
+            download = make_download(user_data, str(tmp_path), 1)
+            tm.add(download)
+            download.start()
+            await wait_for(lambda: download.status == TRANSFER_STATUS_SUCCESS)
+            return download
+
+    return asyncio.run(scenario())
+
+
+def file_work_order(download):
+    # work orders are created when the queue gets to them, and move to the finished ones when they are done
+    return next(iter(download.work_orders.values()), None) or next(iter(download.finished_work_orders), None)
+
+
+def read(path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_segmented_download(tmp_path, r2, user_data, running_transfer_manager):
+    data = random_bytes(FILE_SIZE)
+    r2.put_object(REMOTE_PATH, data)
+
+    download = run_download(tmp_path, user_data, running_transfer_manager, download_workers=3)
+
+    assert read(tmp_path / "job" / "0001.png") == data
+    assert not os.path.exists(str(tmp_path / "job" / ("0001.png" + SEGMENTED_PART_FILE_SUFFIX)))
+    assert file_work_order(download).status == TRANSFER_STATUS_SUCCESS
+    # the first segment is written from the response that told us the size, it is not requested twice
+    assert sorted(range_starts(r2)) == [0, SEGMENT_SIZE, 2 * SEGMENT_SIZE, 3 * SEGMENT_SIZE]
+
+
+def test_first_segment_resumes_after_a_dropped_connection(tmp_path, r2, user_data, running_transfer_manager, no_backoff):
+    data = random_bytes(FILE_SIZE)
+    stored = r2.put_object(REMOTE_PATH, data)
+    r2.drop_after[REMOTE_PATH] = [500000]
+
+    run_download(tmp_path, user_data, running_transfer_manager, download_workers=2)
+
+    assert read(tmp_path / "job" / "0001.png") == data
+    assert sorted(range_starts(r2)) == [0, 500000, SEGMENT_SIZE, 2 * SEGMENT_SIZE, 3 * SEGMENT_SIZE]
+    resumed = [r for r in r2.get_requests(REMOTE_PATH) if r["range"].startswith("bytes=500000-")][0]
+    assert resumed["range"] == f"bytes=500000-{SEGMENT_SIZE - 1}"
+    assert resumed["if-match"] == stored.etag
+
+
+def test_worker_stopped_after_the_split_does_not_start_the_file_over(
+        tmp_path, r2, user_data, running_transfer_manager, monkeypatch):
+    data = random_bytes(FILE_SIZE)
+    r2.put_object(REMOTE_PATH, data)
+    split = DownloadQueueWorker._split
+    stopped = []
+
+    async def split_then_stop(self, *args):
+        await split(self, *args)
+        if not stopped:
+            stopped.append(self)
+            self.stop()
+
+    monkeypatch.setattr(DownloadQueueWorker, "_split", split_then_stop)
+
+    run_download(tmp_path, user_data, running_transfer_manager, download_workers=2)
+
+    assert stopped
+    assert read(tmp_path / "job" / "0001.png") == data
+    # the file was not handed back to the queue, nobody asked for its start again
+    assert range_starts(r2).count(0) == 1
+
+
+def test_failed_segment_stops_the_other_segments(tmp_path, r2, user_data, running_transfer_manager):
+    r2.put_object(REMOTE_PATH, random_bytes(FILE_SIZE))
+    r2.fail_ranges[(REMOTE_PATH, 2 * SEGMENT_SIZE)] = 404
+    resume = threading.Event()
+    # the first segment is held after a few bytes until the other one failed
+    r2.stall[(REMOTE_PATH, 0)] = (100000, resume)
+
+    async def scenario():
+        async with running_transfer_manager(download_workers=2) as tm:
+            download = make_download(user_data, str(tmp_path), 1)
+            tm.add(download)
+            download.start()
+            await wait_for(lambda: file_work_order(download) is not None)
+            work_order = file_work_order(download)
+            await wait_for(lambda: work_order.status == TRANSFER_STATUS_FAILURE)
+            resume.set()
+            await wait_for(lambda: work_order.segments[0].status == TRANSFER_STATUS_FAILURE)
+            await wait_for(lambda: download.status == TRANSFER_STATUS_FAILURE)
+            return work_order
+
+    work_order = asyncio.run(scenario())
+
+    first = work_order.segments[0]
+    assert first.done < first.size
+    assert "another segment of the file failed" in first.history[-1]
+    assert not os.path.exists(str(tmp_path / "job" / "0001.png"))
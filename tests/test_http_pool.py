@@ -0,0 +1,48 @@
+import asyncio
+import socket
+
+import httpx
+import pytest
+
+from transfer_manager.apis.http_pool import HttpPool
+
+
+@pytest.fixture
+def pool():
+    # the counters are kept across clients
+    HttpPool.requests = 0
+    HttpPool.network_backend = None
+    yield HttpPool
+    asyncio.run(HttpPool.close())
+
+
+def test_requests_share_connections(r2, pool):
+    r2.put_object("file", b"data")
+
+    async def scenario():
+        client = pool.get_client()
+        for _ in range(5):
+            response = await client.get(f"{r2.url}/file")
+            assert response.content == b"data"
+        await pool.close()
+
+    asyncio.run(scenario())
+
+    assert pool.requests == 5
+    assert pool.network_backend.connections_opened == 1
+
+
+def test_errors_are_httpx_errors(pool):
+    # a port nobody listens on
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    async def scenario():
+        try:
+            await pool.get_client().get(f"http://127.0.0.1:{port}/")
+        finally:
+            await pool.close()
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(scenario())
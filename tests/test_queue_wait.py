@@ -0,0 +1,24 @@
+import asyncio
+import time
+
+from helpers import make_download
+
+
+def test_files_wait_from_when_the_download_joined_the_queue(tmp_path, user_data, running_transfer_manager):
+    async def scenario():
+        async with running_transfer_manager(download_workers=0) as tm:
+            download = make_download(user_data, str(tmp_path), 3)
+            download.created -= 3600  # created an hour before it was started
+            tm.add(download)
+            download.start()
+            first = tm.download_queue._pop_work_order()
+
+            download.pause()
+            download.queued_at -= 600  # paused for ten minutes
+            download.start()
+            second = tm.download_queue._pop_work_order()
+            return first, second
+
+    first, second = asyncio.run(scenario())
+    assert time.time() - first.queued_at < 60
+    assert time.time() - second.queued_at < 60
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+from transfer_manager.api.limits import _validate_limits
+from transfer_manager.lib.rate_limiter import BandwidthLimiter
+
+OFFICE_HOURS = {"start": "08:00", "end": "18:00"}
+
+
+def around_now() -> dict:
+    now = datetime.now()
+    return {
+        "start": (now - timedelta(minutes=5)).strftime("%H:%M"),
+        "end": (now + timedelta(minutes=5)).strftime("%H:%M"),
+    }
+
+
+def test_zero_rate_is_rejected():
+    assert _validate_limits({"upload": 0}) is not None
+    assert _validate_limits({"transfers": {"id": 0}}) is not None
+    assert _validate_limits({"schedule": [dict(OFFICE_HOURS, download=0)]}) is not None
+    assert _validate_limits({"upload": None, "download": 1024, "schedule": [dict(OFFICE_HOURS, upload=None)]}) is None
+
+
+def test_schedule_entry_without_a_type_keeps_its_global_limit():
+    limiter = BandwidthLimiter()
+    limiter.set_limit("download", 1024)
+    limiter.set_limit("upload", 2048)
+    limiter.set_schedule([dict(around_now(), upload=None)])
+
+    assert limiter.get_effective_limit("download") == 1024
+    assert limiter.get_effective_limit("upload") is None
+    assert limiter.buckets["download"].rate == 1024
@@ -0,0 +1,167 @@
+import heapq
+from collections import Counter, deque
+from typing import Dict, List
+
+import pytest
+
+from transfer_manager.lib.concurrency_controller import ConcurrencyController
+from transfer_manager.lib.progress import Progress
+from transfer_manager.lib.rate_limiter import BandwidthLimiter
+from transfer_manager.lib.scheduler import SCHEDULERS
+from transfer_manager.lib.transfer import TRANSFER_STATUS_CREATED, TRANSFER_STATUS_RUNNING
+from transfer_manager.lib.transfer_queue import TransferQueue
+
+
+class FakeWorkOrder:
+    def __init__(self, transfer: "FakeTransfer", size: float):
+        self.transfer = transfer
+        self.size = size
+        self.status = TRANSFER_STATUS_CREATED
+        self.queued_at = 0
+
+
+class FakeTransfer:
+    # just what the queue and the schedulers look at
+    def __init__(self, transfer_id: str, parts: int, part_size: float = 1, priority: int = 1):
+        self.id = transfer_id
+        self.priority = priority
+        self.status = TRANSFER_STATUS_RUNNING
+        self.progress = Progress()
+        self.progress.set_total(parts * part_size)
+        self._pending = deque(FakeWorkOrder(self, part_size) for _ in range(parts))
+
+    def has_pending_work_orders(self) -> bool:
+        return len(self._pending) > 0
+
+    def pop_pending_work_order(self):
+        return self._pending.popleft() if self._pending else None
+
+    def on_queued(self):
+        pass
+
+    def get_work_order_cost(self, work_order: FakeWorkOrder) -> float:
+        return work_order.size
+
+    def on_done(self, work_order: FakeWorkOrder):
+        self.progress.increase_done(work_order.size)
+
+
+def make_queue(scheduler: str, transfers: List[FakeTransfer]) -> TransferQueue:
+    queue = TransferQueue("upload", object, ConcurrencyController(), BandwidthLimiter(), SCHEDULERS[scheduler]())
+    for transfer in transfers:
+        queue.add_transfer(transfer)
+    return queue
+
+
+def dispatch_order(queue: TransferQueue) -> List[str]:
+    # ids of the transfers in the order the queue hands out their work orders, everything finishes right away
+    order = []
+    while True:
+        wo = queue._pop_work_order()
+        if wo is None:
+            return order
+        wo.transfer.on_done(wo)
+        order.append(wo.transfer.id)
+
+
+def simulate(scheduler: str, transfers: List[FakeTransfer], workers: int) -> Dict[str, float]:
+    # workers take a work order whenever they are free, a work order takes as long as it is big,
+    # returns when the last work order of every transfer finished
+    queue = make_queue(scheduler, transfers)
+    now = 0.0
+    running = []  # (finishes at, sequence, work order)
+    sequence = 0
+    remaining = Counter({t.id: len(t._pending) for t in transfers})
+    completed = {}
+    while True:
+        while len(running) < workers:
+            wo = queue._pop_work_order()
+            if wo is None:
+                break
+            heapq.heappush(running, (now + wo.size, sequence, wo))
+            sequence += 1
+        if not running:
+            return completed
+        now, _, wo = heapq.heappop(running)
+        wo.transfer.on_done(wo)
+        remaining[wo.transfer.id] -= 1
+        if remaining[wo.transfer.id] == 0:
+            completed[wo.transfer.id] = now
+
+
+def test_fifo_serves_one_transfer_after_the_other():
+    order = dispatch_order(make_queue("fifo", [FakeTransfer("a", 3), FakeTransfer("b", 3)]))
+    assert order == ["a", "a", "a", "b", "b", "b"]
+
+
+def test_fifo_serves_higher_priority_first():
+    order = dispatch_order(make_queue("fifo", [FakeTransfer("a", 3), FakeTransfer("b", 3, priority=2)]))
+    assert order == ["b", "b", "b", "a", "a", "a"]
+
+
+def test_round_robin_takes_turns_by_priority():
+    transfers = [FakeTransfer("a", 4, priority=2), FakeTransfer("b", 4)]
+    order = dispatch_order(make_queue("round_robin", transfers))
+    assert order == ["a", "a", "b", "a", "a", "b", "b", "b"]
+
+
+def test_weighted_fair_shares_by_priority():
+    transfers = [FakeTransfer("a", 300, priority=3), FakeTransfer("b", 300)]
+    order = dispatch_order(make_queue("weighted_fair", transfers))
+    # while both have work, a gets three work orders for every one of b
+    assert Counter(order[:200]) == {"a": 150, "b": 50}
+
+
+def test_weighted_fair_charges_by_cost():
+    # parts of b are twice as big, so b gets half as many of them for the same share of bytes
+    transfers = [FakeTransfer("a", 300, part_size=1), FakeTransfer("b", 300, part_size=2)]
+    order = dispatch_order(make_queue("weighted_fair", transfers))
+    assert Counter(order[:150]) == {"a": 100, "b": 50}
+
+
+def test_weighted_fair_newcomer_does_not_catch_up():
+    queue = make_queue("weighted_fair", [FakeTransfer("a", 100)])
+    for _ in range(50):
+        queue._pop_work_order()
+    queue.add_transfer(FakeTransfer("b", 100))
+    # b starts at the current virtual time instead of getting the 50 work orders a got before it joined
+    order = dispatch_order(queue)
+    assert Counter(order[:20]) == {"a": 10, "b": 10}
+
+
+def test_shortest_remaining_first_serves_small_transfers_first():
+    transfers = [FakeTransfer("big", 5), FakeTransfer("small", 2), FakeTransfer("tiny", 1)]
+    order = dispatch_order(make_queue("shortest_remaining_first", transfers))
+    assert order == ["tiny", "small", "small", "big", "big", "big", "big", "big"]
+
+
+def test_shortest_remaining_first_serves_higher_priority_first():
+    transfers = [FakeTransfer("big", 3, priority=2), FakeTransfer("small", 1)]
+    order = dispatch_order(make_queue("shortest_remaining_first", transfers))
+    assert order == ["big", "big", "big", "small"]
+
+
+def test_paused_transfer_gets_nothing():
+    paused = FakeTransfer("paused", 3)
+    paused.status = "paused"
+    order = dispatch_order(make_queue("weighted_fair", [paused, FakeTransfer("b", 2)]))
+    assert order == ["b", "b"]
+
+
+@pytest.mark.parametrize("scheduler", ["weighted_fair", "shortest_remaining_first", "round_robin"])
+def test_small_jobs_do_not_wait_behind_a_big_one(scheduler):
+    # one job of a thousand parts submitted before five jobs of ten parts, four workers
+    def jobs():
+        return [FakeTransfer("big", 1000)] + [FakeTransfer(f"small{i}", 10) for i in range(5)]
+
+    fifo = simulate("fifo", jobs(), workers=4)
+    completed = simulate(scheduler, jobs(), workers=4)
+
+    small = [f"small{i}" for i in range(5)]
+    fifo_small = sum(fifo[i] for i in small) / len(small)
+    scheduled_small = sum(completed[i] for i in small) / len(small)
+    # under fifo the small jobs wait for all 1000 parts, here they finish within a fraction of that
+    assert fifo_small >= 250
+    assert scheduled_small < fifo_small / 5
+    # the big job is barely slowed down, the small ones are only 50 of its 1050 parts
+    assert completed["big"] <= fifo["big"] * 1.1
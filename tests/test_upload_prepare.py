@@ -0,0 +1,50 @@
+import asyncio
+
+from transfer_manager.lib.transfer import TRANSFER_STATUS_FAILURE
+from transfer_manager.lib.upload.upload import Upload, UPLOAD_PHASE_PREPARING
+
+from test_dedup import entries, write_zip
+from test_upload_stress import JOB_INFO, write_random_file
+
+
+def test_stopped_upload_does_not_create_its_multipart_upload(tmp_path, r2, user_data, running_transfer_manager):
+    path = str(tmp_path / "package" / "package.zip")
+    write_random_file(path, 8 * 1024 * 1024)
+
+    async def scenario():
+        async with running_transfer_manager() as tm:
+            upload = Upload(user_data, path, JOB_INFO, {})
+            await upload.initialize()
+            tm.add(upload)
+            upload.start()
+            upload.stop()
+            await asyncio.sleep(0.5)
+            return upload
+
+    upload = asyncio.run(scenario())
+
+    assert upload.status == TRANSFER_STATUS_FAILURE
+    assert upload._upload_id is None
+    assert r2.multipart_uploads == {}
+
+
+def test_stopped_upload_is_not_chunked(tmp_path, r2, user_data, running_transfer_manager):
+    path = str(tmp_path / "package" / "package.zip")
+    (tmp_path / "package").mkdir()
+    write_zip(path, entries())
+
+    async def scenario():
+        async with running_transfer_manager() as tm:
+            upload = Upload(user_data, path, JOB_INFO, {}, dedup=True)
+            await upload.initialize()
+            tm.add(upload)
+            upload.start()
+            upload.stop()
+            await asyncio.sleep(0.5)
+            return upload
+
+    upload = asyncio.run(scenario())
+
+    assert upload.phase == UPLOAD_PHASE_PREPARING
+    assert upload.work_orders == []
+    assert r2.requests == []
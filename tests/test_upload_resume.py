@@ -0,0 +1,102 @@
+import asyncio
+import os
+
+import pytest
+
+from transfer_manager.apis.r2_worker import AsyncR2Worker
+from transfer_manager.lib import journal
+from transfer_manager.lib.transfer import TRANSFER_STATUS_SUCCESS
+from transfer_manager.lib.upload.upload import Upload, UPLOAD_PHASE_DONE
+
+from helpers import wait_for
+from test_upload_stress import JOB_INFO, write_random_file
+
+FILE_SIZE = 8 * 1024 * 1024  # two parts
+
+
+def run_resumed_upload(tmp_path, r2, user_data, running_transfer_manager, rebuild: bool, keep_mtime: bool = True):
+    path = str(tmp_path / "package" / "package.zip")
+    data = write_random_file(path, FILE_SIZE)
+
+    async def scenario():
+        async with running_transfer_manager(upload_workers=1) as tm:
+            # the earlier run uploaded the first part before the transfer manager stopped
+            before = Upload(user_data, path, JOB_INFO, {})
+            await before.initialize()
+            await before.get_file_hash()
+            first = before.work_orders[0]
+            etag = await AsyncR2Worker.upload_multipart_part(
+                user_data, before.url, await before.get_upload_id(), first.part_number, data[:first.size]
+            )
+            state = before.to_journal()
+            before.get_file().close()
+            if not keep_mtime:
+                del state["file_mtime"]
+
+            if rebuild:
+                # a package of the same size with other bytes
+                write_random_file(path, FILE_SIZE, seed=1)
+                stat = os.stat(path)
+                os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+            upload = await Upload.from_journal(
+                state, {first.part_number: {"status": TRANSFER_STATUS_SUCCESS, "etag": etag}}
+            )
+            restored_parts = [wo.status for wo in upload.work_orders].count(TRANSFER_STATUS_SUCCESS)
+            tm.add(upload)
+            upload.start()
+            await wait_for(lambda: upload.phase == UPLOAD_PHASE_DONE)
+            return state, upload, restored_parts
+
+    return asyncio.run(scenario())
+
+
+def test_unchanged_package_keeps_its_parts(tmp_path, r2, user_data, running_transfer_manager):
+    state, upload, restored_parts = run_resumed_upload(
+        tmp_path, r2, user_data, running_transfer_manager, rebuild=False
+    )
+
+    assert restored_parts == 1
+    assert upload.status == TRANSFER_STATUS_SUCCESS
+    assert r2.objects[upload.url].data == write_random_file(str(tmp_path / "expected"), FILE_SIZE)
+
+
+@pytest.mark.parametrize("keep_mtime", [True, False], ids=["size and mtime", "hash"])
+def test_rebuilt_package_starts_over(tmp_path, r2, user_data, running_transfer_manager, keep_mtime):
+    state, upload, restored_parts = run_resumed_upload(
+        tmp_path, r2, user_data, running_transfer_manager, rebuild=True, keep_mtime=keep_mtime
+    )
+
+    assert restored_parts == 0
+    assert upload.status == TRANSFER_STATUS_SUCCESS
+    assert r2.objects[upload.url].data == write_random_file(str(tmp_path / "expected"), FILE_SIZE, seed=1)
+    # the multipart upload with the old bytes was aborted
+    assert state["upload_id"] not in r2.multipart_uploads
+    assert upload._upload_id != state["upload_id"]
+
+
+def test_journal_reset_drops_the_old_work_orders(tmp_path):
+    class Part:
+        journal_key = 1
+
+        def to_journal(self):
+            return {"status": TRANSFER_STATUS_SUCCESS}
+
+    class Started:
+        id = "upload"
+        type = "upload"
+        status = "running"
+
+        def to_journal(self):
+            return {"id": self.id}
+
+    async def scenario():
+        j = journal.Journal(str(tmp_path / "journal.sqlite"))
+        j.save(Started(), Part())
+        await j.flush()
+        j.reset("upload")
+        j.save(Started())
+        await j.flush()
+        return j.load()
+
+    assert asyncio.run(scenario()) == [("upload", {"id": "upload"}, {})]
@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import os
+import random
+import threading
+
+from transfer_manager.lib.upload.positional_file import PositionalFile
+from transfer_manager.lib.upload.upload import Upload, UPLOAD_PHASE_DONE
+from transfer_manager.lib.transfer import TRANSFER_STATUS_SUCCESS
+
+from helpers import wait_for
+
+UPLOAD_WORKERS = 8
+FILE_SIZE = 100 * 1024 * 1024 + 12345  # 17 parts with the smallest part size, the last one shorter
+
+JOB_INFO = {
+    "frame_start": 1,
+    "frame_end": 10,
+    "frame_step": 1,
+    "batch_size": 1,
+    "name": "stress",
+    "render_passes": {},
+    "render_format": "PNG",
+    "match_scene_format": False,
+    "render_engine": "CYCLES",
+    "blender_version": "4.2",
+    "blend_name": "scene.blend",
+    "max_thumbnail_size": 512,
+}
+
+
+def write_random_file(path: str, size: int, seed: int = 0) -> bytes:
+    data = random.Random(seed).randbytes(size)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return data
+
+
+def test_positional_reads_from_many_threads(tmp_path):
+    # every thread reads random ranges of the same PositionalFile, none of them may see bytes of another range
+    path = str(tmp_path / "data.bin")
+    data = write_random_file(path, 8 * 1024 * 1024)
+    file = PositionalFile(path)
+    errors = []
+
+    def reader(seed: int):
+        rng = random.Random(seed)
+        for _ in range(2000):
+            offset = rng.randrange(len(data))
+            size = rng.randrange(1, 256 * 1024)
+            try:
+                if bytes(file.read(offset, size)) != data[offset:offset + size]:
+                    errors.append((offset, size))
+            except Exception as ex:
+                errors.append((offset, size, ex))
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(UPLOAD_WORKERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    file.close()
+    assert errors == []
+
+
+def test_positional_reads_without_mapping(tmp_path, monkeypatch):
+    # files that can not be mapped are read with pread, which has no shared position either
+    path = str(tmp_path / "data.bin")
+    data = write_random_file(path, 1024 * 1024)
+
+    def no_mapping(*args, **kwargs):
+        raise OSError("can not map this file")
+
+    monkeypatch.setattr("mmap.mmap", no_mapping)
+    file = PositionalFile(path)
+    errors = []
+
+    def reader(seed: int):
+        rng = random.Random(seed)
+        for _ in range(500):
+            offset = rng.randrange(len(data))
+            size = rng.randrange(1, 64 * 1024)
+            try:
+                if bytes(file.read(offset, size)) != data[offset:offset + size]:
+                    errors.append((offset, size))
+            except Exception as ex:
+                errors.append((offset, size, ex))
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(UPLOAD_WORKERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    file.close()
+    assert errors == []
+
+
+def test_parallel_multipart_upload(tmp_path, r2, user_data, running_transfer_manager):
+    path = str(tmp_path / "package" / "package.zip")
+    data = write_random_file(path, FILE_SIZE)
+    r2.part_delay = 0.05  # keeps parts in flight long enough to overlap
+
+    async def scenario():
+        async with running_transfer_manager(upload_workers=UPLOAD_WORKERS) as tm:
+            upload = Upload(user_data, path, JOB_INFO, {})
+            await upload.initialize()
+            tm.add(upload)
+            upload.start()
+            await wait_for(lambda: upload.phase == UPLOAD_PHASE_DONE, timeout=120)
+            return upload
+
+    upload = asyncio.run(scenario())
+
+    assert upload.status == TRANSFER_STATUS_SUCCESS
+    assert len(upload.work_orders) >= UPLOAD_WORKERS
+    assert r2.max_uploads_in_flight >= 6
+
+    # every part has the bytes of its range, and the etag r2 returned for them
+    for wo in upload.work_orders:
+        expected = hashlib.md5(data[wo.offset:wo.offset + wo.size]).hexdigest()
+        assert wo.etag == {"partNumber": wo.part_number, "etag": expected}
+
+    stored = r2.objects[upload.url]
+    assert hashlib.md5(stored.data).hexdigest() == hashlib.md5(data).hexdigest()
+    assert len(r2.jobs) == 1
+    assert r2.jobs[0]["job_data"]["archive_size"] == FILE_SIZE
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from transfer_manager.apis.r2_worker_shared import get_url
+from transfer_manager.lib import retry_policy
+from transfer_manager.lib.transfer import TRANSFER_STATUS_RUNNING
+from transfer_manager.lib.upload.upload import Upload
+
+from helpers import wait_for
+from test_upload_stress import JOB_INFO, write_random_file
+
+
+@pytest.mark.parametrize("file_size", [1024 * 1024, 8 * 1024 * 1024], ids=["single", "multipart"])
+def test_stopped_worker_sends_nothing_while_the_circuit_is_open(
+        tmp_path, r2, user_data, running_transfer_manager, monkeypatch, file_size):
+    monkeypatch.setattr(retry_policy, "CIRCUIT_POLL_INTERVAL", 0.01)
+    path = str(tmp_path / "package" / "package.zip")
+    write_random_file(path, file_size)
+
+    async def scenario():
+        async with running_transfer_manager(upload_workers=1) as tm:
+            upload = Upload(user_data, path, JOB_INFO, {})
+            await upload.initialize()
+            await upload.get_upload_id()
+            breaker = tm.upload_queue.retry_policy.get_breaker(get_url(upload.url))
+            for _ in range(breaker.failure_threshold):
+                breaker.record_failure()
+
+            tm.add(upload)
+            upload.start()
+            await wait_for(lambda: upload.work_orders[0].status == TRANSFER_STATUS_RUNNING)
+            worker = tm.upload_queue.workers[0]
+            worker.stop()
+            await asyncio.wait_for(worker.task, 5)
+
+    asyncio.run(scenario())
+
+    assert [p for m, p, _ in r2.requests if m == "PUT"] == []
@@ -0,0 +1,75 @@
+from sanic import Request
+from sanic.response import json
+from typing import Optional
+from ..lib.transfer_manager import get_transfer_manager
+
+TRANSFER_TYPES = ("upload", "download")
+
+
+def _is_rate(value) -> bool:
+    # bytes per second, null removes a limit, 0 is rejected since it would not stop traffic (pause a transfer for that)
+    if value is None:
+        return True
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+
+
+def _is_time(value) -> bool:
+    # HH:MM local time
+    if not isinstance(value, str) or value.count(":") != 1:
+        return False
+    hours, minutes = value.split(":")
+    return hours.isdigit() and minutes.isdigit() and int(hours) < 24 and int(minutes) < 60
+
+
+def _validate_limits(args) -> Optional[str]:
+    # returns what is wrong with the request, nothing is changed unless all of it is valid
+    if not isinstance(args, dict):
+        return "body has to be a json object"
+    for transfer_type in TRANSFER_TYPES:
+        if transfer_type in args and not _is_rate(args[transfer_type]):
+            return f"{transfer_type} has to be null or a positive number of bytes per second"
+    transfers = args.get("transfers", {})
+    if not isinstance(transfers, dict):
+        return "transfers has to map transfer ids to rates"
+    for transfer_id, rate in transfers.items():
+        if not _is_rate(rate):
+            return f"limit of transfer {transfer_id} has to be null or a positive number of bytes per second"
+    schedule = args.get("schedule", [])
+    if not isinstance(schedule, list):
+        return "schedule has to be a list of entries"
+    for entry in schedule:
+        if not isinstance(entry, dict) or not _is_time(entry.get("start")) or not _is_time(entry.get("end")):
+            return "invalid schedule, entries need start and end as HH:MM"
+        for transfer_type in TRANSFER_TYPES:
+            if not _is_rate(entry.get(transfer_type)):
+                return f"{transfer_type} of a schedule entry has to be null or a positive number of bytes per second"
+    return None
+
+
+async def get_limits(request: Request):
+    return json(get_transfer_manager().bandwidth_limiter.to_dict())
+
+
+async def set_limits(request: Request):
+    # all keys are optional, rates are bytes per second and null removes a limit
+    args = request.json
+    error = _validate_limits(args)
+    if error is not None:
+        return json(error, status=400)
+
+    tm = get_transfer_manager()
+    limiter = tm.bandwidth_limiter
+
+    for transfer_id in args.get("transfers", {}):
+        if tm.get(transfer_id) is None:
+            return json(f"transfer {transfer_id} doesnt exist", status=404)
+
+    if "schedule" in args:
+        limiter.set_schedule(args["schedule"])
+    for transfer_type in TRANSFER_TYPES:
+        if transfer_type in args:
+            limiter.set_limit(transfer_type, args[transfer_type])
+    for transfer_id, rate in args.get("transfers", {}).items():
+        limiter.set_transfer_limit(transfer_id, rate)
+
+    return json(limiter.to_dict())
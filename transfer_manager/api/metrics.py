@@ -0,0 +1,30 @@
+from ..lib.transfer_manager import get_transfer_manager
+from ..lib.metrics import Metrics
+from ..apis.http_pool import HttpPool
+from sanic.response import text
+
+
+async def metrics(request):
+    tm = get_transfer_manager()
+
+    transfer_speeds = {}
+    transfer_counts = {}
+    for transfer in tm.transfers.values():
+        transfer_speeds[(transfer.id, transfer.type)] = transfer.speed.get_rate()
+        key = (transfer.type, transfer.status)
+        transfer_counts[key] = transfer_counts.get(key, 0) + 1
+
+    queue_workers = {}
+    queue_throughput = {}
+    for queue in (tm.download_queue, tm.upload_queue):
+        queue_workers[(queue.transfer_type,)] = len(queue.workers)
+        queue_throughput[(queue.transfer_type,)] = queue.get_throughput()
+
+    gauges = [
+        ("tm_transfer_bytes_per_second", "bytes per second of a transfer over the last seconds", ("id", "type"), transfer_speeds),
+        ("tm_transfers", "transfers by type and status", ("type", "status"), transfer_counts),
+        ("tm_queue_workers", "workers of a queue", ("type",), queue_workers),
+        ("tm_queue_bytes_per_second", "combined speed of the workers of a queue", ("type",), queue_throughput),
+        ("tm_http_open_connections", "open connections of the shared pool", (), {(): HttpPool.to_dict()["open_connections"]}),
+    ]
+    return text(Metrics.render(gauges), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,4 +1,7 @@
 from ..lib.transfer_manager import get_transfer_manager
+from ..lib.scheduler import SCHEDULERS
+from ..apis.http_pool import HttpPool
+from sanic import Request
 from sanic.response import json
 
 
@@ -15,6 +18,25 @@ async def queues(request):
     data = {
         "download": download_workers,
         "upload": upload_workers,
+        "queues": {
+            "download": tm.download_queue.to_dict(),
+            "upload": tm.upload_queue.to_dict(),
+        },
+        "http_pool": HttpPool.to_dict(),
     }
 
     return json(data)
+
+
+async def set_queue_scheduler(request: Request, transfer_type: str):
+    if transfer_type not in ("upload", "download"):
+        return json(f"unknown queue {transfer_type}", status=404)
+    args = request.json
+    if not isinstance(args, dict):
+        return json("body has to be a json object", status=400)
+    name = args.get("scheduler")
+    if not isinstance(name, str) or name not in SCHEDULERS:
+        return json(f"unknown scheduler {name}, use one of {', '.join(SCHEDULERS)}", status=400)
+    queue = get_transfer_manager().get_queue(transfer_type)
+    queue.set_scheduler(name)
+    return json(queue.to_dict())
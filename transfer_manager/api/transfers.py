@@ -13,10 +13,17 @@ from ..lib.version import version
 from sanic.log import logger
 import filedialpy
 import os
+import time
 import asyncio
 
+STREAM_INTERVAL = 0.5  # seconds, the stream sends at most one update per interval
+STREAM_KEEPALIVE_INTERVAL = 15  # seconds without changes before the stream sends a comment to keep the connection open
+HISTORY_PAGE_SIZE = 20
+FILES_PAGE_SIZE = 500
+
 
 async def create_upload(request: Request):
+    submitted_at = time.time()
     args = request.json
     local_file_path = args["local_file_path"]
     if not os.path.exists(local_file_path):
@@ -26,7 +33,9 @@ async def create_upload(request: Request):
         local_file_path,
         args["job_information"],
         args["metadata"],
+        dedup=args.get("dedup", False),
     )
+    upload.submitted_at = submitted_at
     await upload.initialize()
     get_transfer_manager().add(upload)
     upload.start()
@@ -34,6 +43,7 @@ async def create_upload(request: Request):
 
 
 async def create_download(request: Request):
+    submitted_at = time.time()
     args = request.json
     local_dir_path = args.get('local_dir_path', None)
     if local_dir_path is None:
@@ -43,6 +53,7 @@ async def create_download(request: Request):
         local_dir_path = await asyncio.to_thread(ask_for_dir)
 
     download = Download(request.ctx.user_data, local_dir_path, args["job_id"], args["metadata"])
+    download.submitted_at = submitted_at
     await download.initialize()
     get_transfer_manager().add(download)
     download.start()
@@ -56,6 +67,69 @@ async def get_all_transfers(request: Request):
     return json(response, dumps=json_dumps)
 
 
+async def get_transfers_delta(request: Request):
+    # transfers and work orders that changed after the version the client got with its last response
+    try:
+        since = int(request.args.get("since", 0))
+    except ValueError:
+        return json("since has to be a version number", status=400)
+    return json(get_transfer_manager().get_delta(since), dumps=json_dumps)
+
+
+async def stream_transfers(request: Request):
+    # server sent events with the same deltas, a reconnecting event source continues at its last event id
+    try:
+        since = int(request.headers.get("Last-Event-ID", request.args.get("since", 0)))
+    except ValueError:
+        since = 0
+    response = await request.respond(
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+    tm = get_transfer_manager()
+    sent_at = time.monotonic()
+    first = True
+    while True:
+        delta = tm.get_delta(since)
+        if first or len(delta["transfers"]) > 0 or len(delta["removed"]) > 0 or (delta["full"] and since > 0):
+            first = False
+            since = delta["version"]
+            await response.send(f"id: {since}\ndata: {json_dumps(delta)}\n\n")
+            sent_at = time.monotonic()
+        elif time.monotonic() - sent_at > STREAM_KEEPALIVE_INTERVAL:
+            await response.send(": keepalive\n\n")
+            sent_at = time.monotonic()
+        await asyncio.sleep(STREAM_INTERVAL)
+
+
+async def get_work_order_history(request: Request, id: str, key: int):
+    transfer = get_transfer_manager().get(id)
+    if transfer is None:
+        return json(None, status=404)
+    work_order = transfer.get_work_order(key)
+    if work_order is None:
+        return json(None, status=404)
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", HISTORY_PAGE_SIZE))
+    except ValueError:
+        return json("offset and limit have to be numbers", status=400)
+    return json(work_order.get_history(max(offset, 0), max(limit, 0)), dumps=json_dumps)
+
+
+async def get_transfer_files(request: Request, id: str):
+    # every file of a download, the transfer itself only lists the files that have a work order
+    transfer = get_transfer_manager().get(id)
+    if not isinstance(transfer, Download):
+        return json(None, status=404)
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", FILES_PAGE_SIZE))
+    except ValueError:
+        return json("offset and limit have to be numbers", status=400)
+    return json(transfer.get_files(max(offset, 0), min(max(limit, 0), FILES_PAGE_SIZE)), dumps=json_dumps)
+
+
 async def get_transfer(request: Request, id: str):
     transfers = get_transfer_manager().transfers
     if id in transfers:
@@ -85,3 +159,18 @@ async def set_transfer_status(request: Request, id: str):
     else:
         return json(f"unsupported status {status}", status=400)
     return json(True)
+
+
+async def set_transfer_priority(request: Request, id: str):
+    # higher priorities get a bigger share of the workers, how exactly depends on the scheduler of the queue
+    transfer = get_transfer_manager().get(id)
+    if transfer is None:
+        return json(False, status=404)
+    args = request.json
+    if not isinstance(args, dict):
+        return json("body has to be a json object", status=400)
+    priority = args.get("priority")
+    if not isinstance(priority, int) or isinstance(priority, bool) or priority < 1:
+        return json("priority has to be a number of at least 1", status=400)
+    transfer.set_priority(priority)
+    return json(True)
@@ -0,0 +1,222 @@
+import asyncio
+import contextlib
+import socket
+import time
+import typing
+import httpx
+import httpcore
+
+MAX_CONNECTIONS = 64  # enough for the worker ceilings of both queues plus api calls
+MAX_KEEPALIVE_CONNECTIONS = 48
+KEEPALIVE_EXPIRY = 60  # seconds, workers pause between work orders, keep the handshake around for longer than that
+DNS_CACHE_TTL = 300  # seconds
+
+# http/2 multiplexes all requests to a host over a single connection, which is great for thousands of small files
+# but caps bulk uploads at what one tcp connection can do, so it is opt in and needs the h2 package
+USE_HTTP2 = False
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class _CachingNetworkBackend(httpcore.AsyncNetworkBackend):
+    """
+    resolves host names once per ttl instead of once per connection, and counts the connections that get opened
+    tls still uses the host name for sni and certificate checks, only the tcp connect goes to the cached address
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend):
+        self._backend = backend
+        self._addresses: typing.Dict[typing.Tuple[str, int], typing.Tuple[str, float]] = {}
+        self.connections_opened = 0
+
+    async def _resolve(self, host: str, port: int) -> str:
+        key = (host, port)
+        cached = self._addresses.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        address = infos[0][4][0]
+        self._addresses[key] = (address, time.monotonic() + DNS_CACHE_TTL)
+        return address
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        self.connections_opened += 1
+        address = await self._resolve(host, port)
+        try:
+            return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+        except Exception:
+            # address might be stale, resolve again on the next connect
+            self._addresses.pop((host, port), None)
+            raise
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+# httpcore errors and the httpx errors the rest of the transfer manager expects, the most specific match wins
+_ERRORS = [
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.ProxyError, httpx.ProxyError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.ProtocolError, httpx.ProtocolError),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+]
+
+
+@contextlib.contextmanager
+def _map_errors():
+    try:
+        yield
+    except Exception as ex:
+        mapped = None
+        for from_error, to_error in _ERRORS:
+            if isinstance(ex, from_error) and (mapped is None or issubclass(to_error, mapped)):
+                mapped = to_error
+        if mapped is None:
+            raise
+        raise mapped(str(ex)) from ex
+
+
+class _ResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream: typing.AsyncIterable[bytes]):
+        self._stream = stream
+
+    async def __aiter__(self) -> typing.AsyncIterator[bytes]:
+        with _map_errors():
+            async for part in self._stream:
+                yield part
+
+    async def aclose(self):
+        if hasattr(self._stream, "aclose"):
+            await self._stream.aclose()
+
+
+class _PooledTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport on a httpcore pool that uses our network backend, httpx itself does not take one,
+    only the public apis of both are used so an update of either does not break the shared pool
+    """
+
+    def __init__(self, network_backend: httpcore.AsyncNetworkBackend, http2: bool, limits: httpx.Limits):
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http1=True,
+            http2=http2,
+            network_backend=network_backend,
+        )
+
+    @property
+    def connections(self):
+        return self._pool.connections
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with _map_errors():
+            response = await self._pool.handle_async_request(core_request)
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=_ResponseStream(response.stream),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        await self._pool.aclose()
+
+
+class HttpPool:
+    """
+    one connection pool for all requests of the transfer manager, uploads, downloads and sarfis calls
+    """
+
+    client: httpx.AsyncClient = None
+    transport: _PooledTransport = None
+    network_backend: _CachingNetworkBackend = None
+    requests = 0
+
+    @classmethod
+    async def _on_request(cls, request: httpx.Request):
+        cls.requests += 1
+
+    @classmethod
+    def get_client(cls) -> httpx.AsyncClient:
+        if cls.client is None:
+            cls.network_backend = _CachingNetworkBackend(httpcore.AnyIOBackend())
+            cls.transport = _PooledTransport(
+                cls.network_backend,
+                http2=USE_HTTP2 and _http2_available(),
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+            )
+            cls.client = httpx.AsyncClient(
+                transport=cls.transport,
+                timeout=httpx.Timeout(10.0, read=60.0),
+                event_hooks={"request": [cls._on_request]},
+            )
+        return cls.client
+
+    @classmethod
+    async def warm_up(cls, url: str, connections: int):
+        # opens connections to the host of url ahead of time, requests that run at the same time need their own
+        client = cls.get_client()
+        request_url = httpx.URL(url)
+        origin = httpcore.Origin(request_url.raw_scheme, request_url.raw_host, request_url.port or (443 if request_url.scheme == "https" else 80))
+        idle = [c for c in cls.transport.connections if c.is_idle() and c.can_handle_request(origin)]
+        needed = connections - len(idle)
+        if needed <= 0:
+            return
+        # the response does not matter, only the handshake, errors surface again on the real requests
+        await asyncio.gather(*[client.head(url) for _ in range(needed)], return_exceptions=True)
+
+    @classmethod
+    async def close(cls):
+        if cls.client is not None:
+            await cls.client.aclose()
+            cls.client = None
+            cls.transport = None
+
+    @classmethod
+    def to_dict(cls):
+        opened = cls.network_backend.connections_opened if cls.network_backend is not None else 0
+        return {
+            "http2": cls.client is not None and USE_HTTP2 and _http2_available(),
+            "open_connections": len(cls.transport.connections) if cls.transport is not None else 0,
+            "requests": cls.requests,
+            "connections_opened": opened,
+            "reuse_ratio": 1 - opened / cls.requests if cls.requests > 0 else 0,
+        }
@@ -2,17 +2,28 @@ import httpx
 from httpx._types import RequestContent
 from ..lib.user_data import UserData
 from .r2_worker_shared import R2UploadedPart, R2UploadInfo, get_url, ensure_ok
+from .http_pool import HttpPool
+from ..lib.metrics import Metrics
 from sanic.log import logger
+import time
 
+# names of the storage worker actions in the request metrics
+ACTION_OPERATIONS = {
+    "mpu-create": "create",
+    "mpu-uploadpart": "upload_part",
+    "mpu-complete": "complete",
+    "mpu-abort": "abort",
+    "single-upload": "single_upload",
+    "get": "get",
+    "delete": "delete",
+    "blobs-missing": "blobs_missing",
+}
 
-class AsyncR2Worker:
-    client = None
 
+class AsyncR2Worker:
     @classmethod
     def get_client(cls) -> httpx.AsyncClient:
-        if cls.client is None:
-            cls.client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=60.0))
-        return cls.client
+        return HttpPool.get_client()
 
     @classmethod
     async def request(cls, user_data: UserData, method: str, url: str, **kwargs):
@@ -20,7 +31,12 @@ class AsyncR2Worker:
         client = cls.get_client()
         headers = {'authentication': user_data.api_token}
         # logger.debug(f"r2 request to {method} {url} with headers {headers} and kwargs {kwargs}")
-        response = await client.request(method, url, headers=headers, **kwargs)
+        operation = ACTION_OPERATIONS.get(kwargs.get("params", {}).get("action"), "other")
+        start = time.monotonic()
+        try:
+            response = await client.request(method, url, headers=headers, **kwargs)
+        finally:
+            Metrics.observe("tm_request_duration_seconds", time.monotonic() - start, (operation,))
         return ensure_ok(response)
 
     @classmethod
@@ -59,6 +75,17 @@ class AsyncR2Worker:
             "action": "single-upload"
         }, content=body)
 
+    @classmethod
+    async def get_missing_blobs(cls, user_data: UserData, prefix: str, hashes: list[str]) -> list[str]:
+        # which of the content addressed blobs under the prefix are not stored yet
+        url = get_url(prefix)
+        response = await cls.request(user_data, 'POST', url, params={
+            "action": "blobs-missing"
+        }, json={
+            "hashes": hashes
+        })
+        return response.json()["missing"]
+
     @classmethod
     async def abort_multipart_upload(cls, user_data: UserData, path: str, upload_id: str):
         url = get_url(path)
@@ -29,7 +29,15 @@ class R2UploadInfo(TypedDict):
     uploadId: str
 
 
+class HttpStatusException(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
 def ensure_ok(response: Response):
     if response.status_code < 200 or response.status_code > 299:
-        raise Exception(f"response had non OK status code {response.status_code}: {response.content}")
+        raise HttpStatusException(
+            response.status_code, f"response had non OK status code {response.status_code}: {response.content}"
+        )
     return response
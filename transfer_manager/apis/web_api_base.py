@@ -2,16 +2,13 @@ import httpx
 import asyncio
 import random
 from traceback import print_exc
+from .http_pool import HttpPool
 
 
 class WebApiBase:
-    client = None
-
     @classmethod
     def get_client(cls) -> httpx.AsyncClient:
-        if cls.client is None:
-            cls.client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=60.0))
-        return cls.client
+        return HttpPool.get_client()
 
     @classmethod
     async def request_with_retries(cls, method: str, url: str, **kwargs):
@@ -0,0 +1,151 @@
+"""
+cost of handing out work orders to workers with 10k queued work orders, scanning all transfers against the ready queue
+
+run from the repository root with: python -m transfer_manager.benchmarks.dispatch
+"""
+from typing import List, Optional
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from ..lib.concurrency_controller import ConcurrencyController
+from ..lib.rate_limiter import BandwidthLimiter
+from ..lib.scheduler import SCHEDULERS
+from ..lib.transfer import TRANSFER_STATUS_CREATED, TRANSFER_STATUS_RUNNING
+from ..lib.transfer_queue import TransferQueue
+from ..lib.upload.upload import Upload
+from ..lib.upload.upload_work_order import UploadWorkOrder
+from ..lib.user_data import UserData
+from .transfers_json import percentile
+
+PART_SIZE = 5 * 1024 * 1024
+LEGACY_POLL_INTERVAL = 1  # seconds an idle worker slept before it asked for work again
+
+
+def make_uploads(local_file_path: str, transfer_count: int, work_order_count: int) -> List[Upload]:
+    user_data = UserData("http://localhost", "token", "token")
+    uploads = []
+    for i in range(transfer_count):
+        upload = Upload(user_data, local_file_path, {"name": "bench"}, {})
+        upload.status = TRANSFER_STATUS_RUNNING
+        part_count = work_order_count // transfer_count + (i < work_order_count % transfer_count)
+        for part in range(part_count):
+            upload.add_work_order(UploadWorkOrder(part * PART_SIZE, PART_SIZE, part + 1, upload, False))
+        uploads.append(upload)
+    return uploads
+
+
+def legacy_next_work_order(transfers: List[Upload]) -> Optional[UploadWorkOrder]:
+    # what TransferQueue.get_next_work_order did before the ready queues, a scan over every transfer and work order
+    for transfer in transfers:
+        if transfer.status == TRANSFER_STATUS_RUNNING:
+            for wo in transfer.work_orders:
+                if wo.status == TRANSFER_STATUS_CREATED:
+                    wo.status = TRANSFER_STATUS_RUNNING
+                    return wo
+    return None
+
+
+def make_queue(scheduler: str) -> TransferQueue:
+    # no workers, the benchmark asks for the work orders itself
+    return TransferQueue(
+        "upload", None, ConcurrencyController(min_workers=0), BandwidthLimiter(), SCHEDULERS[scheduler]()
+    )
+
+
+def drain_legacy(transfers: List[Upload], count: int) -> List[float]:
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        wo = legacy_next_work_order(transfers)
+        timings.append(time.perf_counter() - start)
+        assert wo is not None
+    return timings
+
+
+async def drain(queue: TransferQueue, transfers: List[Upload], count: int) -> List[float]:
+    for transfer in transfers:
+        queue.add_transfer(transfer)
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        wo = await queue.get_next_work_order()
+        timings.append(time.perf_counter() - start)
+        assert wo is not None
+    return timings
+
+
+async def wake_up_legacy(transfers: List[Upload]) -> float:
+    # an idle worker polls, the work arrives at some point of its sleep
+    found = asyncio.get_running_loop().create_future()
+
+    async def worker():
+        while True:
+            wo = legacy_next_work_order(transfers)
+            if wo is not None:
+                found.set_result(time.perf_counter())
+                return
+            await asyncio.sleep(LEGACY_POLL_INTERVAL)
+
+    for transfer in transfers:
+        transfer.status = TRANSFER_STATUS_CREATED
+    task = asyncio.create_task(worker())
+    await asyncio.sleep(random.uniform(0.01, LEGACY_POLL_INTERVAL))
+    start = time.perf_counter()
+    for transfer in transfers:
+        transfer.status = TRANSFER_STATUS_RUNNING
+    await task
+    return found.result() - start
+
+
+async def wake_up(queue: TransferQueue, transfers: List[Upload]) -> float:
+    task = asyncio.create_task(queue.get_next_work_order(timeout=10))
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    queue.add_transfer(transfers[0])
+    await task
+    return time.perf_counter() - start
+
+
+def report(name: str, timings: List[float], wake_ups: List[float]):
+    print(f"{name:>38}: drain {sum(timings) * 1000:8.1f} ms"
+          f"  p50 {statistics.median(timings) * 1e6:7.1f} us  p99 {percentile(timings, 0.99) * 1e6:8.1f} us"
+          f"  wake up {statistics.median(wake_ups) * 1000:7.2f} ms")
+
+
+async def run(args, local_file_path: str):
+    print(f"{args.work_orders} work orders in {args.transfers} transfers")
+
+    timings = drain_legacy(make_uploads(local_file_path, args.transfers, args.work_orders), args.work_orders)
+    wake_ups = [await wake_up_legacy(make_uploads(local_file_path, 1, 1)) for _ in range(args.legacy_wake_ups)]
+    report("scan (before)", timings, wake_ups)
+
+    for scheduler in SCHEDULERS:
+        uploads = make_uploads(local_file_path, args.transfers, args.work_orders)
+        timings = await drain(make_queue(scheduler), uploads, args.work_orders)
+        wake_ups = []
+        for _ in range(args.wake_ups):
+            wake_ups.append(await wake_up(make_queue(scheduler), make_uploads(local_file_path, 1, 1)))
+        report(f"ready queue, {scheduler}", timings, wake_ups)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--work-orders", type=int, default=10000)
+    parser.add_argument("--transfers", type=int, default=10)
+    parser.add_argument("--wake-ups", type=int, default=100)
+    parser.add_argument("--legacy-wake-ups", type=int, default=10, help="each one takes up to a poll interval")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        package = os.path.join(tmp, "package.zip")
+        open(package, "wb").close()
+        asyncio.run(run(args, package))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+memory and latency of a download with 120k files, work orders created up front against created when a worker asks
+
+run from the repository root with: python -m transfer_manager.benchmarks.download_files
+"""
+from typing import List
+import argparse
+import gc
+import statistics
+import time
+import tracemalloc
+
+from ..lib.download.download import Download, DownloadOutput
+from ..lib.download.download_work_order import DownloadWorkOrder
+from ..lib.transfer import TRANSFER_STATUS_CREATED, TRANSFER_STATUS_RUNNING, TRANSFER_STATUS_SUCCESS
+from ..lib.user_data import UserData
+from .transfers_json import percentile
+
+IN_FLIGHT = 64  # files a busy download queue has in flight at the same time
+
+
+def make_download(outputs: int, frames: int) -> Download:
+    # what initialize gets from the job details, outputs x frames files
+    download = Download(UserData("http://localhost", "token", "token"), ".", "job", {})
+    download.outputs = [DownloadOutput(f"ViewLayer/AOV{i}", "exr") for i in range(outputs - 1)]
+    download.outputs.append(DownloadOutput("", "exr"))
+    download.frame_start = 1
+    download.frame_count = frames
+    download.file_count = outputs * frames
+    download.progress.set_total(download.file_count)
+    download.status = TRANSFER_STATUS_RUNNING
+    download.save_state = lambda work_order=None: None  # no journal, the benchmark has no transfer manager
+    return download
+
+
+def legacy_update(download: Download, work_orders: List[DownloadWorkOrder]):
+    # what Download.update did before the counters, a scan over every file after each finished file
+    finished_files = 0
+    running_or_created_files = 0
+    for f in work_orders:
+        if f.status == TRANSFER_STATUS_SUCCESS:
+            finished_files += 1
+        elif f.status in [TRANSFER_STATUS_RUNNING, TRANSFER_STATUS_CREATED]:
+            running_or_created_files += 1
+    download.progress.set_done(finished_files)
+
+
+def measure_memory(build) -> float:
+    # bytes that stay allocated after build, which keeps what it returns alive
+    gc.collect()
+    tracemalloc.start()
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def build_eager(outputs: int, frames: int):
+    # how initialize built every work order before, with today's slotted work orders so it only shows the laziness
+    download = make_download(outputs, frames)
+    return download, [download._create_work_order(number) for number in range(download.file_count)]
+
+
+def build_lazy(outputs: int, frames: int):
+    download = make_download(outputs, frames)
+    return download, [download.pop_pending_work_order() for _ in range(IN_FLIGHT)]
+
+
+def finish_files_eager(outputs: int, frames: int, count: int) -> List[float]:
+    download, work_orders = build_eager(outputs, frames)
+    timings = []
+    for work_order in work_orders[:count]:
+        start = time.perf_counter()
+        work_order.status = TRANSFER_STATUS_SUCCESS
+        legacy_update(download, work_orders)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def finish_files_lazy(outputs: int, frames: int, count: int) -> List[float]:
+    # a worker takes the next file, finishes it and updates the download
+    download = make_download(outputs, frames)
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        work_order = download.pop_pending_work_order()
+        work_order.status = TRANSFER_STATUS_RUNNING
+        work_order.status = TRANSFER_STATUS_SUCCESS
+        download.update()
+        timings.append(time.perf_counter() - start)
+    assert download.status == TRANSFER_STATUS_SUCCESS or count < download.file_count
+    return timings
+
+
+def report(name: str, setup: float, memory: float, timings: List[float]):
+    print(f"{name:>10}: setup {setup * 1000:8.1f} ms  memory {memory / 1024 / 1024:7.1f} MB"
+          f"  per file p50 {statistics.median(timings) * 1e6:8.1f} us  p99 {percentile(timings, 0.99) * 1e6:8.1f} us"
+          f"  {len(timings)} files in {sum(timings):.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--outputs", type=int, default=12, help="render pass outputs, the main output included")
+    parser.add_argument("--frames", type=int, default=10000)
+    parser.add_argument("--eager-files", type=int, default=200, help="files finished up front, each one rescans all")
+    args = parser.parse_args()
+    file_count = args.outputs * args.frames
+    print(f"{file_count} files, {args.outputs} outputs x {args.frames} frames")
+
+    for name, build in [("up front", build_eager), ("lazy", build_lazy)]:
+        start = time.perf_counter()
+        build(args.outputs, args.frames)
+        setup = time.perf_counter() - start
+        memory = measure_memory(lambda: build(args.outputs, args.frames))
+        if build is build_eager:
+            timings = finish_files_eager(args.outputs, args.frames, args.eager_files)
+        else:
+            timings = finish_files_lazy(args.outputs, args.frames, file_count)
+        report(name, setup, memory, timings)
+
+
+if __name__ == "__main__":
+    main()
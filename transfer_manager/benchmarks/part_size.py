@@ -0,0 +1,127 @@
+"""
+upload throughput at several multipart part sizes, against the local storage stand-in of the tests
+
+on loopback the stand-in is bound by cpu, --part-delay stands in for the round trip every part pays on a real link
+and --rate for a slow link
+
+run from the repository root with: python -m transfer_manager.benchmarks.part_size
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from ..apis import r2_worker_shared
+from ..lib import journal, transfer_manager as transfer_manager_module
+from ..lib.concurrency_controller import ConcurrencyController
+from ..lib.download import download as download_module
+from ..lib.transfer import TRANSFER_STATUS_SUCCESS
+from ..lib.transfer_manager import TransferManager
+from ..lib.upload import upload as upload_module
+from ..lib.upload.upload import Upload, UPLOAD_PHASE_DONE
+from ..lib.user_data import UserData
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "tests"))
+from r2_stand_in import R2StandIn  # noqa: E402
+
+MB = 1024 * 1024
+PART_SIZES = [5 * MB, 8 * MB, 16 * MB, 32 * MB, 64 * MB, 128 * MB]
+
+JOB_INFO = {
+    "frame_start": 1,
+    "frame_end": 1,
+    "frame_step": 1,
+    "batch_size": 1,
+    "name": "bench",
+    "render_passes": {},
+    "render_format": "PNG",
+    "match_scene_format": False,
+    "render_engine": "CYCLES",
+    "blender_version": "4.2",
+    "blend_name": "scene.blend",
+    "max_thumbnail_size": 512,
+}
+
+
+def write_package(path: str, size: int):
+    # the upload deletes the directory of its package when it is done
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    block = os.urandom(MB)
+    with open(path, "wb") as f:
+        for offset in range(0, size, MB):
+            f.write(block[:min(MB, size - offset)])
+
+
+async def upload_once(tm: TransferManager, server: R2StandIn, path: str) -> Upload:
+    upload = Upload(UserData(server.url, "token", "token"), path, JOB_INFO, {})
+    await upload.initialize()
+    tm.add(upload)
+    upload.start()
+    while upload.phase != UPLOAD_PHASE_DONE:
+        await asyncio.sleep(0.01)
+    return upload
+
+
+async def run(server: R2StandIn, tmp: str, args):
+    # one transfer manager for all sizes, the upload that picks its part size uses the speed measured before it
+    tm = TransferManager()
+    transfer_manager_module._transfer_manager = tm
+    tm.upload_queue.controller = ConcurrencyController(min_workers=args.workers, max_workers=args.workers)
+    tm.upload_queue._scale()
+    tm.bandwidth_limiter.set_limit("upload", args.rate * MB if args.rate else None)
+    get_part_size = upload_module.get_part_size
+    try:
+        for part_size in PART_SIZES + [None]:
+            path = os.path.join(tmp, "package", "package.zip")
+            write_package(path, args.size * MB)
+            if part_size is not None:
+                upload_module.get_part_size = lambda file_size, worker_speed: part_size
+            else:
+                upload_module.get_part_size = get_part_size
+            start = time.perf_counter()
+            upload = await upload_once(tm, server, path)
+            duration = time.perf_counter() - start
+            assert upload.status == TRANSFER_STATUS_SUCCESS
+            name = "picked" if part_size is None else f"{part_size // MB} MB"
+            print(f"{name:>8}: {len(upload.work_orders):5} parts of {upload.part_size / MB:6.1f} MB"
+                  f"  {duration:6.2f} s  {args.size / duration:7.1f} MB/s")
+            server.objects.clear()
+    finally:
+        upload_module.get_part_size = get_part_size
+        workers = tm.upload_queue.workers + tm.download_queue.workers
+        for worker in workers:
+            worker.stop()
+        await asyncio.gather(*[w.task for w in workers], return_exceptions=True)
+        await tm.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=512, help="package size in MB")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--part-delay", type=float, default=0.05, help="seconds the stand-in holds every part")
+    parser.add_argument("--rate", type=float, default=0, help="upload limit in MB/s, 0 for none")
+    args = parser.parse_args()
+
+    server = R2StandIn()
+    server.part_delay = args.part_delay
+    server.start()
+    # the same patches the tests apply, the endpoint was taken by value and the journal goes to a temp dir
+    for module in (r2_worker_shared, download_module, upload_module):
+        module.R2_WORKER_ENDPOINT = server.url
+    upload_module.webbrowser.open = lambda *a, **kw: True
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            journal.get_data_dir = lambda: tmp
+            journal.LEGACY_JOURNAL_FILE_PATH = os.path.join(tmp, "legacy_journal.sqlite")
+            print(f"{args.size} MB with {args.workers} workers, {args.part_delay * 1000:.0f} ms per part"
+                  + (f", limited to {args.rate} MB/s" if args.rate else ""))
+            asyncio.run(run(server, tmp, args))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+latency of the /transfers response on a synthetic transfer manager with 50k work orders, per json backend
+
+run from the repository root with: python -m transfer_manager.benchmarks.transfers_json
+"""
+from typing import Callable, List
+import argparse
+import dataclasses
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from ..lib import json_dumps as json_dumps_module
+from ..lib.download.download import Download, DownloadOutput
+from ..lib.json_dumps import set_json_backend
+from ..lib.transfer import TRANSFER_STATUS_RUNNING, TRANSFER_STATUS_SUCCESS
+from ..lib.upload.upload import Upload
+from ..lib.upload.upload_work_order import UploadWorkOrder
+from ..lib.user_data import UserData
+
+PART_SIZE = 5 * 1024 * 1024
+
+
+class LegacyJSONEncoder(json.JSONEncoder):
+    # the encoder before json backends, checks every object for being a dataclass
+    def default(self, o):
+        if dataclasses.is_dataclass(o):
+            return dataclasses.asdict(o)
+        if hasattr(o, 'to_dict'):
+            return o.to_dict()
+        return super().default(o)
+
+
+def make_download(user_data: UserData, local_dir_path: str, file_count: int) -> Download:
+    download = Download(user_data, local_dir_path, "job", {})
+    download.outputs = [DownloadOutput("", "exr")]
+    download.frame_start = 1
+    download.frame_count = file_count
+    download.file_count = file_count
+    download.progress.set_total(file_count)
+    download.status = TRANSFER_STATUS_RUNNING
+    while download.pop_pending_work_order() is not None:
+        pass
+    for i, work_order in enumerate(download.work_orders.values()):
+        work_order.progress.set_done_total(i % 1000, 1000)
+    return download
+
+
+def make_upload(user_data: UserData, local_file_path: str, part_count: int) -> Upload:
+    upload = Upload(user_data, local_file_path, {"name": "bench"}, {})
+    upload.file_size = part_count * PART_SIZE
+    upload.part_size = PART_SIZE
+    upload.status = TRANSFER_STATUS_RUNNING
+    upload.work_orders = [
+        UploadWorkOrder(i * PART_SIZE, PART_SIZE, i + 1, upload, False) for i in range(part_count)
+    ]
+    for i, work_order in enumerate(upload.work_orders):
+        work_order.progress.set_done_total(PART_SIZE if i % 2 else 0, PART_SIZE)
+        if i % 2:
+            work_order.status = TRANSFER_STATUS_SUCCESS
+    return upload
+
+
+def get_all_transfers(transfers: list, dumps: Callable) -> str:
+    # what the handler of /transfers does
+    return dumps([transfer.to_dict() for transfer in transfers])
+
+
+def parse(response: str) -> list:
+    # the age of a transfer changes between two responses
+    transfers = json.loads(response)
+    for transfer in transfers:
+        del transfer["age"]
+    return transfers
+
+
+def measure(transfers: list, dumps: Callable, runs: int) -> List[float]:
+    get_all_transfers(transfers, dumps)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        get_all_transfers(transfers, dumps)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def percentile(timings: List[float], p: float) -> float:
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--work-orders", type=int, default=50000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    user_data = UserData("http://localhost", "token", "token")
+    with tempfile.TemporaryDirectory() as tmp:
+        package = os.path.join(tmp, "package.zip")
+        open(package, "wb").close()
+        # two downloads and an upload, the way a render farm user ends up with many work orders
+        parts = args.work_orders // 5
+        files = (args.work_orders - parts) // 2
+        transfers = [
+            make_download(user_data, tmp, files),
+            make_download(user_data, tmp, args.work_orders - parts - files),
+            make_upload(user_data, package, parts),
+        ]
+        expected = parse(get_all_transfers(transfers, lambda o: json.dumps(o, cls=LegacyJSONEncoder)))
+
+        candidates = [("legacy encoder", lambda o: json.dumps(o, cls=LegacyJSONEncoder))]
+        for name in json_dumps_module.JSON_BACKENDS:
+            try:
+                set_json_backend(name)
+            except ImportError:
+                print(f"{name}: not installed")
+                continue
+            candidates.append((name, json_dumps_module._dumps))
+
+        print(f"/transfers with {args.work_orders} work orders, {args.runs} runs")
+        for name, dumps in candidates:
+            assert parse(get_all_transfers(transfers, dumps)) == expected
+            timings = measure(transfers, dumps, args.runs)
+            print(f"{name:>16}: p50 {statistics.median(timings) * 1000:7.1f} ms"
+                  f"  p99 {percentile(timings, 0.99) * 1000:7.1f} ms")
+        set_json_backend(json_dumps_module.JSON_BACKENDS[0])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+class ChangeVersion:
+    """
+    counter that goes up with every change of a transfer, a work order or a progress
+
+    everything remembers the version of its last change, so clients can ask for what changed since the
+    version they saw last instead of fetching all transfers again
+    """
+
+    value = 0
+
+    @classmethod
+    def next(cls) -> int:
+        cls.value += 1
+        return cls.value
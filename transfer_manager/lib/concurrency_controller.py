@@ -0,0 +1,85 @@
+from collections import deque
+import time
+
+CONTROLLER_ACTION_INCREASE = 'increase'
+CONTROLLER_ACTION_DECREASE = 'decrease'
+CONTROLLER_ACTION_BACKOFF = 'backoff'
+CONTROLLER_ACTION_HOLD = 'hold'
+
+
+class ConcurrencyController:
+    """
+    decides how many workers a transfer queue should run
+
+    additive increase while adding a worker still raises the combined throughput of the queue, one step back
+    when the last added worker did not help, and multiplicative decrease when work orders have to be retried
+    """
+
+    def __init__(
+        self,
+        min_workers: int = 1,
+        max_workers: int = 16,
+        sample_interval: float = 3,
+        min_gain: float = 0.05,
+        settle_intervals: int = 10,
+        keep_num_decisions: int = 20,
+    ):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.sample_interval = sample_interval  # seconds between decisions, workers need time to ramp up
+        self.min_gain = min_gain  # relative throughput gain an added worker has to bring
+        self.settle_intervals = settle_intervals  # intervals to hold after stepping back before probing again
+
+        self.target = min_workers
+        self.throughput = 0
+        self.last_sample_at = 0
+        self.last_action = CONTROLLER_ACTION_HOLD
+        self.hold_until = 0
+        self.decisions = deque(maxlen=keep_num_decisions)
+
+    def _decide(self, action: str, target: int, throughput: float, now: float):
+        self.target = min(max(target, self.min_workers), self.max_workers)
+        self.throughput = throughput
+        self.last_sample_at = now
+        self.last_action = action
+        if action != CONTROLLER_ACTION_HOLD:
+            self.decisions.append({
+                "time": now,
+                "action": action,
+                "workers": self.target,
+                "throughput": throughput,
+            })
+        return self.target
+
+    def on_success(self, throughput: float) -> int:
+        now = time.time()
+        if now - self.last_sample_at < self.sample_interval:
+            return self.target
+
+        if self.last_action == CONTROLLER_ACTION_INCREASE and throughput < self.throughput * (1 + self.min_gain):
+            # the last added worker did not pay off, the link is saturated
+            self.hold_until = now + self.sample_interval * self.settle_intervals
+            return self._decide(CONTROLLER_ACTION_DECREASE, self.target - 1, throughput, now)
+
+        if now < self.hold_until or self.target >= self.max_workers:
+            return self._decide(CONTROLLER_ACTION_HOLD, self.target, throughput, now)
+
+        return self._decide(CONTROLLER_ACTION_INCREASE, self.target + 1, throughput, now)
+
+    def on_retry(self, throughput: float) -> int:
+        now = time.time()
+        if now - self.last_sample_at < self.sample_interval and self.last_action == CONTROLLER_ACTION_BACKOFF:
+            # one backoff per interval, a burst of failures is usually one cause
+            return self.target
+        self.hold_until = now + self.sample_interval * self.settle_intervals
+        return self._decide(CONTROLLER_ACTION_BACKOFF, self.target // 2, throughput, now)
+
+    def to_dict(self):
+        return {
+            "target": self.target,
+            "min_workers": self.min_workers,
+            "max_workers": self.max_workers,
+            "throughput": self.throughput,
+            "last_action": self.last_action,
+            "decisions": list(self.decisions),
+        }
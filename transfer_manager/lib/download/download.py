@@ -4,19 +4,43 @@ from ..util import IMAGE_TYPE_TO_EXTENSION, get_next_id
 from .download_work_order import DownloadWorkOrder
 from ...apis.r2_worker_shared import R2_WORKER_ENDPOINT
 from ..user_data import UserData
-from typing import List
+from ..scheduler import DEFAULT_PRIORITY
+from typing import List, Dict, Set, NamedTuple
 from urllib.parse import quote
+from collections import deque
 import os
 import time
 
+FINISHED_FILES_KEPT = 256  # finished files stay around for a while so the delta api can report their last state
+
+
+class DownloadOutput(NamedTuple):
+    name: str  # render pass output name, empty for the main output
+    file_ext: str
+
 
 class Download(Transfer):
+    """
+    work orders are created from a compact description of the job output (outputs x frames) when a worker asks
+    for the next one, so only the files that are currently being downloaded exist as objects
+    """
+
     def __init__(self, user_data: UserData, local_dir_path: str, job_id: str, metadata: dict):
         super().__init__(get_next_id(), "download", metadata)
         self.user_data = user_data
         self.local_dir_path = os.path.abspath(local_dir_path)
         self.job_id = job_id
 
+        self.outputs: List[DownloadOutput] = []
+        self.frame_start = 0
+        self.frame_count = 0
+        self.file_count = 0
+        self.next_number = 0  # number of the next work order that gets created
+        self.skip_numbers: Set[int] = set()  # files that were finished before a restart
+        self.part_validators: Dict[int, dict] = {}  # validators of files that had a part file before a restart
+        self.work_orders: Dict[int, DownloadWorkOrder] = {}  # work orders that were created and did not succeed yet
+        self.finished_work_orders = deque(maxlen=FINISHED_FILES_KEPT)
+
     async def initialize(self):
         job = await Sarfis.get_job_details(self.user_data, self.job_id)
         render_passes = job['render_passes']
@@ -29,69 +53,190 @@ class Download(Transfer):
             total_frames = batch_size * total_batches
             frame_end = frame_start + total_frames - 1
 
-        number = 0
-
-        def add_work_order(_url, _local_path, _rel_path):
-            nonlocal number
-            self.work_orders.append(DownloadWorkOrder(number, _url, _local_path, _rel_path, self))
-            number += 1
-
-        output_dir = os.path.join(self.local_dir_path, str(self.job_id))
-        os.makedirs(output_dir, exist_ok=True)
-
         if len(render_passes) > 0:
             for render_pass_name, render_pass in render_passes.items():
                 for render_pass_output_name, file_ext in render_pass["files"].items():
-                    os.makedirs(os.path.join(output_dir, render_pass_output_name), exist_ok=True)
-                    for t in range(frame_start, frame_end + 1):
-                        file_full_name = f"{str(t).zfill(4)}.{file_ext}"
-                        url = f"{R2_WORKER_ENDPOINT}/{self.job_id}/output/{quote(render_pass_output_name, safe='/')}/{file_full_name}"
-                        local_path = os.path.join(output_dir, render_pass_output_name, file_full_name)
-                        add_work_order(url, local_path, f"{render_pass_output_name}/{file_full_name}")
+                    self.outputs.append(DownloadOutput(render_pass_output_name, file_ext))
 
         file_ext = IMAGE_TYPE_TO_EXTENSION.get(job["render_format"], "unknown")
-
-        for t in range(frame_start, frame_end + 1):
-            file_full_name = f"{str(t).zfill(4)}.{file_ext}"
-            url = f"{R2_WORKER_ENDPOINT}/{self.job_id}/output/{file_full_name}"
-            local_path = os.path.join(output_dir, file_full_name)
-            add_work_order(url, local_path, file_full_name)
-
-        self.progress.set_total(len(self.work_orders))
+        self.outputs.append(DownloadOutput("", file_ext))
+
+        self.frame_start = frame_start
+        self.frame_count = max(frame_end - frame_start + 1, 0)
+        self.file_count = len(self.outputs) * self.frame_count
+
+        self.progress.set_total(self.file_count)
+
+    def get_output_dir(self):
+        return os.path.join(self.local_dir_path, str(self.job_id))
+
+    def _get_rel_path(self, number: int) -> str:
+        output = self.outputs[number // self.frame_count]
+        t = self.frame_start + number % self.frame_count
+        file_full_name = f"{str(t).zfill(4)}.{output.file_ext}"
+        if output.name:
+            return f"{output.name}/{file_full_name}"
+        return file_full_name
+
+    def _create_work_order(self, number: int) -> DownloadWorkOrder:
+        rel_path = self._get_rel_path(number)
+        url = f"{R2_WORKER_ENDPOINT}/{self.job_id}/output/{quote(rel_path, safe='/')}"
+        local_path = os.path.join(self.get_output_dir(), *rel_path.split("/"))
+        return DownloadWorkOrder(number, url, local_path, rel_path, self)
+
+    def has_pending_work_orders(self) -> bool:
+        return super().has_pending_work_orders() or self.next_number < self.file_count
+
+    def pop_pending_work_order(self):
+        # requeued work orders and segments first, then the next file of the job
+        work_order = super().pop_pending_work_order()
+        if work_order is not None:
+            return work_order
+        while self.next_number < self.file_count:
+            number = self.next_number
+            self.next_number += 1
+            if number in self.skip_numbers:
+                continue
+            work_order = self._create_work_order(number)
+            validators = self.part_validators.pop(number, None)
+            if validators is not None:
+                # lets the worker resume the part file of the file
+                work_order.etag = validators.get("etag")
+                work_order.last_modified = validators.get("last_modified")
+            work_order.queued_at = self.queued_at  # files that are not created yet wait since the download joined the queue
+            self.work_orders[number] = work_order
+            return work_order
+        return None
+
+    def to_journal(self):
+        return {
+            "id": self.id,
+            "created": self.created,
+            "status": self.status,
+            "priority": self.priority,
+            "metadata": self.metadata,
+            "user_data": self.user_data.to_journal(),
+            "local_dir_path": self.local_dir_path,
+            "job_id": self.job_id,
+        }
+
+    @classmethod
+    async def from_journal(cls, state: dict, work_order_states: Dict[int, dict]) -> "Download":
+        download = cls(UserData(**state["user_data"]), state["local_dir_path"], state["job_id"], state["metadata"])
+        download.id = state["id"]
+        download.created = state["created"]
+        download.priority = state.get("priority", DEFAULT_PRIORITY)
+        await download.initialize()
+
+        # files that were downloaded before the restart are not downloaded again, part files are resumed
+        for number, wo_state in work_order_states.items():
+            if number >= download.file_count:
+                continue
+            if wo_state["status"] == TRANSFER_STATUS_SUCCESS:
+                download.skip_numbers.add(number)
+            else:
+                download.part_validators[number] = wo_state
+        download.progress.set_done(download.finished_files)
+        return download
+
+    @property
+    def finished_files(self) -> int:
+        return self.work_order_counts[TRANSFER_STATUS_SUCCESS] + len(self.skip_numbers)
+
+    @property
+    def failed_files(self) -> int:
+        return self.work_order_counts[TRANSFER_STATUS_FAILURE]
+
+    def on_work_order_status(self, work_order, old_status, new_status):
+        super().on_work_order_status(work_order, old_status, new_status)
+        if new_status == TRANSFER_STATUS_SUCCESS:
+            # only the journal and the delta api still need a finished file
+            if self.work_orders.pop(work_order.number, None) is not None:
+                self.finished_work_orders.append(work_order)
+
+    def get_work_order(self, journal_key: int):
+        work_order = self.work_orders.get(journal_key)
+        if work_order is None:
+            work_order = next((wo for wo in self.finished_work_orders if wo.number == journal_key), None)
+        return work_order
+
+    def get_files(self, offset: int, limit: int):
+        # a page of all files of the job, files without a work order get their status from where the queue is
+        files = []
+        for number in range(offset, min(offset + limit, self.file_count)):
+            work_order = self.get_work_order(number)
+            if work_order is not None:
+                files.append(work_order.small_dict())
+                continue
+            finished = number < self.next_number or number in self.skip_numbers
+            files.append({
+                "number": number,
+                "rel_path": self._get_rel_path(number),
+                "done": 0,
+                "total": 0,
+                "status": TRANSFER_STATUS_SUCCESS if finished else TRANSFER_STATUS_CREATED,
+                "history_count": 0,
+            })
+        return {
+            "total": self.file_count,
+            "offset": offset,
+            "files": files,
+        }
+
+    def get_version(self) -> int:
+        # the progress of a download counts files, the bytes of the files in flight only move their own progress
+        version = super().get_version()
+        for work_order in self.work_orders.values():
+            version = max(version, work_order.get_version())
+        return version
+
+    def get_changed_work_orders(self, since: int) -> list:
+        work_orders = [wo for wo in self.finished_work_orders if wo.get_version() > since]
+        work_orders.extend(wo for wo in self.work_orders.values() if wo.get_version() > since)
+        return work_orders
 
     def update(self):
-        finished_files = 0
-        running_or_created_files = 0
-        for f in self.work_orders:
-            if f.status == TRANSFER_STATUS_SUCCESS:
-                finished_files += 1
-            elif f.status in [TRANSFER_STATUS_RUNNING, TRANSFER_STATUS_CREATED]:
-                running_or_created_files += 1
-        self.progress.set_done(finished_files)
-
-        if self.progress.done >= self.progress.total:
+        self.progress.set_done(self.finished_files)
+
+        if self.status in [TRANSFER_STATUS_SUCCESS, TRANSFER_STATUS_FAILURE]:
+            return
+        if self.finished_files >= self.file_count:
             self.status = TRANSFER_STATUS_SUCCESS
             self.finished_at = time.time()
-        elif running_or_created_files == 0:  # if not all done, but no running or created files left, download is finished and gets status failed
+            self.save_state()
+        elif self.finished_files + self.failed_files >= self.file_count:  # if not all done, but no running or created files left, download is finished and gets status failed
             self.status = TRANSFER_STATUS_FAILURE
             self.finished_at = time.time()
             self.status_text = "Some files could not be downloaded"
+            self.save_state()
 
     def start(self):
         if self.status in [TRANSFER_STATUS_CREATED, TRANSFER_STATUS_PAUSED]:
             self.status = TRANSFER_STATUS_RUNNING
+            self.get_queue().add_transfer(self)
+            self.save_state()
 
     def stop(self):
         if self.status != TRANSFER_STATUS_CREATED:
             self.status = TRANSFER_STATUS_FAILURE
+        self.get_queue().remove_transfer(self)
+        self.save_state()
 
     def pause(self):
         if self.status == TRANSFER_STATUS_RUNNING:
             self.status = TRANSFER_STATUS_PAUSED
+            self.get_queue().remove_transfer(self)
+            self.save_state()
 
-    def to_dict(self):
+    def to_dict(self, work_orders: bool = True):
         d = super().to_dict()
         d['local_dir_path'] = self.local_dir_path
         d['job_id'] = self.job_id
-        d['files'] = [i.small_dict() for i in self.work_orders]
+        d['files_total'] = self.file_count
+        d['files_done'] = self.finished_files
+        d['files_failed'] = self.failed_files
+        if work_orders:
+            # only files that have a work order, which are the ones in flight, failed or waiting for a retry,
+            # a job can have 100k files, all of them are paged through /transfers/<id>/files
+            d['files'] = [i.small_dict() for i in self.work_orders.values()]
         return d
@@ -1,74 +1,315 @@
 import asyncio
 import os
+import time
 import httpx
+from typing import Optional, Union
 from sanic.log import logger
 from traceback import format_exception
-from ..transfer import TRANSFER_STATUS_SUCCESS, TRANSFER_STATUS_FAILURE
+from ..transfer import TRANSFER_STATUS_SUCCESS, TRANSFER_STATUS_FAILURE, TRANSFER_STATUS_RUNNING
 from .download_work_order import DownloadWorkOrder
+from .download_segment import DownloadSegment
 from ..transfer_queue_worker import TransferQueueWorker
+from ...apis.http_pool import HttpPool
+from ..metrics import Metrics
+from ...apis.r2_worker_shared import HttpStatusException
 
-DOWNLOAD_RETRY_INTERVAL = 5
+PART_FILE_SUFFIX = ".part"
+SEGMENTED_PART_FILE_SUFFIX = ".segmented.part"
+DOWNLOAD_SEGMENT_SIZE = 32 * 1024 * 1024  # files bigger than this are downloaded in segments of this size by several workers
+
+
+def get_content_range_start(content_range: Optional[str]) -> Optional[int]:
+    # "bytes 100-199/200", there is no start in "bytes */200"
+    if content_range is None:
+        return None
+    first = content_range.split(" ", 1)[-1].split("-", 1)[0].strip()
+    if not first.isdigit():
+        return None
+    return int(first)
+
+
+def get_content_range_total(content_range: Optional[str]) -> Optional[int]:
+    # "bytes 100-199/200" or "bytes */200", the total is unknown for "bytes 100-199/*"
+    if content_range is None or "/" not in content_range:
+        return None
+    total = content_range.rsplit("/", 1)[1].strip()
+    if not total.isdigit():
+        return None
+    return int(total)
+
+
+class SegmentCanceledException(Exception):
+    pass
 
 
 class DownloadQueueWorker(TransferQueueWorker):
+    async def _download(self, client: httpx.AsyncClient, work_order: DownloadWorkOrder, transfer_name: str):
+        # downloads into a .part file next to the target, attempts after a failure resume with a range request
+        download = work_order.download
+        part_path = work_order.local_path + PART_FILE_SUFFIX
+        os.makedirs(os.path.dirname(work_order.local_path), exist_ok=True)
+
+        segmented_part_path = work_order.local_path + SEGMENTED_PART_FILE_SUFFIX
+        if os.path.exists(segmented_part_path):
+            # segments of an earlier run, we do not know which of them made it to disk
+            os.remove(segmented_part_path)
+
+        # only a part file we wrote ourselves is resumed, and only if the server can tell us it still has those bytes
+        validator = work_order.get_range_validator()
+        offset = 0
+        if os.path.exists(part_path):
+            if validator is None:
+                os.remove(part_path)
+            else:
+                offset = os.path.getsize(part_path)
+        # a file that is already there is kept until a complete replacement is downloaded, it is never appended to
+        existing_size = None
+        if offset == 0 and os.path.exists(work_order.local_path):
+            existing_size = os.path.getsize(work_order.local_path)
+
+        headers = {'authentication': download.user_data.api_token, 'Accept-Encoding': 'identity'}
+        if offset > 0:
+            headers['Range'] = f"bytes={offset}-"
+            # server sends the whole file instead if it changed since the part was downloaded
+            headers['If-Range'] = validator
+        else:
+            # only asks for the first segment, the response tells us the file size and if ranges are supported
+            headers['Range'] = f"bytes=0-{DOWNLOAD_SEGMENT_SIZE - 1}"
+
+        work_order.status_text = "Initiating Download"
+        logger.debug(f"start downloading {transfer_name} from offset {offset}")
+        start = time.monotonic()
+        async with client.stream("GET", work_order.url, headers=headers) as response:
+            Metrics.observe("tm_request_duration_seconds", time.monotonic() - start, ("download",))
+            if response.status_code == 404:
+                msg = f"download {transfer_name} not found, skipping"
+                logger.warning(msg)
+                work_order.history.append(msg)
+                work_order.progress.set_value(1)
+                work_order.status_text = "Not Found, Skipping"
+                work_order.status = TRANSFER_STATUS_SUCCESS
+                return
+            if response.status_code == 416:
+                # range starts at the end of the file, either our part file is complete or the remote file is empty
+                total = get_content_range_total(response.headers.get("Content-Range"))
+                if total != offset:
+                    if offset > 0:
+                        os.remove(part_path)
+                    raise Exception(f"local part of {transfer_name} has {offset} bytes, remote has {total}, starting over")
+                if existing_size == 0:
+                    self._skip_existing(work_order, transfer_name)
+                    return
+                if offset == 0:
+                    open(part_path, 'wb').close()
+                logger.debug(f"{transfer_name} was downloaded completely before")
+                work_order.status_text = "Already Downloaded"
+            elif not 200 <= response.status_code <= 299:
+                msg = f"download of {transfer_name} failed with response code {response.status_code}"
+                logger.warning(msg)
+                raise HttpStatusException(response.status_code, msg)
+            else:
+                if response.status_code == 206:
+                    total = get_content_range_total(response.headers.get("Content-Range"))
+                    if get_content_range_start(response.headers.get("Content-Range")) != offset:
+                        raise Exception(f"download of {transfer_name} got {response.headers.get('Content-Range')} for offset {offset}")
+                else:
+                    # range was ignored or the file changed, start from the beginning
+                    offset = 0
+                    content_length = response.headers.get("Content-Length")
+                    total = int(content_length) if content_length is not None else None
+
+                if offset == 0:
+                    etag = response.headers.get("ETag")
+                    if existing_size is not None and existing_size == total and work_order.etag in [None, etag]:
+                        self._skip_existing(work_order, transfer_name)
+                        return
+                    # the part file belongs to this version of the remote file from here on
+                    work_order.etag = etag
+                    work_order.last_modified = response.headers.get("Last-Modified")
+                    download.save_state(work_order)
+                    if response.status_code == 206 and total is not None and total > DOWNLOAD_SEGMENT_SIZE:
+                        await self._split(work_order, total, response, transfer_name)
+                        return
+
+                work_order.status_text = "Downloading"
+                done = offset
+                work_order.progress.set_done_total(done, total or 0)
+                with open(part_path, 'ab' if offset > 0 else 'wb') as f:
+                    async for chunk in response.aiter_bytes():
+                        download.mark_first_byte()
+                        f.write(chunk)
+                        chunk_len = len(chunk)
+                        await self.queue.bandwidth_limiter.consume(download, chunk_len)
+                        self._on_bytes(download, chunk_len)
+                        done += chunk_len
+                        work_order.progress.set_done(done)
+
+                if total is not None and done != total:
+                    raise Exception(f"download of {transfer_name} ended after {done} of {total} bytes")
+
+        os.replace(part_path, work_order.local_path)
+        work_order.progress.set_value(1)
+        logger.debug(f"{transfer_name} downloaded successfully")
+        work_order.status = TRANSFER_STATUS_SUCCESS
+
+    def _skip_existing(self, work_order: DownloadWorkOrder, transfer_name: str):
+        logger.debug(f"{transfer_name} already exists locally with the same size, skipping")
+        work_order.progress.set_value(1)
+        work_order.status_text = "Already Downloaded"
+        work_order.status = TRANSFER_STATUS_SUCCESS
+
+    async def _split(self, work_order: DownloadWorkOrder, total: int, response: httpx.Response, transfer_name: str):
+        # preallocates the file and hands its segments to the queue, the work order finishes with its last segment
+        with open(work_order.local_path + SEGMENTED_PART_FILE_SUFFIX, 'wb') as f:
+            f.truncate(total)
+
+        work_order.segments = [
+            DownloadSegment(work_order, i, start, min(start + DOWNLOAD_SEGMENT_SIZE, total))
+            for i, start in enumerate(range(0, total, DOWNLOAD_SEGMENT_SIZE))
+        ]
+        work_order.segments_left = len(work_order.segments)
+        work_order.progress.set_done_total(0, total)
+        work_order.status_text = f"Downloading in {len(work_order.segments)} segments"
+        logger.debug(f"downloading {work_order.rel_path} with {total} bytes in {len(work_order.segments)} segments")
+
+        # the response we split on is the first segment, this worker goes on with it while others take the rest
+        first = work_order.segments[0]
+        first.status = TRANSFER_STATUS_RUNNING
+        work_order.download.add_pending_work_orders_front(work_order.segments[1:])
+        try:
+            await self._write_segment(response, first)
+            self._finish_segment(first, transfer_name)
+        except Exception as ex:
+            msg = '\n'.join(format_exception(ex))
+            logger.warning(f"segment 0 of {transfer_name} had exception {msg}")
+            first.history.append(msg)
+            if work_order.status == TRANSFER_STATUS_FAILURE:
+                first.status = TRANSFER_STATUS_FAILURE
+            else:
+                # from here on it is retried like any other segment
+                work_order.download.requeue_work_order(first)
+
+    async def _download_segment(self, client: httpx.AsyncClient, segment: DownloadSegment, transfer_name: str):
+        work_order = segment.work_order
+        download = segment.download
+        headers = {
+            'authentication': download.user_data.api_token,
+            'Accept-Encoding': 'identity',
+            'Range': f"bytes={segment.start + segment.done}-{segment.end - 1}",
+        }
+        if work_order.etag is not None:
+            headers['If-Match'] = work_order.etag
+
+        segment.status_text = "Downloading"
+        start = time.monotonic()
+        async with client.stream("GET", work_order.url, headers=headers) as response:
+            Metrics.observe("tm_request_duration_seconds", time.monotonic() - start, ("download_segment",))
+            if response.status_code != 206:
+                msg = f"segment {segment.index} of {transfer_name} failed with response code {response.status_code}"
+                if response.status_code >= 400:
+                    raise HttpStatusException(response.status_code, msg)
+                raise Exception(msg)
+            await self._write_segment(response, segment)
+        self._finish_segment(segment, transfer_name)
+
+    async def _write_segment(self, response: httpx.Response, segment: DownloadSegment):
+        work_order = segment.work_order
+        download = segment.download
+        # every segment writes through its own handle, so there is no shared file position
+        with open(work_order.local_path + SEGMENTED_PART_FILE_SUFFIX, 'r+b') as f:
+            f.seek(segment.start + segment.done)
+            async for chunk in response.aiter_bytes():
+                if work_order.status == TRANSFER_STATUS_FAILURE:
+                    raise SegmentCanceledException(f"segment {segment.index} stopped, another segment of the file failed")
+                download.mark_first_byte()
+                chunk_len = min(len(chunk), segment.size - segment.done)
+                f.write(chunk[:chunk_len])
+                await self.queue.bandwidth_limiter.consume(download, chunk_len)
+                self._on_bytes(download, chunk_len)
+                segment.done += chunk_len
+                segment.progress.set_done(segment.done)
+                work_order.progress.increase_done(chunk_len)
+
+    def _finish_segment(self, segment: DownloadSegment, transfer_name: str):
+        work_order = segment.work_order
+        if segment.done != segment.size:
+            raise Exception(f"segment {segment.index} of {transfer_name} ended after {segment.done} of {segment.size} bytes")
+        segment.status = TRANSFER_STATUS_SUCCESS
+
+        work_order.segments_left -= 1
+        if work_order.segments_left == 0:
+            os.replace(work_order.local_path + SEGMENTED_PART_FILE_SUFFIX, work_order.local_path)
+            work_order.segments = []
+            work_order.progress.set_value(1)
+            work_order.status_text = ""
+            logger.debug(f"{transfer_name} downloaded successfully")
+            work_order.status = TRANSFER_STATUS_SUCCESS
 
     async def _run(self):
         logger.info("download worker starting")
-        client = httpx.AsyncClient()
+        client = HttpPool.get_client()
         while not self.ct.is_canceled():
             try:
-                work_order: DownloadWorkOrder = await self.queue.get_next_work_order()
+                work_order: Union[DownloadWorkOrder, DownloadSegment] = await self.queue.get_next_work_order()
                 if work_order is None:
-                    await asyncio.sleep(1)
                     continue
 
                 download = work_order.download
-                transfer_name = f"file {work_order.number} of {len(download.work_orders)} of job {download.job_id}"
+                if isinstance(work_order, DownloadSegment):
+                    file_work_order = work_order.work_order
+                else:
+                    file_work_order = work_order
+                transfer_name = f"file {file_work_order.number} of {download.file_count} of job {download.job_id}"
 
                 await self._check_pause()
 
-                while not self.ct.is_canceled():  # never give up downloading
+                retry_policy = self.queue.retry_policy
+                attempt = 0
+                while not self.ct.is_canceled():
+                    if file_work_order.status == TRANSFER_STATUS_FAILURE:
+                        # another segment of this file gave up, the file can not be completed anymore
+                        work_order.status = TRANSFER_STATUS_FAILURE
+                        break
+                    await retry_policy.wait_for_endpoint(file_work_order.url, self.ct)
+                    if self.ct.is_canceled():
+                        break
                     try:
-                        work_order.status_text = "Initiating Download"
-                        logger.debug(f"start downloading {transfer_name}")
-                        async with client.stream("GET", work_order.url, headers={'authentication': download.user_data.api_token}) as response:
-                            if not 200 <= response.status_code <= 299:
-                                if response.status_code == 404:
-                                    msg = f"download {transfer_name} not found, skipping"
-                                    logger.warning(msg)
-                                    work_order.history.append(msg)
-                                    work_order.progress.set_value(1)
-                                    work_order.status_text = "Not Found, Skipping"
-                                    work_order.status = TRANSFER_STATUS_SUCCESS
-                                    break
-                                msg = f"download of {transfer_name} failed with response code {response.status_code}"
-                                logger.warning(msg)
-                                raise Exception(msg)
-                            work_order.status_text = "Downloading"
-                            os.makedirs(os.path.dirname(work_order.local_path), exist_ok=True)
-                            with open(work_order.local_path, 'wb') as f:
-                                file_size = int(response.headers["Content-Length"])
-                                work_order.progress.set_done_total(response.num_bytes_downloaded, file_size)
-                                self.transfer_speed.update(response.num_bytes_downloaded)
-                                async for chunk in response.aiter_bytes():
-                                    f.write(chunk)
-                                    self.transfer_speed.update(response.num_bytes_downloaded - work_order.progress.done)
-                                    work_order.progress.set_done(response.num_bytes_downloaded)
-                        logger.debug(f"{transfer_name} downloaded successfully")
-                        work_order.status = TRANSFER_STATUS_SUCCESS
+                        if isinstance(work_order, DownloadSegment):
+                            await self._download_segment(client, work_order, transfer_name)
+                        else:
+                            await self._download(client, work_order, transfer_name)
+                        retry_policy.on_success(file_work_order.url, download)
                         break
                     except Exception as ex:
                         msg = '\n'.join(format_exception(ex))
                         logger.warning(f"download {transfer_name} had exception {msg}")
                         work_order.history.append(msg)
                         work_order.status_text = msg
-                        work_order.progress.set_done(0)
-                        await asyncio.sleep(DOWNLOAD_RETRY_INTERVAL)
-                    finally:
-                        if work_order.status != TRANSFER_STATUS_SUCCESS:
+                        if file_work_order.status == TRANSFER_STATUS_FAILURE:
+                            continue
+                        delay = retry_policy.on_failure(file_work_order.url, ex, attempt, download)
+                        if delay is None:
+                            logger.warning(f"giving up on download {transfer_name}")
                             work_order.status = TRANSFER_STATUS_FAILURE
+                            file_work_order.status = TRANSFER_STATUS_FAILURE
+                            break
+                        # the file stays running while we retry, a failed file would count as finished for the download
+                        self.queue.notify_workorder_retry(self)
+                        attempt += 1
+                        await asyncio.sleep(delay)
+
+                split = isinstance(work_order, DownloadWorkOrder) and len(work_order.segments) > 0
+                if self.ct.is_canceled() and work_order.status not in [TRANSFER_STATUS_SUCCESS, TRANSFER_STATUS_FAILURE] and not split:
+                    # worker was stopped mid download, let another worker pick the file up again
+                    # a file that was split is not, its segments are in the queue or being written already
+                    download.requeue_work_order(work_order)
+                    break
 
+                # a file that was split into segments is still running, it finishes with its last segment
+                if file_work_order.status == TRANSFER_STATUS_SUCCESS:
+                    download.save_state(file_work_order)
                 download.update()
+                self.queue.notify_workorder_success(self)
             except:
                 logger.exception("exception from within download worker")
         logger.info("download worker exiting")
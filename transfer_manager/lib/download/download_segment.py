@@ -0,0 +1,33 @@
+from ..progress import Progress
+from ..transfer import TRANSFER_STATUS_CREATED
+from typing import TYPE_CHECKING, List
+import time
+
+if TYPE_CHECKING:
+    from .download_work_order import DownloadWorkOrder
+
+
+class DownloadSegment:
+    """
+    byte range of a big file, the segments of a file are downloaded by several workers at the same time
+    and written into a preallocated file at their offset
+    """
+
+    def __init__(self, work_order: "DownloadWorkOrder", index: int, start: int, end: int):
+        self.work_order = work_order
+        self.download = work_order.download
+        self.index = index
+        self.start = start
+        self.end = end  # exclusive
+
+        self.done = 0  # bytes written so far, a retry resumes after them
+        self.progress = Progress()
+        self.progress.set_total(end - start)
+        self.status = TRANSFER_STATUS_CREATED
+        self.status_text = ""
+        self.history: List[str] = []
+        self.queued_at = time.time()
+
+    @property
+    def size(self):
+        return self.end - self.start
@@ -1,13 +1,20 @@
 from ..progress import Progress
-from ..transfer import TRANSFER_STATUS_CREATED
-from typing import TYPE_CHECKING, List
+from ..work_order import WorkOrder
+from typing import TYPE_CHECKING, List, Optional
 
 if TYPE_CHECKING:
     from .download import Download
+    from .download_segment import DownloadSegment
 
 
-class DownloadWorkOrder:
+class DownloadWorkOrder(WorkOrder):
+    __slots__ = (
+        "number", "url", "local_path", "rel_path", "download", "progress", "history", "etag", "last_modified",
+        "segments", "segments_left",
+    )
+
     def __init__(self, number: int, url: str, local_path: str, rel_path: str, download: "Download"):
+        super().__init__(download)
         self.number = number
         self.url = url
         self.local_path = local_path
@@ -15,15 +22,42 @@ class DownloadWorkOrder:
         self.download = download
 
         self.progress = Progress()
-        self.status = TRANSFER_STATUS_CREATED
-        self.status_text = ""
         self.history: List[str] = []
+        # validators of the remote file the part file was started with
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.segments: List["DownloadSegment"] = []  # only set for big files that are downloaded in parallel
+        self.segments_left = 0
+
+    @property
+    def journal_key(self):
+        return self.number
+
+    def get_range_validator(self) -> Optional[str]:
+        # what goes into If-Range, a weak etag does not promise the same bytes so it can not be used there
+        if self.etag is not None and not self.etag.startswith("W/"):
+            return self.etag
+        return self.last_modified
+
+    def to_journal(self):
+        return {
+            "status": self.status,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+        }
+
+    def restore(self, state: dict):
+        self.status = state["status"]
+        self.etag = state.get("etag")
+        self.last_modified = state.get("last_modified")
+        self.progress.set_value(1)
 
     def small_dict(self):
         return {
+            "number": self.number,
             "rel_path": self.rel_path,
             "done": self.progress.done,
             "total": self.progress.total,
             "status": self.status,
-            "status_history": self.history,
+            "history_count": len(self.history),
         }
@@ -0,0 +1,185 @@
+from typing import Dict, List, Tuple, Optional, TYPE_CHECKING
+from sanic.log import logger
+from .transfer import TRANSFER_STATUS_SUCCESS, TRANSFER_STATUS_FAILURE
+from .util import get_data_dir
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+
+if TYPE_CHECKING:
+    from .transfer import Transfer
+
+JOURNAL_FILE_NAME = "tm_journal.sqlite"
+JOURNAL_FLUSH_INTERVAL = 1  # seconds
+# where older versions kept the journal, the temp dir is shared by all users of the machine
+LEGACY_JOURNAL_FILE_PATH = os.path.join(tempfile.gettempdir(), JOURNAL_FILE_NAME)
+
+
+def get_journal_path() -> str:
+    return os.path.join(get_data_dir(), JOURNAL_FILE_NAME)
+
+
+def _remove_legacy_journal():
+    # it holds the api tokens of unfinished transfers in plain text, readable for other users
+    for suffix in ["", "-wal", "-shm"]:
+        try:
+            os.remove(LEGACY_JOURNAL_FILE_PATH + suffix)
+        except OSError:
+            pass
+
+
+def _create_private_file(path: str):
+    # the journal contains api tokens, only the user running the transfer manager may read it
+    # sqlite gives the -wal and -shm files the permissions of the database file
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+    os.chmod(path, 0o600)
+
+
+class Journal:
+    """
+    persists unfinished transfers and their work orders, so they can be resumed after a restart
+
+    saving only marks a transfer or work order as dirty, the state is serialized and written in one
+    transaction per flush interval, so the cost does not grow with the number of finished parts or files
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            path = get_journal_path()
+            _remove_legacy_journal()
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._dirty_transfers: Dict[str, "Transfer"] = {}
+        self._dirty_work_orders: Dict[Tuple[str, int], Tuple["Transfer", object]] = {}
+        self._removed_transfers = set()
+        self._reset_transfers = set()  # transfers that started over, their journaled work orders are dropped
+        self._task = None
+        self._flush_lock = asyncio.Lock()  # the periodic flush and the one on close must not write at the same time
+
+        try:
+            _create_private_file(path)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS transfers (id TEXT PRIMARY KEY, type TEXT, state TEXT)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS work_orders (transfer_id TEXT, key INTEGER, state TEXT, PRIMARY KEY (transfer_id, key))"
+            )
+        except (sqlite3.Error, OSError):
+            logger.exception(f"could not open transfer journal at {path}, transfers will not be resumable")
+            self._db = None
+
+    def start(self):
+        if self._db is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(JOURNAL_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("could not write transfer journal")
+
+    def save(self, transfer: "Transfer", work_order=None):
+        if self._db is None:
+            return
+        if transfer.status in [TRANSFER_STATUS_SUCCESS, TRANSFER_STATUS_FAILURE]:
+            # finished transfers are not resumed
+            self.remove(transfer.id)
+            return
+        self._removed_transfers.discard(transfer.id)
+        self._dirty_transfers[transfer.id] = transfer
+        if work_order is not None:
+            self._dirty_work_orders[(transfer.id, work_order.journal_key)] = (transfer, work_order)
+
+    def remove(self, transfer_id: str):
+        if self._db is None:
+            return
+        self._dirty_transfers.pop(transfer_id, None)
+        self._removed_transfers.add(transfer_id)
+
+    def reset(self, transfer_id: str):
+        # for a transfer that starts over, the work orders it journaled before do not belong to it anymore
+        if self._db is None:
+            return
+        self._reset_transfers.add(transfer_id)
+        for key in [key for key in self._dirty_work_orders if key[0] == transfer_id]:
+            del self._dirty_work_orders[key]
+
+    async def flush(self):
+        async with self._flush_lock:
+            await self._flush()
+
+    async def _flush(self):
+        if self._db is None:
+            return
+        if (len(self._dirty_transfers) == 0 and len(self._dirty_work_orders) == 0
+                and len(self._removed_transfers) == 0 and len(self._reset_transfers) == 0):
+            return
+
+        # serialize on the event loop, so we see a consistent state, write in a thread
+        transfer_rows = [(t.id, t.type, json.dumps(t.to_journal())) for t in self._dirty_transfers.values()]
+        work_order_rows = [
+            (transfer_id, key, json.dumps(wo.to_journal()))
+            for (transfer_id, key), (_, wo) in self._dirty_work_orders.items()
+            if transfer_id not in self._removed_transfers
+        ]
+        removed_rows = [(i,) for i in self._removed_transfers]
+        reset_rows = [(i,) for i in self._reset_transfers]
+        self._dirty_transfers = {}
+        self._dirty_work_orders = {}
+        self._removed_transfers = set()
+        self._reset_transfers = set()
+
+        write = asyncio.ensure_future(
+            asyncio.to_thread(self._write, transfer_rows, work_order_rows, removed_rows, reset_rows)
+        )
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # the thread keeps writing, the lock is held until it is done so the next flush does not run alongside
+            await write
+            raise
+
+    def _write(self, transfer_rows: list, work_order_rows: list, removed_rows: list, reset_rows: list):
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.executemany("DELETE FROM work_orders WHERE transfer_id = ?", reset_rows)
+            self._db.executemany("INSERT OR REPLACE INTO transfers (id, type, state) VALUES (?, ?, ?)", transfer_rows)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO work_orders (transfer_id, key, state) VALUES (?, ?, ?)", work_order_rows
+            )
+            self._db.executemany("DELETE FROM transfers WHERE id = ?", removed_rows)
+            self._db.executemany("DELETE FROM work_orders WHERE transfer_id = ?", removed_rows)
+
+    def load(self) -> List[Tuple[str, dict, Dict[int, dict]]]:
+        # returns (transfer type, transfer state, work order states by key) for every journaled transfer
+        if self._db is None:
+            return []
+        result = []
+        for transfer_id, transfer_type, state in self._db.execute("SELECT id, type, state FROM transfers").fetchall():
+            work_order_states = {}
+            for key, wo_state in self._db.execute(
+                "SELECT key, state FROM work_orders WHERE transfer_id = ?", (transfer_id,)
+            ):
+                work_order_states[key] = json.loads(wo_state)
+            result.append((transfer_type, json.loads(state), work_order_states))
+        return result
+
+    async def close(self):
+        # stops the periodic flush, waits for a flush that is running and writes what is left
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -1,16 +1,73 @@
+from typing import Any, Callable, Dict
 import dataclasses
 import json
 
+# the first of these that is installed is used, orjson and msgspec are optional
+JSON_BACKENDS = ["orjson", "msgspec", "json"]
 
-def json_dumps(*args, **kwargs):
-    kwargs['cls'] = EnhancedJSONEncoder
-    return json.dumps(*args, **kwargs)
+# how objects that are not plain json are turned into something that is, looked up once per type
+_converters: Dict[type, Callable[[Any], Any]] = {}
+
+
+def _get_converter(t: type) -> Callable[[Any], Any]:
+    converter = _converters.get(t)
+    if converter is None:
+        if dataclasses.is_dataclass(t):
+            converter = dataclasses.asdict
+        elif hasattr(t, 'to_dict'):
+            converter = t.to_dict
+        else:
+            raise TypeError(f"Object of type {t.__name__} is not JSON serializable")
+        _converters[t] = converter
+    return converter
+
+
+def _default(o):
+    return _get_converter(type(o))(o)
+
+
+def _load_backend(name: str):
+    if name == "orjson":
+        import orjson
+
+        option = orjson.OPT_NON_STR_KEYS
+        return lambda obj: orjson.dumps(obj, default=_default, option=option).decode()
+    if name == "msgspec":
+        import msgspec
+
+        encoder = msgspec.json.Encoder(enc_hook=_default)
+        return lambda obj: encoder.encode(obj).decode()
+    return lambda obj: json.dumps(obj, cls=EnhancedJSONEncoder)
+
+
+def _select_backend():
+    for name in JSON_BACKENDS:
+        try:
+            return name, _load_backend(name)
+        except ImportError:
+            continue
+
+
+backend_name, _dumps = _select_backend()
+
+
+def set_json_backend(name: str):
+    global backend_name, _dumps
+    _dumps = _load_backend(name)
+    backend_name = name
+
+
+def json_dumps(obj, **kwargs):
+    if len(kwargs) > 0:
+        # formatting options like indent are only supported by the stdlib encoder
+        kwargs['cls'] = EnhancedJSONEncoder
+        return json.dumps(obj, **kwargs)
+    return _dumps(obj)
 
 
 class EnhancedJSONEncoder(json.JSONEncoder):
     def default(self, o):
-        if dataclasses.is_dataclass(o):
-            return dataclasses.asdict(o)
-        if hasattr(o, 'to_dict'):
-            return o.to_dict()
-        return super().default(o)
+        try:
+            return _get_converter(type(o))(o)
+        except TypeError:
+            return super().default(o)
@@ -0,0 +1,140 @@
+from typing import Dict, List, Tuple
+from bisect import bisect_left
+import math
+import time
+
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+QUEUE_WAIT_BUCKETS = [0.001, 0.01, 0.1, 1, 5, 10, 30, 60, 300, 900, 3600]
+
+
+class RollingCounter:
+    """
+    sum over the last window seconds in one second buckets, adding and reading are constant time
+    """
+
+    def __init__(self, window: int = 10):
+        self.window = window
+        self.buckets = [0] * window
+        self.total = 0
+        self.second = int(time.monotonic())
+
+    def _advance(self, second: int):
+        # clears the buckets of the seconds that passed since the last call, at most the whole window
+        for s in range(self.second + 1, min(second, self.second + self.window) + 1):
+            i = s % self.window
+            self.total -= self.buckets[i]
+            self.buckets[i] = 0
+        self.second = max(second, self.second)
+
+    def add(self, amount: float):
+        second = int(time.monotonic())
+        if second != self.second:
+            self._advance(second)
+        self.buckets[second % self.window] += amount
+        self.total += amount
+
+    def get_rate(self) -> float:
+        self._advance(int(time.monotonic()))
+        return self.total / self.window
+
+
+class _Histogram:
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if len(parts) > 0 else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    counters and histograms of the transfer manager, rendered in the prometheus text format on /metrics
+    """
+
+    counters: Dict[str, Tuple[str, Tuple[str, ...], Dict[tuple, float]]] = {}
+    histograms: Dict[str, Tuple[str, Tuple[str, ...], List[float], Dict[tuple, _Histogram]]] = {}
+
+    @classmethod
+    def define_counter(cls, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        cls.counters.setdefault(name, (help_text, label_names, {}))
+
+    @classmethod
+    def define_histogram(cls, name: str, help_text: str, label_names: Tuple[str, ...], bounds: List[float]):
+        cls.histograms.setdefault(name, (help_text, label_names, bounds, {}))
+
+    @classmethod
+    def inc(cls, name: str, labels: tuple = (), amount: float = 1):
+        values = cls.counters[name][2]
+        values[labels] = values.get(labels, 0) + amount
+
+    @classmethod
+    def observe(cls, name: str, value: float, labels: tuple = ()):
+        _, _, bounds, values = cls.histograms[name]
+        histogram = values.get(labels)
+        if histogram is None:
+            histogram = values[labels] = _Histogram(bounds)
+        histogram.observe(value)
+
+    @classmethod
+    def render(cls, gauges: List[Tuple[str, str, Tuple[str, ...], Dict[tuple, float]]] = ()) -> str:
+        # gauges are (name, help, label names, values by labels) that the caller collects at scrape time
+        lines = []
+        for name, (help_text, label_names, values) in cls.counters.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in values.items():
+                lines.append(f"{name}{_format_labels(label_names, labels)} {_format_value(value)}")
+        for name, help_text, label_names, values in gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in values.items():
+                lines.append(f"{name}{_format_labels(label_names, labels)} {_format_value(value)}")
+        for name, (help_text, label_names, bounds, values) in cls.histograms.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in values.items():
+                cumulative = 0
+                for bound, count in zip(bounds + [math.inf], histogram.counts):
+                    cumulative += count
+                    le = 'le="' + _format_value(bound) + '"'
+                    lines.append(f"{name}_bucket{_format_labels(label_names, labels, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(label_names, labels)} {_format_value(histogram.sum)}")
+                lines.append(f"{name}_count{_format_labels(label_names, labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+Metrics.define_histogram(
+    "tm_request_duration_seconds", "duration of requests to the storage worker by operation", ("operation",),
+    LATENCY_BUCKETS,
+)
+Metrics.define_histogram(
+    "tm_time_to_first_byte_seconds", "time from submitting a transfer until its first byte moved", ("type",),
+    LATENCY_BUCKETS,
+)
+Metrics.define_histogram(
+    "tm_queue_wait_seconds", "time work orders waited for a worker", ("type",), QUEUE_WAIT_BUCKETS,
+)
+Metrics.define_counter("tm_transferred_bytes_total", "bytes uploaded or downloaded", ("type",))
+Metrics.define_counter("tm_retries_total", "failed requests by error class", ("type", "error_class"))
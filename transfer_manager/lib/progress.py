@@ -1,37 +1,49 @@
+from .change_version import ChangeVersion
+
+
 class Progress:
+    __slots__ = ("value", "done", "total", "version")
+
     def __init__(self):
         self.value = 0
 
         self.done = 0
         self.total = 0
+        self.version = ChangeVersion.next()  # version of the last change, for the delta api
 
     def set_done(self, done):
+        self.version = ChangeVersion.next()
         self.done = done
         if self.total > 0:
             self.value = self.done / self.total
 
     def increase_done(self, by):
+        self.version = ChangeVersion.next()
         self.done += by
         if self.total > 0:
             self.value = self.done / self.total
 
     def decrease_done(self, by):
+        self.version = ChangeVersion.next()
         self.done -= by
         if self.total > 0:
             self.value = self.done / self.total
 
     def set_total(self, total):
+        self.version = ChangeVersion.next()
         self.total = total
         if self.total > 0:
             self.value = self.done / self.total
 
     def set_done_total(self, done, total):
+        self.version = ChangeVersion.next()
         self.done = done
         self.total = total
         if self.total > 0:
             self.value = self.done / self.total
 
     def set_value(self, value):
+        self.version = ChangeVersion.next()
         self.value = value
         self.done = int(value * self.total)
 
@@ -0,0 +1,135 @@
+from typing import Dict, List, Optional, TypedDict, TYPE_CHECKING
+from datetime import datetime
+import asyncio
+import time
+
+if TYPE_CHECKING:
+    from .transfer import Transfer
+
+SCHEDULE_CHECK_INTERVAL = 10  # seconds
+
+
+class TokenBucket:
+    """
+    token bucket in bytes, rate None means unlimited
+
+    consumers may take more than is in the bucket, they then wait until the debt is paid off,
+    this way chunks bigger than the bucket size still work and throughput matches the rate on average
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst_seconds: float = 1):
+        self.burst_seconds = burst_seconds
+        self.rate = None
+        self.tokens = 0
+        self.updated_at = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate: Optional[float]):
+        if rate is not None and rate <= 0:
+            rate = None
+        self.rate = rate
+        self.tokens = 0 if rate is None else rate * self.burst_seconds
+        self.updated_at = time.monotonic()
+
+    async def consume(self, amount: int):
+        if self.rate is None:
+            return
+
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated_at) * self.rate, self.rate * self.burst_seconds)
+        self.updated_at = now
+        self.tokens -= amount
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class ScheduleEntry(TypedDict):
+    start: str  # HH:MM local time
+    end: str  # HH:MM local time, may be before start to wrap around midnight
+    upload: Optional[float]  # bytes per second, None for unlimited, a missing type keeps its global limit
+    download: Optional[float]
+
+
+def _minutes(hh_mm: str) -> int:
+    hours, minutes = hh_mm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _is_active(entry: ScheduleEntry, now: datetime) -> bool:
+    start = _minutes(entry["start"])
+    end = _minutes(entry["end"])
+    minute = now.hour * 60 + now.minute
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+class BandwidthLimiter:
+    """
+    global limits per transfer type, optional limits per transfer and time of day schedules for the global limits
+
+    a schedule entry that is active overrides the configured global limit of that transfer type
+    """
+
+    def __init__(self):
+        self.limits: Dict[str, Optional[float]] = {"upload": None, "download": None}
+        self.buckets: Dict[str, TokenBucket] = {"upload": TokenBucket(), "download": TokenBucket()}
+        self.transfer_buckets: Dict[str, TokenBucket] = {}
+        self.schedule: List[ScheduleEntry] = []
+        self._schedule_checked_at = 0
+
+    def set_limit(self, transfer_type: str, rate: Optional[float]):
+        self.limits[transfer_type] = rate
+        self._apply_schedule()
+
+    def set_transfer_limit(self, transfer_id: str, rate: Optional[float]):
+        if rate is None or rate <= 0:
+            self.transfer_buckets.pop(transfer_id, None)
+        else:
+            self.transfer_buckets[transfer_id] = TokenBucket(rate)
+
+    def set_schedule(self, schedule: List[ScheduleEntry]):
+        for entry in schedule:
+            # validate before taking over the schedule
+            _minutes(entry["start"])
+            _minutes(entry["end"])
+        self.schedule = schedule
+        self._apply_schedule()
+
+    def get_effective_limit(self, transfer_type: str) -> Optional[float]:
+        now = datetime.now()
+        for entry in self.schedule:
+            if _is_active(entry, now):
+                if transfer_type in entry:
+                    return entry[transfer_type]
+                break
+        return self.limits[transfer_type]
+
+    def _apply_schedule(self):
+        self._schedule_checked_at = time.monotonic()
+        for transfer_type, bucket in self.buckets.items():
+            rate = self.get_effective_limit(transfer_type)
+            if rate != bucket.rate:
+                bucket.set_rate(rate)
+
+    async def consume(self, transfer: "Transfer", amount: int):
+        if len(self.schedule) > 0 and time.monotonic() - self._schedule_checked_at > SCHEDULE_CHECK_INTERVAL:
+            self._apply_schedule()
+
+        await self.buckets[transfer.type].consume(amount)
+        if len(self.transfer_buckets) > 0:
+            bucket = self.transfer_buckets.get(transfer.id)
+            if bucket is not None:
+                await bucket.consume(amount)
+
+    def remove_transfer(self, transfer: "Transfer"):
+        self.transfer_buckets.pop(transfer.id, None)
+
+    def to_dict(self):
+        return {
+            "upload": self.limits["upload"],
+            "download": self.limits["download"],
+            "effective": {k: v.rate for k, v in self.buckets.items()},
+            "transfers": {k: v.rate for k, v in self.transfer_buckets.items()},
+            "schedule": self.schedule,
+        }
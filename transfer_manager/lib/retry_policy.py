@@ -0,0 +1,182 @@
+from typing import Dict, NamedTuple, Optional, TYPE_CHECKING
+from ..apis.r2_worker_shared import HttpStatusException
+from .metrics import Metrics
+import asyncio
+import httpx
+import random
+import time
+
+if TYPE_CHECKING:
+    from .transfer import Transfer
+
+ERROR_CLASS_AUTH = 'auth'  # 401, 403, retrying will not fix the token
+ERROR_CLASS_CLIENT = 'client'  # other 4xx, the request itself is wrong
+ERROR_CLASS_THROTTLED = 'throttled'  # 408, 429
+ERROR_CLASS_SERVER = 'server'  # 5xx
+ERROR_CLASS_TIMEOUT = 'timeout'
+ERROR_CLASS_CONNECTION = 'connection'  # refused, reset, dns
+ERROR_CLASS_OTHER = 'other'
+
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+CIRCUIT_POLL_INTERVAL = 1  # seconds between checks of a waiting worker if the endpoint is back
+
+
+class RetryRule(NamedTuple):
+    retry: bool
+    base_delay: float  # seconds, doubled with every attempt
+    max_delay: float
+    trips_circuit: bool  # counts as a sign that the endpoint is unhealthy
+
+
+DEFAULT_RULES: Dict[str, RetryRule] = {
+    ERROR_CLASS_AUTH: RetryRule(False, 0, 0, False),
+    ERROR_CLASS_CLIENT: RetryRule(False, 0, 0, False),
+    ERROR_CLASS_THROTTLED: RetryRule(True, 5, 120, True),
+    ERROR_CLASS_SERVER: RetryRule(True, 2, 60, True),
+    ERROR_CLASS_TIMEOUT: RetryRule(True, 2, 60, True),
+    ERROR_CLASS_CONNECTION: RetryRule(True, 1, 60, True),
+    ERROR_CLASS_OTHER: RetryRule(True, 1, 30, False),
+}
+
+
+def classify_error(ex: BaseException) -> str:
+    if isinstance(ex, HttpStatusException):
+        if ex.status_code in (401, 403):
+            return ERROR_CLASS_AUTH
+        if ex.status_code in (408, 429):
+            return ERROR_CLASS_THROTTLED
+        if 400 <= ex.status_code <= 499:
+            return ERROR_CLASS_CLIENT
+        return ERROR_CLASS_SERVER
+    if isinstance(ex, (httpx.TimeoutException, asyncio.TimeoutError)):
+        return ERROR_CLASS_TIMEOUT
+    if isinstance(ex, (httpx.NetworkError, httpx.RemoteProtocolError, ConnectionError)):
+        return ERROR_CLASS_CONNECTION
+    return ERROR_CLASS_OTHER
+
+
+def get_backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    # capped exponential backoff with full jitter, so workers that failed together do not retry together
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class RetryBudget:
+    """
+    limits the retries of a transfer to a fixed amount plus a share of its successful requests,
+    so a transfer that mostly fails gives up instead of retrying forever
+    """
+
+    def __init__(self, min_retries: int = 50, ratio: float = 0.2):
+        self.min_retries = min_retries
+        self.ratio = ratio
+        self.successes = 0
+        self.retries = 0
+
+    def record_success(self):
+        self.successes += 1
+
+    def try_spend(self) -> bool:
+        if self.retries >= self.min_retries + self.ratio * self.successes:
+            return False
+        self.retries += 1
+        return True
+
+    def to_dict(self):
+        return {
+            "retries": self.retries,
+            "successes": self.successes,
+        }
+
+
+class CircuitBreaker:
+    """
+    stops sending requests to an endpoint after several failures in a row, after the reset timeout
+    a single request probes the endpoint and closes the circuit again if it succeeds
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened_at = 0
+
+    def allow_request(self) -> bool:
+        if self.state == CIRCUIT_CLOSED:
+            return True
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        # this request is the probe, the next one is allowed if the probe does not report back in time
+        self.state = CIRCUIT_HALF_OPEN
+        self.opened_at = time.monotonic()
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.state = CIRCUIT_CLOSED
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = CIRCUIT_OPEN
+            self.opened_at = time.monotonic()
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+        }
+
+
+class RetryPolicy:
+    """
+    decides if and when a failed request is retried, based on the kind of error, the retry budget of the transfer
+    and the health of the endpoint
+    """
+
+    def __init__(self, rules: Dict[str, RetryRule] = None):
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get_breaker(self, url: str) -> CircuitBreaker:
+        host = httpx.URL(url).host
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker()
+            self.breakers[host] = breaker
+        return breaker
+
+    async def wait_for_endpoint(self, url: str, ct=None):
+        # waiting for an unhealthy endpoint does not use up attempts or retry budget
+        breaker = self.get_breaker(url)
+        while not breaker.allow_request():
+            if ct is not None and ct.is_canceled():
+                return
+            await asyncio.sleep(CIRCUIT_POLL_INTERVAL)
+
+    def on_success(self, url: str, transfer: "Transfer"):
+        self.get_breaker(url).record_success()
+        transfer.retry_budget.record_success()
+
+    def on_failure(self, url: str, ex: BaseException, attempt: int, transfer: "Transfer") -> Optional[float]:
+        # returns how long to wait before the next attempt, None if the request should not be retried
+        error_class = classify_error(ex)
+        Metrics.inc("tm_retries_total", (transfer.type, error_class))
+        rule = self.rules[error_class]
+        if not rule.retry:
+            return None
+        if rule.trips_circuit:
+            breaker = self.get_breaker(url)
+            breaker.record_failure()
+            if breaker.state != CIRCUIT_CLOSED:
+                # the endpoint is down, that is not the fault of the transfer, so it does not cost budget
+                return get_backoff_delay(attempt, rule.base_delay, rule.max_delay)
+        if not transfer.retry_budget.try_spend():
+            return None
+        return get_backoff_delay(attempt, rule.base_delay, rule.max_delay)
+
+    def to_dict(self):
+        return {host: breaker.to_dict() for host, breaker in self.breakers.items()}
@@ -49,6 +49,30 @@ def download_unzip(zip_hash: str, api_token: str):
     }
 
 
+def download_manifest(zip_hash: str, api_token: str):
+    # rebuilds package.zip from the blobs listed in the manifest of a deduplicated upload, then unzips it
+    return {
+        "operation": "exe",
+        "arguments": {"input": "python", "one_shot": True},
+        "variables": [
+            "assets/scripts/files/unzip_manifest.py",
+            "--zip",
+            "{node_folder}/{job_id}/input/package.zip",
+            "--extract-folder",
+            "{node_folder}/{job_id}/input/",
+            "--manifest-url",
+            f"{R2_WORKER_ENDPOINT}/{{job_id}}/input/package.manifest.json?octa_api_token={api_token}",
+            "--blob-url",
+            f"{R2_WORKER_ENDPOINT}/",
+            "--api-token",
+            api_token,
+            "--hash",
+            zip_hash,
+            "--dont-ensure-exists",
+        ],
+    }
+
+
 def blender(
     blend_file_name, render_format=None, frame_step=1, match_scene_format=False
 ):
@@ -193,10 +217,11 @@ def get_operations(
     zip_hash: str,
     frame_step: int,
     api_token: str,
+    from_manifest: bool = False,
 ):
     return [
         stopwatch("start", "frame"),
-        download_unzip(zip_hash, api_token),
+        download_manifest(zip_hash, api_token) if from_manifest else download_unzip(zip_hash, api_token),
         blender(
             blend_file_name=blend_file_name,
             render_format=render_format,
@@ -0,0 +1,147 @@
+from typing import Dict, Optional, TYPE_CHECKING
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+if TYPE_CHECKING:
+    from .transfer import Transfer
+
+DEFAULT_PRIORITY = 1
+
+
+class Scheduler(ABC):
+    """
+    decides which of the running transfers of a queue gets the next worker
+
+    the queue adds transfers that have pending work orders and removes them once they run out,
+    a higher transfer priority gives a transfer a bigger share or serves it first, depending on the scheduler
+    """
+
+    name = ""
+
+    def __init__(self):
+        self.transfers: "OrderedDict[str, Transfer]" = OrderedDict()
+
+    def __len__(self):
+        return len(self.transfers)
+
+    def add(self, transfer: "Transfer"):
+        self.transfers[transfer.id] = transfer
+
+    def remove(self, transfer: "Transfer"):
+        self.transfers.pop(transfer.id, None)
+
+    @abstractmethod
+    def pick(self) -> Optional["Transfer"]:
+        pass
+
+    def on_dispatch(self, transfer: "Transfer", work_order):
+        pass
+
+
+class FifoScheduler(Scheduler):
+    """
+    serves the transfer that was added first until it runs out of work, higher priorities go first
+    """
+
+    name = "fifo"
+
+    def pick(self) -> Optional["Transfer"]:
+        best = None
+        for transfer in self.transfers.values():
+            if best is None or transfer.priority > best.priority:
+                best = transfer
+        return best
+
+
+class RoundRobinScheduler(Scheduler):
+    """
+    takes turns between transfers, a transfer gets as many work orders in a row as its priority
+    """
+
+    name = "round_robin"
+
+    def __init__(self):
+        super().__init__()
+        self.served_in_turn = 0
+
+    def add(self, transfer: "Transfer"):
+        if transfer.id not in self.transfers:
+            super().add(transfer)
+
+    def remove(self, transfer: "Transfer"):
+        if len(self.transfers) > 0 and next(iter(self.transfers)) == transfer.id:
+            self.served_in_turn = 0
+        super().remove(transfer)
+
+    def pick(self) -> Optional["Transfer"]:
+        if len(self.transfers) == 0:
+            return None
+        return next(iter(self.transfers.values()))
+
+    def on_dispatch(self, transfer: "Transfer", work_order):
+        self.served_in_turn += 1
+        if self.served_in_turn >= max(transfer.priority, 1):
+            self.served_in_turn = 0
+            self.transfers.move_to_end(transfer.id)
+
+
+class WeightedFairScheduler(Scheduler):
+    """
+    weighted fair queuing, every transfer gets a share of the work proportional to its priority
+
+    a transfer is charged the cost of each work order it gets divided by its priority, the transfer that was
+    charged the least goes next, transfers that join start at the current virtual time so they can not
+    catch up on the time they were not there
+    """
+
+    name = "weighted_fair"
+
+    def __init__(self):
+        super().__init__()
+        self.virtual_time = 0.0
+        self.finish_tags: Dict[str, float] = {}
+
+    def add(self, transfer: "Transfer"):
+        if transfer.id not in self.transfers:
+            self.finish_tags[transfer.id] = max(self.finish_tags.get(transfer.id, 0.0), self.virtual_time)
+        super().add(transfer)
+
+    def remove(self, transfer: "Transfer"):
+        super().remove(transfer)
+        self.finish_tags.pop(transfer.id, None)
+
+    def pick(self) -> Optional["Transfer"]:
+        best = None
+        for transfer in self.transfers.values():
+            if best is None or self.finish_tags[transfer.id] < self.finish_tags[best.id]:
+                best = transfer
+        return best
+
+    def on_dispatch(self, transfer: "Transfer", work_order):
+        self.virtual_time = self.finish_tags[transfer.id]
+        priority = transfer.priority if transfer.priority > 0 else DEFAULT_PRIORITY
+        self.finish_tags[transfer.id] += transfer.get_work_order_cost(work_order) / priority
+
+
+class ShortestRemainingFirstScheduler(Scheduler):
+    """
+    serves the transfer with the least remaining work first, so small jobs do not wait behind big ones,
+    higher priorities go first
+    """
+
+    name = "shortest_remaining_first"
+
+    def pick(self) -> Optional["Transfer"]:
+        best = None
+        best_key = None
+        for transfer in self.transfers.values():
+            key = (-transfer.priority, transfer.progress.total - transfer.progress.done)
+            if best is None or key < best_key:
+                best = transfer
+                best_key = key
+        return best
+
+
+SCHEDULERS = {
+    s.name: s for s in [FifoScheduler, RoundRobinScheduler, WeightedFairScheduler, ShortestRemainingFirstScheduler]
+}
@@ -1,8 +1,16 @@
-from typing import List
+from typing import Dict, List, Optional, TYPE_CHECKING
 from abc import ABC, abstractmethod
+from collections import deque
 from .progress import Progress
+from .change_version import ChangeVersion
+from .scheduler import DEFAULT_PRIORITY
+from .retry_policy import RetryBudget
+from .metrics import Metrics, RollingCounter
 import time
 
+if TYPE_CHECKING:
+    from .transfer_queue import TransferQueue
+
 TRANSFER_STATUS_CREATED = 'created'
 TRANSFER_STATUS_RUNNING = 'running'
 TRANSFER_STATUS_PAUSED = 'paused'
@@ -21,11 +29,46 @@ class Transfer(ABC):
         self.metadata = metadata
 
         self.progress = Progress()
-        self.status = TRANSFER_STATUS_CREATED
-        self.status_text = ""
+        self.changed_at = ChangeVersion.next()
+        self._status = TRANSFER_STATUS_CREATED
+        self._status_text = ""
         self.created = time.time()
+        self.submitted_at = self.created  # when the request that created the transfer came in
         self.finished_at = 0
+        self.first_byte_at = 0
+        self.priority = DEFAULT_PRIORITY
+        self.retry_budget = RetryBudget()
+        self.speed = RollingCounter()  # bytes moved in the last seconds
         self.work_orders = []
+        self.work_order_counts: Dict[str, int] = {  # number of work orders per status, kept up to date by the work orders
+            TRANSFER_STATUS_CREATED: 0,
+            TRANSFER_STATUS_RUNNING: 0,
+            TRANSFER_STATUS_SUCCESS: 0,
+            TRANSFER_STATUS_FAILURE: 0,
+        }
+        self._pending = deque()  # work orders waiting for a worker, in the order they should be picked up
+        self.queued_at = 0  # when the transfer last joined its queue, its pending work orders wait since then
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    @status.setter
+    def status(self, status: str):
+        self._status = status
+        self.changed_at = ChangeVersion.next()
+
+    @property
+    def status_text(self) -> str:
+        return self._status_text
+
+    @status_text.setter
+    def status_text(self, status_text: str):
+        self._status_text = status_text
+        self.changed_at = ChangeVersion.next()
+
+    def get_version(self) -> int:
+        return max(self.changed_at, self.progress.version)
 
     @abstractmethod
     def start(self):
@@ -39,7 +82,92 @@ class Transfer(ABC):
     def pause(self):
         pass
 
-    def to_dict(self):
+    def get_queue(self) -> "TransferQueue":
+        from .transfer_manager import get_transfer_manager
+
+        return get_transfer_manager().get_queue(self.type)
+
+    def save_state(self, work_order=None):
+        # marks the transfer (and a work order of it) to be written to the journal, so it can be resumed after a restart
+        from .transfer_manager import get_transfer_manager
+
+        get_transfer_manager().journal.save(self, work_order)
+
+    def on_work_order_status(self, work_order, old_status: Optional[str], new_status: str):
+        if old_status is not None:
+            self.work_order_counts[old_status] -= 1
+        self.work_order_counts[new_status] = self.work_order_counts.get(new_status, 0) + 1
+        self.changed_at = ChangeVersion.next()
+
+    def add_work_order(self, work_order):
+        self.work_orders.append(work_order)
+        self._pending.append(work_order)
+
+    def add_pending_work_orders_front(self, work_orders: list):
+        # work that is split off a running work order, it is picked up before work orders that have not started yet
+        self._pending.extendleft(reversed(work_orders))
+        if self.status == TRANSFER_STATUS_RUNNING:
+            self.get_queue().add_transfer(self)
+
+    def on_queued(self):
+        # called when the transfer joins its queue, time spent paused or before the start does not count as waiting
+        self.queued_at = time.time()
+        for work_order in self._pending:
+            work_order.queued_at = self.queued_at
+
+    def has_pending_work_orders(self) -> bool:
+        return len(self._pending) > 0
+
+    def pop_pending_work_order(self):
+        while len(self._pending) > 0:
+            work_order = self._pending.popleft()
+            if work_order.status == TRANSFER_STATUS_CREATED:
+                return work_order
+        return None
+
+    def requeue_work_order(self, work_order):
+        # work order was picked up by a worker that stopped before finishing it, put it back in front
+        work_order.status = TRANSFER_STATUS_CREATED
+        work_order.queued_at = time.time()
+        self._pending.appendleft(work_order)
+        if self.status == TRANSFER_STATUS_RUNNING:
+            self.get_queue().add_transfer(self)
+
+    def mark_first_byte(self):
+        if self.first_byte_at == 0:
+            self.first_byte_at = time.time()
+            Metrics.observe("tm_time_to_first_byte_seconds", self.first_byte_at - self.submitted_at, (self.type,))
+
+    def get_time_to_first_byte(self):
+        if self.first_byte_at == 0:
+            return None
+        return self.first_byte_at - self.submitted_at
+
+    def set_priority(self, priority: int):
+        self.priority = priority
+        self.changed_at = ChangeVersion.next()
+        self.save_state()
+
+    def get_work_order_cost(self, work_order) -> float:
+        # what serving a work order costs a transfer in the fair scheduler
+        return 1
+
+    def get_work_order(self, journal_key: int):
+        for work_order in self.work_orders:
+            if work_order.journal_key == journal_key:
+                return work_order
+        return None
+
+    def get_changed_work_orders(self, since: int) -> list:
+        return [wo for wo in self.work_orders if wo.get_version() > since]
+
+    def delta_dict(self, since: int):
+        # the transfer without its work order list, plus the work orders that changed after the given version
+        d = self.to_dict(work_orders=False)
+        d["changed_work_orders"] = [wo.small_dict() for wo in self.get_changed_work_orders(since)]
+        return d
+
+    def to_dict(self, work_orders: bool = True):
         return {
             "id": self.id,
             "type": self.type,
@@ -49,5 +177,8 @@ class Transfer(ABC):
             "created": self.created,
             "age": time.time() - self.created,
             "finished_at": self.finished_at,
+            "submit_to_first_byte": self.get_time_to_first_byte(),
+            "priority": self.priority,
+            "bytes_per_second": self.speed.get_rate(),
             "metadata": self.metadata,
         }
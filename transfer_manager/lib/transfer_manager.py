@@ -1,21 +1,60 @@
-from .transfer import Transfer
+from .transfer import Transfer, TransferException, TRANSFER_STATUS_PAUSED
 from .transfer_queue import TransferQueue
+from .concurrency_controller import ConcurrencyController
+from .rate_limiter import BandwidthLimiter
+from .journal import Journal
+from .retry_policy import RetryPolicy
 from .download.download_queue_worker import DownloadQueueWorker
 from .download.download_work_order import DownloadWorkOrder
 from .upload.upload_queue_worker import UploadQueueWorker
 from .upload.upload_work_order import UploadWorkOrder
+from .upload.upload import Upload
+from .download.download import Download
+from .change_version import ChangeVersion
+from ..apis.http_pool import HttpPool
+from sanic.log import logger
+from collections import deque
+import asyncio
 
 from typing import Dict
 
+# downloads are many small files where latency dominates, uploads are few big parts that saturate a link sooner
+DOWNLOAD_MAX_WORKERS = 32
+UPLOAD_MAX_WORKERS = 16
+REMOVED_TRANSFERS_KEPT = 1000  # removals a delta client can miss before it has to fetch everything again
+
 
 class TransferManager:
-    def __init__(self):
+    def __init__(self, download_max_workers=DOWNLOAD_MAX_WORKERS, upload_max_workers=UPLOAD_MAX_WORKERS):
         self.transfers: Dict[str, Transfer] = {}
-        self.download_queue = TransferQueue[DownloadWorkOrder]("download", DownloadQueueWorker)
+        self.removed_transfers = deque()  # (version, transfer id) of removed transfers, for the delta api
+        self.removed_transfers_floor = 0  # clients with an older version missed removals
+        self.bandwidth_limiter = BandwidthLimiter()
+        self.journal = Journal()
+        self.journal.start()
+        self.retry_policy = RetryPolicy()  # shared, both queues talk to the same endpoint
+        self.download_queue = TransferQueue[DownloadWorkOrder](
+            "download",
+            DownloadQueueWorker,
+            ConcurrencyController(min_workers=1, max_workers=download_max_workers, sample_interval=2),
+            self.bandwidth_limiter,
+            retry_policy=self.retry_policy,
+        )
         self.download_queue.start()
-        self.upload_queue = TransferQueue[UploadWorkOrder]("upload", UploadQueueWorker)
+        self.upload_queue = TransferQueue[UploadWorkOrder](
+            "upload",
+            UploadQueueWorker,
+            ConcurrencyController(min_workers=1, max_workers=upload_max_workers, sample_interval=5),
+            self.bandwidth_limiter,
+            retry_policy=self.retry_policy,
+        )
         self.upload_queue.start()
 
+    def get_queue(self, transfer_type: str) -> TransferQueue:
+        if transfer_type == "download":
+            return self.download_queue
+        return self.upload_queue
+
     def add(self, transfer: Transfer):
         self.transfers[transfer.id] = transfer
 
@@ -26,11 +65,61 @@ class TransferManager:
         if transfer.id in self.transfers:
             transfer.stop()
             self.transfers.pop(transfer.id)
+            self.bandwidth_limiter.remove_transfer(transfer)
+            self.journal.remove(transfer.id)
+            self.removed_transfers.append((ChangeVersion.next(), transfer.id))
+            if len(self.removed_transfers) > REMOVED_TRANSFERS_KEPT:
+                self.removed_transfers_floor = self.removed_transfers.popleft()[0]
 
     def remove_by_id(self, id: str):
         if id in self.transfers:
             self.remove(self.transfers[id])
 
+    def get_delta(self, since: int):
+        # everything that changed after the version since, a client that is too far behind gets a full state
+        version = ChangeVersion.value
+        full = since <= 0 or since < self.removed_transfers_floor
+        if full:
+            since = 0
+        return {
+            "version": version,
+            "full": full,
+            "transfers": [t.delta_dict(since) for t in self.transfers.values() if t.get_version() > since],
+            "removed": [transfer_id for v, transfer_id in self.removed_transfers if v > since and not full],
+        }
+
+    async def restore(self):
+        # resumes the transfers that were unfinished when the transfer manager stopped
+        for transfer_type, state, work_order_states in await asyncio.to_thread(self.journal.load):
+            transfer_class = Download if transfer_type == "download" else Upload
+            try:
+                transfer = await transfer_class.from_journal(state, work_order_states)
+            except (TransferException, FileNotFoundError):
+                logger.exception(f"transfer {state['id']} can not be resumed, dropping it")
+                self.journal.remove(state["id"])
+                continue
+            except Exception:
+                # most likely the network is not there yet, keep it in the journal for the next start
+                logger.exception(f"could not resume transfer {state['id']}")
+                continue
+
+            logger.info(f"resuming {transfer_type} {transfer.id}")
+            self.add(transfer)
+            if state["status"] == TRANSFER_STATUS_PAUSED:
+                transfer.status = TRANSFER_STATUS_PAUSED
+            else:
+                transfer.start()
+
+            # transfers that had all work orders done before the restart, still need to be finished
+            if isinstance(transfer, Upload):
+                await transfer.update()
+            else:
+                transfer.update()
+
+    async def close(self):
+        await self.journal.close()
+        await HttpPool.close()
+
 
 _transfer_manager: TransferManager = None
 
@@ -40,3 +129,11 @@ def get_transfer_manager() -> TransferManager:
     if _transfer_manager is None:
         _transfer_manager = TransferManager()
     return _transfer_manager
+
+
+async def restore_transfers(_app):
+    await get_transfer_manager().restore()
+
+
+async def close_transfer_manager(_app):
+    await get_transfer_manager().close()
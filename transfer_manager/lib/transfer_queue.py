@@ -1,61 +1,139 @@
-from .transfer import TRANSFER_STATUS_RUNNING, TRANSFER_STATUS_PAUSED, TRANSFER_STATUS_CREATED
+from .transfer import TRANSFER_STATUS_RUNNING, TRANSFER_STATUS_PAUSED
 from .transfer_queue_worker import TransferQueueWorker
-from typing import Optional, TypeVar, Generic, List
+from .concurrency_controller import ConcurrencyController
+from .rate_limiter import BandwidthLimiter
+from .retry_policy import RetryPolicy
+from .metrics import Metrics
+from .scheduler import Scheduler, WeightedFairScheduler, SCHEDULERS
+from typing import Optional, TypeVar, Generic, List, TYPE_CHECKING
+import asyncio
+import time
+
+if TYPE_CHECKING:
+    from .transfer import Transfer
 
 T_WorkOrder = TypeVar("T_WorkOrder")
-MAX_WORKERS = 6
 
 
 class TransferQueue(Generic[T_WorkOrder]):
-    def __init__(self, transfer_type: str, worker_class: type):
+    def __init__(
+        self,
+        transfer_type: str,
+        worker_class: type,
+        controller: ConcurrencyController,
+        bandwidth_limiter: BandwidthLimiter,
+        scheduler: Optional[Scheduler] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+    ):
         self.transfer_type = transfer_type
         self.worker_class = worker_class
+        self.controller = controller
+        self.bandwidth_limiter = bandwidth_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
 
         self.status = TRANSFER_STATUS_RUNNING
         self.workers: List[TransferQueueWorker] = []
 
+        # knows the running transfers that have pending work orders and which of them gets served next
+        self.scheduler = scheduler if scheduler is not None else WeightedFairScheduler()
+        self._work_available = asyncio.Event()
+
     def start(self):
-        for _ in range(1):
-            self._add_worker()
+        self._scale()
 
     def pause(self):
         self.status = TRANSFER_STATUS_PAUSED
 
     def resume(self):
         self.status = TRANSFER_STATUS_RUNNING
+        self._work_available.set()
+
+    def add_transfer(self, transfer: "Transfer"):
+        # called when a transfer starts or resumes, or when it gets work orders back
+        if transfer.has_pending_work_orders():
+            if transfer.id not in self.scheduler.transfers:
+                transfer.on_queued()
+            self.scheduler.add(transfer)
+            self._work_available.set()
+
+    def remove_transfer(self, transfer: "Transfer"):
+        # called when a transfer is paused or stopped, its pending work orders stay with the transfer
+        self.scheduler.remove(transfer)
 
-    def _add_worker(self):
-        if len(self.workers) < MAX_WORKERS:
+    def set_scheduler(self, name: str):
+        scheduler = SCHEDULERS[name]()
+        for transfer in self.scheduler.transfers.values():
+            scheduler.add(transfer)
+        self.scheduler = scheduler
+
+    def _scale(self, keep=None):
+        # start or stop workers until the worker count matches what the controller decided, never stops keep
+        while len(self.workers) < self.controller.target:
             worker = self.worker_class(self)
             self.workers.append(worker)
             worker.start()
+        for w in reversed(self.workers[:]):
+            if len(self.workers) <= self.controller.target:
+                break
+            if w != keep:
+                self.workers.remove(w)
+                w.stop()
 
-    async def get_next_work_order(self) -> Optional[T_WorkOrder]:
-        if self.status == TRANSFER_STATUS_PAUSED:
-            return None
+    def get_throughput(self) -> float:
+        return sum(w.transfer_speed.value for w in self.workers)
 
-        from .transfer_manager import get_transfer_manager
+    def get_worker_speed(self) -> float:
+        # average speed of a single worker in bytes per second, 0 if nothing was measured yet
+        speeds = [w.transfer_speed.value for w in self.workers if w.transfer_speed.value > 0]
+        if len(speeds) == 0:
+            return 0
+        return sum(speeds) / len(speeds)
 
-        for k, v in get_transfer_manager().transfers.items():
-            if v.type == self.transfer_type:
-                if v.status == TRANSFER_STATUS_RUNNING:
-                    for wo in v.work_orders:
-                        if wo.status == TRANSFER_STATUS_CREATED:
-                            wo.status = TRANSFER_STATUS_RUNNING
-                            return wo
+    def _pop_work_order(self) -> Optional[T_WorkOrder]:
+        while len(self.scheduler) > 0:
+            transfer = self.scheduler.pick()
+            wo = None
+            if transfer.status == TRANSFER_STATUS_RUNNING:
+                wo = transfer.pop_pending_work_order()
+            if wo is not None:
+                self.scheduler.on_dispatch(transfer, wo)
+                Metrics.observe("tm_queue_wait_seconds", time.time() - wo.queued_at, (self.transfer_type,))
+                wo.status = TRANSFER_STATUS_RUNNING
+                return wo
+            self.scheduler.remove(transfer)
         return None
 
+    async def get_next_work_order(self, timeout: float = 1) -> Optional[T_WorkOrder]:
+        # waits for work to become available, returns None after timeout so workers can check for cancellation
+        while True:
+            if self.status != TRANSFER_STATUS_PAUSED:
+                wo = self._pop_work_order()
+                if wo is not None:
+                    return wo
+            self._work_available.clear()
+            try:
+                await asyncio.wait_for(self._work_available.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
     def notify_workorder_retry(self, sender):
-        if len(self.workers) > 1:
-            for i in range(len(self.workers)):
-                w = self.workers[i]
-                if w != sender:
-                    self.workers.remove(w)
-                    w.stop()
-                    return
+        self.controller.on_retry(self.get_throughput())
+        self._scale(keep=sender)
 
     def notify_workorder_success(self, sender):
-        self._add_worker()
+        self.controller.on_success(self.get_throughput())
+        self._scale(keep=sender)
 
     def notify_worker_end(self, sender: TransferQueueWorker):
-        self.workers.remove(sender)
+        if sender in self.workers:
+            self.workers.remove(sender)
+
+    def to_dict(self):
+        return {
+            "status": self.status,
+            "workers": len(self.workers),
+            "scheduler": self.scheduler.name,
+            "throughput": self.get_throughput(),
+            "controller": self.controller.to_dict(),
+            "circuit_breakers": self.retry_policy.to_dict(),
+        }
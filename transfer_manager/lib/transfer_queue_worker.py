@@ -6,6 +6,7 @@ from traceback import format_exception
 from .transfer import TRANSFER_STATUS_PAUSED, TRANSFER_STATUS_SUCCESS
 from .cancellation_token import CancellationToken
 from .transfer_speed import TransferSpeed
+from .metrics import Metrics
 from abc import ABC,abstractmethod
 
 if TYPE_CHECKING:
@@ -26,6 +27,12 @@ class TransferQueueWorker:
     def stop(self):
         self.ct.cancel()
 
+    def _on_bytes(self, transfer, amount: int):
+        # called for every chunk that was sent or received
+        self.transfer_speed.update(amount)
+        transfer.speed.add(amount)
+        Metrics.inc("tm_transferred_bytes_total", (transfer.type,), amount)
+
     async def _check_pause(self):
         while self.queue.status == TRANSFER_STATUS_PAUSED:
             await asyncio.sleep(1)
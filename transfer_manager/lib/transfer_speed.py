@@ -1,30 +1,25 @@
+from collections import deque
 import time
 
 
 class TransferSpeed:
     def __init__(self, keep_num_entries=20):
         self.keep_num_entries = keep_num_entries
-        self.entries = []
+        self.entries = deque(maxlen=keep_num_entries)
+        self.bytes_transfered = 0  # sum of the entries, kept up to date instead of summing on every update
 
         self.value = 0
 
     def update(self, transfered_since_last_update):
         now = time.time()
-        entry = (now, transfered_since_last_update)
-        self.entries.append(entry)
-        if len(self.entries) > self.keep_num_entries:  # truncate list
-            self.entries = self.entries[-self.keep_num_entries:]
+        if len(self.entries) == self.keep_num_entries:  # oldest entry drops out of the window
+            self.bytes_transfered -= self.entries[0][1]
+        self.entries.append((now, transfered_since_last_update))
+        self.bytes_transfered += transfered_since_last_update
 
         if len(self.entries) > 1:
-            start = self.entries[0][0]
-            end = self.entries[-1][0]
-            diff = end - start
-
+            diff = self.entries[-1][0] - self.entries[0][0]
             if diff > 0:
-                bytes_transfered = 0
-                for e in self.entries:
-                    bytes_transfered += e[1]
-
-                self.value = bytes_transfered / diff
+                self.value = self.bytes_transfered / diff
         else:
             self.value = 0
@@ -0,0 +1,96 @@
+from typing import List, NamedTuple, Tuple
+import hashlib
+import zipfile
+
+DEDUP_BLOB_PREFIX = "blobs"
+DEDUP_SMALL_CHUNK_SIZE = 8 * 1024 * 1024  # small zip entries are grouped into chunks of about this size
+DEDUP_MAX_GROUP_SIZE = 4 * DEDUP_SMALL_CHUNK_SIZE  # a group of small entries is cut here even without a boundary
+# big entries are cut into chunks of this size, it does not follow the part size so the chunks stay the same
+DEDUP_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+MANIFEST_VERSION = 1
+
+
+class Chunk(NamedTuple):
+    offset: int
+    size: int
+    hash: str  # sha256 of the bytes of the chunk, the blob is stored under it
+
+
+def get_blob_path(chunk_hash: str) -> str:
+    return f"{DEDUP_BLOB_PREFIX}/{chunk_hash}"
+
+
+def _is_group_end(info: zipfile.ZipInfo, size: int) -> bool:
+    # decided by the entry alone, so adding or removing an entry only moves the boundaries of its own group,
+    # an entry ends its group with a chance of its share of the chunk size, groups are about that big on average
+    key = hashlib.blake2b(f"{info.filename}\0{info.CRC}".encode(), digest_size=8).digest()
+    return int.from_bytes(key, "little") % DEDUP_SMALL_CHUNK_SIZE < size
+
+
+def get_zip_ranges(path: str, max_chunk_size: int = DEDUP_MAX_CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """
+    splits a zip into byte ranges at the start of its entries, an entry that did not change between two
+    packages is the same bytes in both, no matter where in the zip it ended up
+    """
+    with zipfile.ZipFile(path) as z:
+        infos = sorted(z.infolist(), key=lambda info: info.header_offset)
+        central_directory_offset = z.start_dir
+    with open(path, 'rb') as f:
+        file_size = f.seek(0, 2)
+
+    boundaries = [info.header_offset for info in infos] + [central_directory_offset]
+    # data in front of the first entry, like a self extracting stub, goes with the first range
+    boundaries[0] = 0
+    entries = [(info, start, end - start) for info, start, end in zip(infos, boundaries, boundaries[1:])]
+
+    ranges = []
+    group_start = None
+    group_size = 0
+    for info, start, size in entries:
+        if size >= DEDUP_SMALL_CHUNK_SIZE:
+            if group_start is not None:
+                ranges.append((group_start, group_size))
+                group_start = None
+                group_size = 0
+            for offset in range(start, start + size, max_chunk_size):
+                ranges.append((offset, min(max_chunk_size, start + size - offset)))
+            continue
+        if group_start is None:
+            group_start = start
+        group_size += size
+        if _is_group_end(info, size) or group_size >= DEDUP_MAX_GROUP_SIZE:
+            ranges.append((group_start, group_size))
+            group_start = None
+            group_size = 0
+    if group_start is not None:
+        ranges.append((group_start, group_size))
+    ranges.append((boundaries[-1], file_size - boundaries[-1]))
+    return [r for r in ranges if r[1] > 0]
+
+
+def hash_chunks(path: str, ranges: List[Tuple[int, int]]) -> List[Chunk]:
+    chunks = []
+    with open(path, 'rb') as f:
+        for offset, size in ranges:
+            hasher = hashlib.sha256()
+            f.seek(offset)
+            left = size
+            while left > 0:
+                data = f.read(min(left, 16 * 1024 * 1024))
+                if not data:
+                    raise EOFError(f"{path} ended before {offset + size}")
+                hasher.update(data)
+                left -= len(data)
+            chunks.append(Chunk(offset, size, hasher.hexdigest()))
+    return chunks
+
+
+def build_manifest(chunks: List[Chunk], file_size: int, file_hash: str) -> dict:
+    # the node downloads the blobs in order and writes them one after the other to get the original zip back
+    return {
+        "version": MANIFEST_VERSION,
+        "size": file_size,
+        "md5": file_hash,
+        "blob_prefix": DEDUP_BLOB_PREFIX,
+        "chunks": [{"hash": c.hash, "size": c.size} for c in chunks],
+    }
@@ -0,0 +1,26 @@
+from typing import Iterator
+from .positional_file import PositionalFile
+
+
+class PartReader:
+    """
+    yields a byte range of an upload as memoryview chunks
+
+    the chunks are positional reads of the upload file, so no part is kept in memory and workers do not share a
+    file position. every iteration reads the range from disk (or the os page cache) again, which makes retries cheap
+    """
+
+    def __init__(self, file: PositionalFile, offset: int, size: int, chunk_size: int):
+        self.file = file
+        self.offset = offset
+        self.size = size
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self) -> Iterator[memoryview]:
+        self.file.will_need(self.offset, self.size)
+        end = self.offset + self.size
+        for i in range(self.offset, end, self.chunk_size):
+            yield self.file.read(i, min(self.chunk_size, end - i))
@@ -0,0 +1,78 @@
+from typing import Optional, BinaryIO
+from sanic.log import logger
+import mmap
+import os
+import threading
+
+
+class PositionalFile:
+    """
+    read only file that many workers can read from at arbitrary offsets at the same time
+
+    there is no shared file position, so there is nothing another worker could move between a seek and a read.
+    the file is memory mapped and reads are zero copy slices of the mapping, if the file can not be mapped
+    (empty files, some network shares) reads fall back to positional reads on the file descriptor
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[BinaryIO] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._view: Optional[memoryview] = None
+        self._open_lock = threading.Lock()  # only taken until the file is open, reads never wait for it
+
+    def open(self):
+        if self._file is not None:
+            return
+        with self._open_lock:
+            if self._file is not None:
+                return
+            file = open(self.path, "rb")
+            try:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._view = memoryview(self._mmap)
+            except (ValueError, OSError) as ex:
+                logger.debug(f"could not memory map {self.path}, falling back to positional reads: {ex}")
+                self._mmap = None
+                self._view = None
+            # set last, a reader that sees the file open also sees the mapping
+            self._file = file
+
+    def read(self, offset: int, size: int) -> memoryview:
+        self.open()
+        if self._view is not None:
+            return self._view[offset:offset + size]
+        return memoryview(self._pread(offset, size))
+
+    def will_need(self, offset: int, size: int):
+        # hint the os to start reading the range from disk in the background, so the event loop does not stall on page faults
+        if self._mmap is None or not hasattr(mmap, "MADV_WILLNEED"):
+            return
+        page_offset = offset - offset % mmap.ALLOCATIONGRANULARITY
+        try:
+            self._mmap.madvise(mmap.MADV_WILLNEED, page_offset, size + offset - page_offset)
+        except (ValueError, OSError):
+            pass
+
+    def _pread(self, offset: int, size: int) -> bytes:
+        if hasattr(os, "pread"):
+            return os.pread(self._file.fileno(), size, offset)
+        # no pread on windows, a handle per read keeps reads independent of each other
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # a part reader still holds a slice, the mapping gets closed once it is garbage collected
+                logger.debug(f"mapping of {self.path} still in use, not closing it")
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -10,20 +10,62 @@ from ...apis.sarfis import Sarfis
 from ..util import get_next_id, get_file_md5, async_with_retries
 from ..sarfis_operations import get_operations
 from ..user_data import UserData
-from typing import TypedDict, BinaryIO
+from typing import TypedDict, Dict, List
 from ..version import version
 from ...apis.r2_worker import AsyncR2Worker
+from ...apis.r2_worker_shared import R2_WORKER_ENDPOINT, HttpStatusException
+from ...apis.http_pool import HttpPool
 from traceback import format_exc
 from .upload_work_order import UploadWorkOrder
+from .positional_file import PositionalFile
+from .dedup import Chunk, DEDUP_BLOB_PREFIX, get_blob_path, get_zip_ranges, hash_chunks, build_manifest
+from ..scheduler import DEFAULT_PRIORITY
 import asyncio
 import os
 import math
 from sanic.log import logger
 import webbrowser
+import json
 import shutil
 import time
 
-UPLOAD_PART_SIZE = 6 * 1024 * 1024  # 6 MB
+UPLOAD_PART_SIZE = 6 * 1024 * 1024  # 6 MB, the single upload threshold and the smallest part size on fast links
+MIN_PART_SIZE = 5 * 1024 * 1024  # r2 rejects non-final parts below 5 MB
+MAX_PART_SIZE = 512 * 1024 * 1024  # r2 allows up to 5 GB, but a failed part this big is already expensive to retry
+MAX_PART_COUNT = 10000  # r2 multipart limit
+TARGET_PART_COUNT = 1000  # huge files get bigger parts to stay around this part count
+TARGET_PART_DURATION = 20  # seconds a single part should take at the measured upload speed
+PART_SIZE_ALIGNMENT = 1024 * 1024
+
+# what an upload does before and after its parts are done, it only ever moves forward through these
+UPLOAD_PHASE_PREPARING = 'preparing'  # splitting a deduplicated upload into chunks, it has no parts yet
+UPLOAD_PHASE_TRANSFERRING = 'transferring'
+UPLOAD_PHASE_COMPLETING = 'completing'  # completing the multipart upload and creating the job
+UPLOAD_PHASE_ABORTING = 'aborting'  # aborting the multipart upload after parts failed
+UPLOAD_PHASE_DONE = 'done'
+
+UPLOAD_PHASE_TRANSITIONS = {
+    UPLOAD_PHASE_PREPARING: [UPLOAD_PHASE_TRANSFERRING],
+    UPLOAD_PHASE_TRANSFERRING: [UPLOAD_PHASE_COMPLETING, UPLOAD_PHASE_ABORTING],
+    UPLOAD_PHASE_COMPLETING: [UPLOAD_PHASE_DONE],
+    UPLOAD_PHASE_ABORTING: [UPLOAD_PHASE_DONE],
+    UPLOAD_PHASE_DONE: [],
+}
+
+
+def get_part_size(file_size: int, worker_speed: float) -> int:
+    # bigger parts for huge files, so we do not pay per part overhead thousands of times
+    part_size = max(UPLOAD_PART_SIZE, math.ceil(file_size / TARGET_PART_COUNT))
+
+    # smaller parts on slow links, so a retry does not throw away minutes of progress
+    if worker_speed > 0:
+        part_size = min(part_size, int(worker_speed * TARGET_PART_DURATION))
+
+    part_size = min(max(part_size, MIN_PART_SIZE), MAX_PART_SIZE)
+    part_size = math.ceil(part_size / PART_SIZE_ALIGNMENT) * PART_SIZE_ALIGNMENT
+
+    # the part count limit wins over everything else
+    return max(part_size, math.ceil(file_size / MAX_PART_COUNT))
 
 
 class JobInformation(TypedDict):
@@ -48,6 +90,7 @@ class Upload(Transfer):
         local_file_path: str,
         job_info: JobInformation,
         metadata: dict,
+        dedup: bool = False,
     ):
         super().__init__(get_next_id(), "upload", metadata)
         self.user_data = user_data
@@ -57,22 +100,31 @@ class Upload(Transfer):
         self.job_id = get_next_id()
         self.retries = 3
         self.run_task = None
-        self._file: BinaryIO = None
+        self._file = PositionalFile(self.local_file_path)
         self.file_hash: str = None
+        self._file_hash_task: asyncio.Task = None
         self.file_size = 0
+        self.file_mtime: int = None  # with the size, tells a restored upload whether the package was rebuilt
+        self.part_size = 0
         self._upload_id = None
         self._upload_id_lock = asyncio.Lock()
+        self._prepare_task: asyncio.Task = None
         self.url = ""
         self.etags = []
+        # only the chunks of the zip that are not stored yet are uploaded, the job gets a manifest to rebuild the zip
+        self.dedup = dedup
+        self.chunks: List[Chunk] = None
+        self._chunking_task: asyncio.Task = None
 
-        self.transfer_ended_called = False
+        self.phase = UPLOAD_PHASE_TRANSFERRING
 
     async def initialize(self):
-        self.file_hash = await asyncio.to_thread(get_file_md5, self.local_file_path)
+        # hash in the background while the parts are uploaded, only creating the job has to wait for it
+        self._file_hash_task = asyncio.create_task(asyncio.to_thread(get_file_md5, self.local_file_path))
 
-        with open(self.local_file_path, "rb") as f:
-            f.seek(0, os.SEEK_END)
-            self.file_size = f.tell()
+        stat = os.stat(self.local_file_path)
+        self.file_size = stat.st_size
+        self.file_mtime = stat.st_mtime_ns
 
         self.progress.set_total(self.file_size)
 
@@ -81,12 +133,18 @@ class Upload(Transfer):
         if self.file_size < UPLOAD_PART_SIZE:
             # r2 does not support multipart uploads for files < 5MB, lets not use multipart for files under the part size
             await self.init_single()
+        elif self.dedup:
+            # hashing every chunk reads the whole zip, the upload is created right away and gets its parts after
+            self._start_chunking()
         else:
             await self.init_multi()
 
-    def get_file(self):
-        if self._file is None:
-            self._file = open(self.local_file_path, "rb")
+    async def get_file_hash(self) -> str:
+        if self.file_hash is None:
+            self.file_hash = await self._file_hash_task
+        return self.file_hash
+
+    def get_file(self) -> PositionalFile:
         return self._file
 
     async def get_upload_id(self):
@@ -96,26 +154,115 @@ class Upload(Transfer):
                     self.user_data, self.url
                 )
                 self._upload_id = data["uploadId"]
+                self.save_state()
         return self._upload_id
 
     async def init_single(self):
-        self.work_orders.append(UploadWorkOrder(0, self.file_size, 1, self, True))
+        self.part_size = self.file_size
+        self.add_work_order(UploadWorkOrder(0, self.file_size, 1, self, True))
 
     async def init_multi(self):
-        part_count = math.ceil(self.file_size / UPLOAD_PART_SIZE)
+        from ..transfer_manager import get_transfer_manager
+
+        worker_speed = get_transfer_manager().upload_queue.get_worker_speed()
+        self.part_size = get_part_size(self.file_size, worker_speed)
         logger.info(
-            f"part count: {part_count}, file_size: {self.file_size}, part_size: {UPLOAD_PART_SIZE}"
+            f"file_size: {self.file_size}, part_size: {self.part_size}, worker_speed: {worker_speed}"
+        )
+        self._add_parts()
+        # create the multipart upload and open connections while the file is hashed, so the first parts start right away
+        self._prepare_task = asyncio.create_task(self._prepare_multi())
+
+    async def init_dedup(self) -> bool:
+        # returns False if the upload has to fall back to a multipart upload
+        from ..transfer_manager import get_transfer_manager
+
+        worker_speed = get_transfer_manager().upload_queue.get_worker_speed()
+        self.part_size = get_part_size(self.file_size, worker_speed)
+        try:
+            ranges = await asyncio.to_thread(get_zip_ranges, self.local_file_path)
+            chunks = await asyncio.to_thread(hash_chunks, self.local_file_path, ranges)
+        except Exception as ex:
+            logger.warning(f"could not split {self.local_file_path} into chunks, uploading all of it: {ex}")
+            return False
+        try:
+            missing = await AsyncR2Worker.get_missing_blobs(
+                self.user_data, DEDUP_BLOB_PREFIX, list({c.hash for c in chunks})
+            )
+        except HttpStatusException as ex:
+            if ex.status_code >= 500:
+                raise
+            # the storage worker does not know about blobs
+            logger.warning(f"deduplicated uploads are not supported, uploading all of it: {ex}")
+            return False
+        if len(missing) == 0:
+            # the upload needs at least one work order to finish, the last chunk holds the zip directory and is small
+            missing = [chunks[-1].hash]
+        self.chunks = chunks
+        self._add_chunks(set(missing))
+        logger.info(
+            f"file_size: {self.file_size}, chunks: {len(chunks)}, chunks to upload: {len(self.work_orders)}"
+        )
+        return True
+
+    def _start_chunking(self):
+        self.phase = UPLOAD_PHASE_PREPARING
+        self.status_text = "Preparing"
+        self._chunking_task = asyncio.create_task(self._prepare_chunks())
+
+    async def _prepare_chunks(self):
+        try:
+            deduplicated = await self.init_dedup()
+        except Exception as ex:
+            logger.warning(f"could not check which chunks of {self.local_file_path} are stored, uploading all of it: {ex}")
+            deduplicated = False
+        if not deduplicated:
+            self.dedup = False
+            await self.init_multi()
+        self._advance_phase(UPLOAD_PHASE_TRANSFERRING)
+        self.status_text = ""
+        if self.status == TRANSFER_STATUS_RUNNING:
+            self.get_queue().add_transfer(self)
+        self.save_state()
+
+    def _add_chunks(self, missing: set):
+        # chunks that are stored already, or that appear twice in the file, count as done right away
+        for i, chunk in enumerate(self.chunks):
+            if chunk.hash in missing:
+                missing.discard(chunk.hash)
+                self.add_work_order(
+                    UploadWorkOrder(chunk.offset, chunk.size, i + 1, self, True, get_blob_path(chunk.hash))
+                )
+            else:
+                self.progress.increase_done(chunk.size)
+
+    async def _prepare_multi(self):
+        from ..transfer_manager import get_transfer_manager
+
+        connections = min(len(self.work_orders), max(len(get_transfer_manager().upload_queue.workers), 1))
+        results = await asyncio.gather(
+            self.get_upload_id(),
+            HttpPool.warm_up(R2_WORKER_ENDPOINT, connections),
+            return_exceptions=True,
         )
+        for result in results:
+            if isinstance(result, Exception):
+                # workers create the multipart upload themselves if this failed
+                logger.warning(f"could not prepare upload {self.id}: {result}")
+
+    def _add_parts(self):
+        part_count = math.ceil(self.file_size / self.part_size)
+        logger.info(f"part count: {part_count}")
 
         for i in range(part_count - 1):
-            self.work_orders.append(
+            self.add_work_order(
                 UploadWorkOrder(
-                    i * UPLOAD_PART_SIZE, UPLOAD_PART_SIZE, i + 1, self, False
+                    i * self.part_size, self.part_size, i + 1, self, False
                 )
             )
         # add last part seperately
-        last_part_offset = (part_count - 1) * UPLOAD_PART_SIZE
-        self.work_orders.append(
+        last_part_offset = (part_count - 1) * self.part_size
+        self.add_work_order(
             UploadWorkOrder(
                 last_part_offset,
                 self.file_size - last_part_offset,
@@ -125,11 +272,130 @@ class Upload(Transfer):
             )
         )
 
+    def get_work_order_cost(self, work_order: UploadWorkOrder) -> float:
+        # part sizes differ between uploads, so uploads are charged by bytes
+        return work_order.size
+
+    def to_journal(self):
+        # the work orders of a deduplicated upload are the chunks that were missing from storage
+        missing = {wo.offset for wo in self.work_orders} if self.chunks is not None else set()
+        file_hash = self.file_hash
+        if file_hash is None and self._file_hash_task.done() and self._file_hash_task.exception() is None:
+            file_hash = self._file_hash_task.result()
+        return {
+            "id": self.id,
+            "created": self.created,
+            "status": self.status,
+            "priority": self.priority,
+            "metadata": self.metadata,
+            "user_data": self.user_data.to_journal(),
+            "local_file_path": self.local_file_path,
+            "job_info": self.job_info,
+            "job_id": self.job_id,
+            "file_size": self.file_size,
+            "file_mtime": self.file_mtime,
+            "file_hash": file_hash,
+            "part_size": self.part_size,
+            "upload_id": self._upload_id,
+            "preparing": self.phase == UPLOAD_PHASE_PREPARING,
+            "dedup_chunks": None if self.chunks is None else [
+                [c.offset, c.size, c.hash, c.offset in missing] for c in self.chunks
+            ],
+        }
+
+    @classmethod
+    async def from_journal(cls, state: dict, work_order_states: Dict[int, dict]) -> "Upload":
+        from ..transfer_manager import get_transfer_manager
+
+        upload = cls(UserData(**state["user_data"]), state["local_file_path"], state["job_info"], state["metadata"])
+        upload.id = state["id"]
+        upload.created = state["created"]
+        upload.priority = state.get("priority", DEFAULT_PRIORITY)
+        upload.job_id = state["job_id"]
+        upload.url = f"{upload.job_id}/input/package.zip"
+
+        if await cls._file_changed(state):
+            # the parts and chunks that were uploaded hold the old bytes, none of them can be used
+            logger.warning(f"{upload.local_file_path} changed since the upload was started, starting it over")
+            if state["upload_id"] is not None:
+                try:
+                    await AsyncR2Worker.abort_multipart_upload(upload.user_data, upload.url, state["upload_id"])
+                except Exception as ex:
+                    logger.warning(f"could not abort the old multipart upload of {upload.url}: {ex}")
+            get_transfer_manager().journal.reset(upload.id)
+            upload.dedup = state.get("dedup_chunks") is not None or state.get("preparing", False)
+            await upload.initialize()
+            upload.save_state()
+            return upload
+
+        upload.file_size = state["file_size"]
+        upload.file_mtime = state.get("file_mtime")
+        upload.part_size = state["part_size"]
+        upload._upload_id = state["upload_id"]
+        upload.progress.set_total(upload.file_size)
+        upload.file_hash = state["file_hash"]
+        if upload.file_hash is None:
+            upload._file_hash_task = asyncio.create_task(asyncio.to_thread(get_file_md5, upload.local_file_path))
+
+        dedup_chunks = state.get("dedup_chunks")
+        if dedup_chunks is not None:
+            upload.dedup = True
+            upload.chunks = [Chunk(offset, size, chunk_hash) for offset, size, chunk_hash, _ in dedup_chunks]
+            upload._add_chunks({chunk_hash for _, _, chunk_hash, missing in dedup_chunks if missing})
+        elif state.get("preparing", False):
+            # stopped before the chunks were known, they are hashed again
+            upload.dedup = True
+            upload._start_chunking()
+        elif upload.file_size < UPLOAD_PART_SIZE:
+            await upload.init_single()
+        else:
+            upload._add_parts()
+
+        # parts that made it to r2 before the restart are not uploaded again
+        for wo in upload.work_orders:
+            wo_state = work_order_states.get(wo.journal_key)
+            if wo_state is not None and wo_state["status"] == TRANSFER_STATUS_SUCCESS:
+                wo.restore(wo_state)
+                upload.progress.increase_done(wo.size)
+                if wo.etag is not None:
+                    upload.etags.append(wo.etag)
+        return upload
+
+    @staticmethod
+    async def _file_changed(state: dict) -> bool:
+        stat = os.stat(state["local_file_path"])
+        if stat.st_size != state["file_size"]:
+            return True
+        if state.get("file_mtime") is not None:
+            return stat.st_mtime_ns != state["file_mtime"]
+        # journals from before the modification time was kept, only the hash tells a rebuilt package apart
+        if state["file_hash"] is not None:
+            return await asyncio.to_thread(get_file_md5, state["local_file_path"]) != state["file_hash"]
+        return True
+
+    async def _wait_for_preparation(self):
+        # the multipart upload is completed or aborted below, the preparation must not create it after that
+        if self._prepare_task is not None and not self._prepare_task.done():
+            await asyncio.gather(self._prepare_task, return_exceptions=True)
+
+    def _cancel_preparation(self):
+        for task in (self._prepare_task, self._chunking_task):
+            if task is not None and not task.done():
+                task.cancel()
+
     async def _on_transfer_ended(self, transfer_success):
-        self.get_file().close()
-        self._file = None
+        self._file.close()
+        await self._wait_for_preparation()
         if transfer_success:
-            if len(self.work_orders) > 1:
+            if self.chunks is not None:
+                try:
+                    await async_with_retries(self._upload_manifest, retries=20)
+                except Exception as ex:
+                    self.status = TRANSFER_STATUS_FAILURE
+                    self.status_text = "Could not upload the manifest due to cloudflare error"
+                    logger.error(f"could not upload the manifest of {self.url}: {ex}")
+                    return
+            elif self._is_multipart():
                 upload_id = await self.get_upload_id()
                 try:
                     await async_with_retries(
@@ -161,7 +427,7 @@ class Upload(Transfer):
                 await self.run_cleanup()
                 self.status = TRANSFER_STATUS_SUCCESS
         else:
-            if len(self.work_orders) > 1:
+            if self._is_multipart():
                 upload_id = await self.get_upload_id()
                 await AsyncR2Worker.abort_multipart_upload(
                     self.user_data, self.url, upload_id
@@ -170,28 +436,44 @@ class Upload(Transfer):
             self.status = TRANSFER_STATUS_FAILURE
             self.status_text = "Some parts could not be uploaded"
 
+    def _is_multipart(self) -> bool:
+        return self.chunks is None and len(self.work_orders) > 1
+
+    def _get_manifest_path(self) -> str:
+        return f"{self.job_id}/input/package.manifest.json"
+
+    async def _upload_manifest(self):
+        manifest = build_manifest(self.chunks, self.file_size, await self.get_file_hash())
+        await AsyncR2Worker.upload_single_part(
+            self.user_data, self._get_manifest_path(), json.dumps(manifest).encode()
+        )
+
+    def _advance_phase(self, phase: str) -> bool:
+        # returns False if the upload is not in a phase that can move to the given one
+        if phase not in UPLOAD_PHASE_TRANSITIONS[self.phase]:
+            return False
+        logger.debug(f"upload {self.id} moves from phase {self.phase} to {phase}")
+        self.phase = phase
+        return True
+
     async def update(self):
-        successful_parts = 0
-        running_or_created_parts = 0
-        for wo in self.work_orders:
-            if wo.status == TRANSFER_STATUS_SUCCESS:
-                successful_parts += 1
-            elif wo.status in [TRANSFER_STATUS_RUNNING, TRANSFER_STATUS_CREATED]:
-                running_or_created_parts += 1
-
-        transfer_success = successful_parts >= len(self.work_orders)
-        transfer_ended = running_or_created_parts == 0
-
-        logger.debug(f"transfer success {transfer_success}")
-        logger.debug(f"transfer ended {transfer_ended}")
-
-        # this is done this way to prevent a race condition when 2 workers call update at the same time
-        if transfer_ended and not self.transfer_ended_called:
-            self.transfer_ended_called = True
-            logger.debug("calling transfer ended handler")
-            await self._on_transfer_ended(transfer_success)
-            logger.debug("called transfer ended handler")
-            self.finished_at = time.time()
+        if self.phase == UPLOAD_PHASE_PREPARING:
+            # the parts are not there yet
+            return
+        counts = self.work_order_counts
+        running_or_created_parts = counts[TRANSFER_STATUS_RUNNING] + counts[TRANSFER_STATUS_CREATED]
+        if running_or_created_parts > 0:
+            return
+
+        transfer_success = counts[TRANSFER_STATUS_SUCCESS] >= len(self.work_orders)
+        # the phase changes before the first await, so when two workers finish the last parts at the same time
+        # only one of them runs the end handler
+        if not self._advance_phase(UPLOAD_PHASE_COMPLETING if transfer_success else UPLOAD_PHASE_ABORTING):
+            return
+        await self._on_transfer_ended(transfer_success)
+        self._advance_phase(UPLOAD_PHASE_DONE)
+        self.finished_at = time.time()
+        self.save_state()
 
     async def run_job_create(self):
         frame_end = self.job_info["frame_end"]
@@ -210,6 +492,7 @@ class Upload(Transfer):
             end = frame_end
 
         render_format = self.job_info["render_format"]
+        file_hash = await self.get_file_hash()
         job_data = {
             "id": self.job_id,
             "name": self.job_info["name"],
@@ -237,9 +520,10 @@ class Upload(Transfer):
                     render_format,
                     self.job_info["match_scene_format"],
                     self.job_info["max_thumbnail_size"],
-                    self.file_hash,
+                    file_hash,
                     frame_step,
                     self.user_data.api_token,
+                    from_manifest=self.chunks is not None,
                 ),
             },
         )
@@ -255,19 +539,33 @@ class Upload(Transfer):
     def start(self):
         if self.status in [TRANSFER_STATUS_CREATED, TRANSFER_STATUS_PAUSED]:
             self.status = TRANSFER_STATUS_RUNNING
+            self.get_queue().add_transfer(self)
+            self.save_state()
 
     def stop(self):
+        # a stopped upload does not need its multipart upload or chunks anymore
+        self._cancel_preparation()
         if self.status != TRANSFER_STATUS_CREATED:
             self.status = TRANSFER_STATUS_FAILURE
+        self.get_queue().remove_transfer(self)
+        self.save_state()
 
     def pause(self):
         if self.status == TRANSFER_STATUS_RUNNING:
             self.status = TRANSFER_STATUS_PAUSED
+            self.get_queue().remove_transfer(self)
+            self.save_state()
 
-    def to_dict(self):
+    def to_dict(self, work_orders: bool = True):
         d = super().to_dict()
         d["local_file_path"] = self.local_file_path
         d["job_id"] = self.job_id
         d["job_info"] = self.job_info
-        d["parts"] = [i.small_dict() for i in self.work_orders]
+        d["part_size"] = self.part_size
+        d["phase"] = self.phase
+        d["dedup"] = self.chunks is not None
+        if self.chunks is not None:
+            d["chunks_total"] = len(self.chunks)
+        if work_orders:
+            d["parts"] = [i.small_dict() for i in self.work_orders]
         return d
@@ -1,8 +1,11 @@
 from ..transfer_queue_worker import TransferQueueWorker
-from ..transfer import TRANSFER_STATUS_SUCCESS, TRANSFER_STATUS_FAILURE, TRANSFER_STATUS_RUNNING, TRANSFER_STATUS_CREATED
+from ..transfer import TRANSFER_STATUS_SUCCESS, TRANSFER_STATUS_FAILURE, TRANSFER_STATUS_RUNNING
 from ..progress import Progress
 from .upload_work_order import UploadWorkOrder
+from .part_reader import PartReader
+from .upload import Upload
 from ...apis.r2_worker import AsyncR2Worker
+from ...apis.r2_worker_shared import get_url
 from sanic.log import logger
 from traceback import format_exc
 import asyncio
@@ -11,18 +14,30 @@ UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
 
 
 class UploadQueueWorker(TransferQueueWorker):
-    async def data_generator(self, _data: bytes, current_bytes: list, work_order_progress: Progress, upload_progress: Progress):
-        for i in range(0, len(_data), UPLOAD_CHUNK_SIZE):
+    async def data_generator(self, reader: PartReader, current_bytes: list, work_order_progress: Progress, upload: Upload):
+        for chunk in reader:
             # TODO: no idea what will happen if we stall here indefinitely, could break, maybe resort to 1B/sec upload rate?
             await self._check_pause()
 
-            chunk = _data[i:i + UPLOAD_CHUNK_SIZE]
+            await self.queue.bandwidth_limiter.consume(upload, len(chunk))
+            upload.mark_first_byte()
             yield chunk
             chunk_len = len(chunk)
             current_bytes[0] += chunk_len
             work_order_progress.increase_done(chunk_len)
-            upload_progress.increase_done(chunk_len)
-            self.transfer_speed.update(chunk_len)
+            upload.progress.increase_done(chunk_len)
+            self._on_bytes(upload, chunk_len)
+
+    async def _on_failure(self, work_order: UploadWorkOrder, endpoint: str, ex: Exception, attempt: int):
+        # waits before the next attempt, raises if the part should not be retried
+        exc = format_exc()
+        logger.debug(exc)
+        work_order.history.append(exc)
+        delay = self.queue.retry_policy.on_failure(endpoint, ex, attempt, work_order.upload)
+        if delay is None:
+            raise ex
+        self.queue.notify_workorder_retry(self)
+        await asyncio.sleep(delay)
 
     async def _single(self, work_order: UploadWorkOrder):
         work_order.progress.set_total(work_order.size)
@@ -30,41 +45,47 @@ class UploadQueueWorker(TransferQueueWorker):
         upload_progress = upload.progress
         work_order_progress = work_order.progress
 
-        file = upload.get_file()
-        file.seek(0)
-        data = file.read()
+        reader = PartReader(upload.get_file(), work_order.offset, work_order.size, UPLOAD_CHUNK_SIZE)
 
+        path = work_order.path or upload.url
+        endpoint = get_url(path)
+        attempt = 0
         while not self.ct.is_canceled():
+            await self.queue.retry_policy.wait_for_endpoint(endpoint, self.ct)
+            if self.ct.is_canceled():
+                break
             current_bytes = [0]  # cant pass an int by reference, so list of a single int it is
             try:
                 await AsyncR2Worker.upload_single_part(
                     upload.user_data,
-                    upload.url,
-                    self.data_generator(data, current_bytes, work_order_progress, upload_progress)
+                    path,
+                    self.data_generator(reader, current_bytes, work_order_progress, upload)
                 )
+                self.queue.retry_policy.on_success(endpoint, upload)
                 work_order.status = TRANSFER_STATUS_SUCCESS
+                upload.save_state(work_order)
                 break
-            except:
-                exc = format_exc()
-                self.queue.notify_workorder_retry(self)
-                logger.debug(exc)
-                work_order.history.append(exc)
+            except Exception as ex:
                 upload_progress.decrease_done(current_bytes[0])
                 work_order_progress.set_done(0)
+                await self._on_failure(work_order, endpoint, ex, attempt)
+                attempt += 1
 
     async def _multi(self, work_order: UploadWorkOrder):
         transfer_name = f"part {work_order.part_number} with offset {work_order.offset} and size {work_order.size}"
         logger.debug(f"starting upload of {transfer_name}")
 
-        file = work_order.upload.get_file()
-        file.seek(work_order.offset)
-        data = file.read(work_order.size)
-
         upload = work_order.upload
+        reader = PartReader(upload.get_file(), work_order.offset, work_order.size, UPLOAD_CHUNK_SIZE)
         upload_id = await upload.get_upload_id()
         upload_progress = upload.progress
 
+        endpoint = get_url(upload.url)
+        attempt = 0
         while not self.ct.is_canceled():
+            await self.queue.retry_policy.wait_for_endpoint(endpoint, self.ct)
+            if self.ct.is_canceled():
+                break
             current_bytes = [0]  # cant pass an int by reference, so list of a single int it is
             try:
                 logger.debug(f"uploading {transfer_name} to {upload.url}")
@@ -73,20 +94,20 @@ class UploadQueueWorker(TransferQueueWorker):
                     upload.url,
                     upload_id,
                     work_order.part_number,
-                    self.data_generator(data, current_bytes, work_order.progress, upload_progress)
+                    self.data_generator(reader, current_bytes, work_order.progress, upload)
                 )
+                self.queue.retry_policy.on_success(endpoint, upload)
                 work_order.status = TRANSFER_STATUS_SUCCESS
                 logger.debug(f"upload of {transfer_name} returned {result}")
+                work_order.etag = result
                 upload.etags.append(result)
+                upload.save_state(work_order)
                 break
-            except:
-                exc = format_exc()
-                self.queue.notify_workorder_retry(self)
-                logger.debug(exc)
-                work_order.history.append(exc)
+            except Exception as ex:
                 upload_progress.decrease_done(current_bytes[0])
                 work_order.progress.set_done(0)
-                await asyncio.sleep(3)
+                await self._on_failure(work_order, endpoint, ex, attempt)
+                attempt += 1
 
     async def _run(self):
         logger.info("upload worker starting")
@@ -97,7 +118,6 @@ class UploadQueueWorker(TransferQueueWorker):
                 work_order = await self.queue.get_next_work_order()
 
                 if work_order is None:
-                    await asyncio.sleep(1)
                     continue
 
                 if work_order.is_single_upload:
@@ -120,6 +140,6 @@ class UploadQueueWorker(TransferQueueWorker):
 
         if work_order is not None:
             if work_order.status == TRANSFER_STATUS_RUNNING:
-                work_order.status = TRANSFER_STATUS_CREATED
+                work_order.upload.requeue_work_order(work_order)
 
         logger.info("upload worker exiting")
@@ -1,23 +1,41 @@
 from ..progress import Progress
-from ..transfer import TRANSFER_STATUS_CREATED
-from typing import TYPE_CHECKING, List
+from ..work_order import WorkOrder
+from ...apis.r2_worker_shared import R2UploadedPart
+from typing import TYPE_CHECKING, List, Optional
 
 if TYPE_CHECKING:
     from .upload import Upload
 
 
-class UploadWorkOrder:
-    def __init__(self, offset: int, size: int, part_number: int, upload: "Upload", is_single_upload: bool):
+class UploadWorkOrder(WorkOrder):
+    def __init__(self, offset: int, size: int, part_number: int, upload: "Upload", is_single_upload: bool,
+                 path: Optional[str] = None):
+        super().__init__(upload)
         self.offset = offset
         self.size = size
         self.part_number = part_number
         self.upload = upload
         self.is_single_upload = is_single_upload
+        self.path = path  # where a single upload goes if not to the url of the upload, like a deduplicated blob
 
         self.progress = Progress()
-        self.status = TRANSFER_STATUS_CREATED
-        self.status_text = ""
         self.history: List[str] = []
+        self.etag: Optional[R2UploadedPart] = None
+
+    @property
+    def journal_key(self):
+        return self.part_number
+
+    def to_journal(self):
+        return {
+            "status": self.status,
+            "etag": self.etag,
+        }
+
+    def restore(self, state: dict):
+        self.status = state["status"]
+        self.etag = state["etag"]
+        self.progress.set_done_total(self.size, self.size)
 
     def small_dict(self):
         return {
@@ -27,5 +45,5 @@ class UploadWorkOrder:
             "done": self.progress.done,
             "total": self.progress.total,
             "status": self.status,
-            "status_history": self.history,
+            "history_count": len(self.history),
         }
@@ -4,6 +4,14 @@ class UserData:
         self.api_token = api_token  # api token to talk to cube and r2 worker TODO: use new storage token
         self.qm_auth_token = qm_auth_token  # auth token used by the sarfis qm
 
+    def to_journal(self):
+        # unlike to_dict this contains the full tokens, it is only written to the local transfer journal
+        return {
+            'farm_host': self.farm_host,
+            'api_token': self.api_token,
+            'qm_auth_token': self.qm_auth_token,
+        }
+
     def to_dict(self):
         return {
             'farm_host': self.farm_host,
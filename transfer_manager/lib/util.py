@@ -1,12 +1,27 @@
 import uuid
 import hashlib
 import asyncio
+import os
+import sys
+
+APP_DATA_DIR_NAME = "octa_transfer_manager"
 
 
 def get_next_id() -> str:
     return str(uuid.uuid4())  # TODO: replace with uuid7 once it is added to python because they are sortable by timestamp
 
 
+def get_data_dir() -> str:
+    # per user directory for state that has to survive a restart
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Application Support")
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(base, APP_DATA_DIR_NAME)
+
+
 def get_file_md5(path: str) -> str:
     hasher = hashlib.md5()
     with open(path, 'rb') as f:
@@ -34,12 +49,16 @@ IMAGE_TYPE_TO_EXTENSION = {
 
 
 async def async_with_retries(callable, *args, retries=3, retry_wait_time=3, **kwargs):
+    # retry_wait_time is the first wait, it doubles with every try and errors that retrying can not fix are raised right away
+    from .retry_policy import classify_error, get_backoff_delay, DEFAULT_RULES
+
     tries = 1
     while True:
         try:
             return await callable(*args, **kwargs)
-        except:
-            if tries >= retries:
+        except Exception as ex:
+            rule = DEFAULT_RULES[classify_error(ex)]
+            if tries >= retries or not rule.retry:
                 raise
-            await asyncio.sleep(retry_wait_time)
+            await asyncio.sleep(get_backoff_delay(tries - 1, retry_wait_time, max(rule.max_delay, retry_wait_time)))
             tries += 1
@@ -0,0 +1,59 @@
+from .transfer import TRANSFER_STATUS_CREATED
+from .change_version import ChangeVersion
+from typing import TYPE_CHECKING
+import time
+
+if TYPE_CHECKING:
+    from .transfer import Transfer
+
+
+class WorkOrder:
+    """
+    base of upload parts and download files
+
+    status changes are reported to the transfer, so it keeps a count of its work orders per status
+    and does not have to look at all of them to know if it is done
+    """
+
+    __slots__ = ("transfer", "_status", "_status_text", "changed_at", "queued_at")
+
+    def __init__(self, transfer: "Transfer"):
+        self.transfer = transfer
+        self._status = TRANSFER_STATUS_CREATED
+        self._status_text = ""
+        self.changed_at = ChangeVersion.next()
+        self.queued_at = time.time()  # when the work order started waiting for a worker
+        transfer.on_work_order_status(self, None, TRANSFER_STATUS_CREATED)
+
+    @property
+    def status(self) -> str:
+        return self._status
+
+    @status.setter
+    def status(self, status: str):
+        if status == self._status:
+            return
+        old_status = self._status
+        self._status = status
+        self.changed_at = ChangeVersion.next()
+        self.transfer.on_work_order_status(self, old_status, status)
+
+    @property
+    def status_text(self) -> str:
+        return self._status_text
+
+    @status_text.setter
+    def status_text(self, status_text: str):
+        self._status_text = status_text
+        self.changed_at = ChangeVersion.next()
+
+    def get_version(self) -> int:
+        return max(self.changed_at, self.progress.version)
+
+    def get_history(self, offset: int, limit: int):
+        history = self.history
+        return {
+            "total": len(history),
+            "offset": offset,
+            "entries": history[offset:offset + limit],
+        }
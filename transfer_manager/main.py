@@ -6,16 +6,24 @@ def main():
     from .middleware.ensure_version import ensure_version
     from .lib.exception import handle_exceptions
     from .lib.index import index
+    from .lib.transfer_manager import restore_transfers, close_transfer_manager
     from .api.transfers import (
         create_download,
         create_upload,
         get_all_transfers,
+        get_transfers_delta,
+        stream_transfers,
         get_transfer,
+        get_work_order_history,
+        get_transfer_files,
         delete_transfer,
         set_transfer_status,
+        set_transfer_priority,
     )
     from .api.other import logs, transfer_manager_info
-    from .api.queues import queues
+    from .api.queues import queues, set_queue_scheduler
+    from .api.limits import get_limits, set_limits
+    from .api.metrics import metrics
 
     try:
         # change title of console window in windows
@@ -30,6 +38,8 @@ def main():
     app.middleware(cors_before, "request")
     app.middleware(ensure_version, "request")
     app.error_handler.add(Exception, handle_exceptions)
+    app.register_listener(restore_transfers, "after_server_start")
+    app.register_listener(close_transfer_manager, "before_server_stop")
 
     bp_api = sanic.Blueprint("api", "api")
     bp_api.middleware(user_data, "request")
@@ -37,15 +47,24 @@ def main():
     bp_api.add_route(create_download, "/download", methods=("POST", "OPTIONS"))
     bp_api.add_route(create_upload, "/upload", methods=("POST", "OPTIONS"))
     bp_api.add_route(get_all_transfers, "/transfers", methods=("GET", "OPTIONS"))
+    bp_api.add_route(get_transfers_delta, "/transfers/delta", methods=("GET",))
+    bp_api.add_route(stream_transfers, "/transfers/stream", methods=("GET",))
     bp_api.add_route(get_transfer, "/transfers/<id:str>", methods=("GET",))
+    bp_api.add_route(get_work_order_history, "/transfers/<id:str>/history/<key:int>", methods=("GET",))
+    bp_api.add_route(get_transfer_files, "/transfers/<id:str>/files", methods=("GET",))
     bp_api.add_route(delete_transfer, "/transfers/<id:str>", methods=("DELETE",))
     bp_api.add_route(set_transfer_status, "/transfers/<id:str>/status", methods=("PUT",))
+    bp_api.add_route(set_transfer_priority, "/transfers/<id:str>/priority", methods=("PUT",))
     bp_api.add_route(transfer_manager_info, "/transfer_manager_info", methods=("GET",))
     bp_api.add_route(logs, "/logs", methods=("GET",))
     bp_api.add_route(queues, "/queues", methods=("GET",))
+    bp_api.add_route(set_queue_scheduler, "/queues/<transfer_type:str>/scheduler", methods=("PUT",))
+    bp_api.add_route(get_limits, "/limits", methods=("GET",))
+    bp_api.add_route(set_limits, "/limits", methods=("PUT", "OPTIONS"))
 
     app.blueprint(bp_api)
     app.add_route(index, "/", methods=("GET",))
+    app.add_route(metrics, "/metrics", methods=("GET",))  # outside of the api prefix, where prometheus looks for it
     return app
 
 